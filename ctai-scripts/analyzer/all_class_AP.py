@@ -1,4 +1,6 @@
 # https://github.com/Cartucho/mAP/tree/master
+# The matching itself lives in ap_engine.py; this script keeps the original CLI,
+# console/plot output and the all_class_AP.json document.
 import glob
 import json
 import os
@@ -6,30 +8,34 @@ import shutil
 import operator
 import sys
 import argparse
-import math
-import json
+
 import numpy as np
 
-MINOVERLAP = 0.5  # yolo default validation.run value (AP50)
-
-parser = argparse.ArgumentParser()
-parser.add_argument('-na', '--no-animation',
-                    help="no animation is shown.", action="store_true")
-parser.add_argument('-np', '--no-plot',
-                    help="no plot is shown.", action="store_true")
-parser.add_argument(
-    '-q', '--quiet', help="minimalistic console output.", action="store_true")
-# argparse receiving list of classes to be ignored (e.g., python main.py --ignore person book)
-parser.add_argument('-i', '--ignore', nargs='+', type=str,
-                    help="ignore a list of classes.")
-# argparse receiving list of classes with specific IoU (e.g., python main.py --set-class-iou person 0.7)
-parser.add_argument('--set-class-iou', nargs='+', type=str,
-                    help="set IoU for a specific class.")
-parser.add_argument('--input-dir', '-d', help="input directory",
-                    type=str, default="/workspace/results/voc_format_labels")
-parser.add_argument('--output-dir', '-o', help="output directory",
-                    type=str, default="/workspace/results/analysis_results/all_class_AP")
-args = parser.parse_args()
+import ap_engine
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-na', '--no-animation',
+                        help="no animation is shown.", action="store_true")
+    parser.add_argument('-np', '--no-plot',
+                        help="no plot is shown.", action="store_true")
+    parser.add_argument(
+        '-q', '--quiet', help="minimalistic console output.", action="store_true")
+    # argparse receiving list of classes to be ignored (e.g., python main.py --ignore person book)
+    parser.add_argument('-i', '--ignore', nargs='+', type=str,
+                        help="ignore a list of classes.")
+    # argparse receiving list of classes with specific IoU (e.g., python main.py --set-class-iou person 0.7)
+    parser.add_argument('--set-class-iou', nargs='+', type=str,
+                        help="set IoU for a specific class.")
+    parser.add_argument('--packed', action='store_true',
+                        help="read the input directory's voc_labels.npz (yolo_to_voc.py --packed) instead of truth/ and pred/")
+    parser.add_argument('--input-dir', '-d', help="input directory",
+                        type=str, default="/workspace/results/voc_format_labels")
+    parser.add_argument('--output-dir', '-o', help="output directory",
+                        type=str, default="/workspace/results/analysis_results/all_class_AP")
+    return parser.parse_args(argv)
+
 
 '''
     0,0 ------> x (width)
@@ -43,101 +49,17 @@ args = parser.parse_args()
                 (Right,Bottom)
 '''
 
-# if there are no classes to ignore then replace None by empty list
-if args.ignore is None:
-    args.ignore = []
-
-specific_iou_flagged = False
-if args.set_class_iou is not None:
-    specific_iou_flagged = True
-
-# make sure that the cwd() is the location of the python script (so that every path makes sense)
-os.chdir(os.path.abspath(args.input_dir))
-print(os.getcwd())
-GT_PATH = os.path.join(os.getcwd(), 'truth')
-DR_PATH = os.path.join(os.getcwd(), 'pred')
-# if there are no images then no animation can be shown
-IMG_PATH = os.path.join(os.getcwd(), 'images-optional')
-if os.path.exists(IMG_PATH):
-    for dirpath, dirnames, files in os.walk(IMG_PATH):
-        if not files:
-            # no image files found
-            args.no_animation = True
-else:
-    args.no_animation = True
-
-# try to import OpenCV if the user didn't choose the option --no-animation
-show_animation = False
-if not args.no_animation:
-    try:
-        import cv2
-        show_animation = True
-    except ImportError:
-        print("\"opencv-python\" not found, please install to visualize the results.")
-        args.no_animation = True
-
-# try to import Matplotlib if the user didn't choose the option --no-plot
-draw_plot = False
-if not args.no_plot:
-    try:
-        import matplotlib.pyplot as plt
-        draw_plot = True
-    except ImportError:
-        print("\"matplotlib\" not found, please install it to get the resulting plots.")
-        args.no_plot = True
-
-
-def log_average_miss_rate(prec, rec, num_images):
-    """
-        log-average miss rate:
-            Calculated by averaging miss rates at 9 evenly spaced FPPI points
-            between 10e-2 and 10e0, in log-space.
-
-        output:
-                lamr | log-average miss rate
-                mr | miss rate
-                fppi | false positives per image
-
-        references:
-            [1] Dollar, Piotr, et al. "Pedestrian Detection: An Evaluation of the
-               State of the Art." Pattern Analysis and Machine Intelligence, IEEE
-               Transactions on 34.4 (2012): 743 - 761.
-    """
-
-    # if there were no detections of that class
-    if prec.size == 0:
-        lamr = 0
-        mr = 1
-        fppi = 0
-        return lamr, mr, fppi
-
-    fppi = (1 - prec)
-    mr = (1 - rec)
-
-    fppi_tmp = np.insert(fppi, 0, -1.0)
-    mr_tmp = np.insert(mr, 0, 1.0)
-
-    # Use 9 evenly spaced reference points in log-space
-    ref = np.logspace(-2.0, 0.0, num=9)
-    for i, ref_i in enumerate(ref):
-        # np.where() will always find at least 1 index, since min(ref) = 0.01 and min(fppi_tmp) = -1.0
-        j = np.where(fppi_tmp <= ref_i)[-1][-1]
-        ref[i] = mr_tmp[j]
-
-    # log(0) is undefined, so we use the np.maximum(1e-10, ref)
-    lamr = math.exp(np.mean(np.log(np.maximum(1e-10, ref))))
-
-    return lamr, mr, fppi
-
-
 """
- throw error and exit
+ throw error, the caller decides whether to exit
 """
 
 
+class AnalysisError(Exception):
+    pass
+
+
 def error(msg):
-    print(msg)
-    sys.exit(0)
+    raise AnalysisError(msg)
 
 
 """
@@ -156,76 +78,6 @@ def is_float_between_0_and_1(value):
         return False
 
 
-"""
- Calculate the AP given the recall and precision array
-    1st) We compute a version of the measured precision/recall curve with
-         precision monotonically decreasing
-    2nd) We compute the AP as the area under this curve by numerical integration.
-"""
-
-
-def voc_ap(rec, prec):
-    """
-    --- Official matlab code VOC2012---
-    mrec=[0 ; rec ; 1];
-    mpre=[0 ; prec ; 0];
-    for i=numel(mpre)-1:-1:1
-            mpre(i)=max(mpre(i),mpre(i+1));
-    end
-    i=find(mrec(2:end)~=mrec(1:end-1))+1;
-    ap=sum((mrec(i)-mrec(i-1)).*mpre(i));
-    """
-    rec.insert(0, 0.0)  # insert 0.0 at begining of list
-    rec.append(1.0)  # insert 1.0 at end of list
-    mrec = rec[:]
-    prec.insert(0, 0.0)  # insert 0.0 at begining of list
-    prec.append(0.0)  # insert 0.0 at end of list
-    mpre = prec[:]
-    """
-     This part makes the precision monotonically decreasing
-        (goes from the end to the beginning)
-        matlab: for i=numel(mpre)-1:-1:1
-                    mpre(i)=max(mpre(i),mpre(i+1));
-    """
-    # matlab indexes start in 1 but python in 0, so I have to do:
-    #     range(start=(len(mpre) - 2), end=0, step=-1)
-    # also the python function range excludes the end, resulting in:
-    #     range(start=(len(mpre) - 2), end=-1, step=-1)
-    for i in range(len(mpre)-2, -1, -1):
-        mpre[i] = max(mpre[i], mpre[i+1])
-    """
-     This part creates a list of indexes where the recall changes
-        matlab: i=find(mrec(2:end)~=mrec(1:end-1))+1;
-    """
-    i_list = []
-    for i in range(1, len(mrec)):
-        if mrec[i] != mrec[i-1]:
-            i_list.append(i)  # if it was matlab would be i + 1
-    """
-     The Average Precision (AP) is the area under the curve
-        (numerical integration)
-        matlab: ap=sum((mrec(i)-mrec(i-1)).*mpre(i));
-    """
-    ap = 0.0
-    for i in i_list:
-        ap += ((mrec[i]-mrec[i-1])*mpre[i])
-    return ap, mrec, mpre
-
-
-"""
- Convert the lines of a file to a list
-"""
-
-
-def file_lines_to_list(path):
-    # open txt file lines to a list
-    with open(path) as f:
-        content = f.readlines()
-    # remove whitespace characters like `\n` at the end of each line
-    content = [x.strip() for x in content]
-    return content
-
-
 """
  Draws text in image
 """
@@ -368,121 +220,24 @@ def draw_plot_func(dictionary, n_classes, window_title, plot_title, x_label, out
 
 
 """
- Create a ".temp_files/" and "output/" directory
+ Parse the flag --set-class-iou (if used)
+    e.g. check if class exists
 """
-TEMP_FILES_PATH = ".temp_files"
-if not os.path.exists(TEMP_FILES_PATH):  # if it doesn't exist already
-    os.makedirs(TEMP_FILES_PATH)
-output_files_path = args.output_dir
-if os.path.exists(output_files_path):  # if it exist already
-    # reset the output directory
-    shutil.rmtree(output_files_path)
-
-os.makedirs(output_files_path)
-if draw_plot:
-    os.makedirs(os.path.join(output_files_path, "classes"))
-if show_animation:
-    os.makedirs(os.path.join(output_files_path,
-                "images", "detections_one_by_one"))
 
-"""
- ground-truth
-     Load each of the ground-truth files into a temporary ".json" file.
-     Create a list of all the class names present in the ground-truth (gt_classes).
-"""
-# get a list with the ground-truth files
-ground_truth_files_list = glob.glob(GT_PATH + '/*.txt')
-if len(ground_truth_files_list) == 0:
-    error("Error: No ground-truth files found!")
-ground_truth_files_list.sort()
-# dictionary with counter per class
-gt_counter_per_class = {}
-counter_images_per_class = {}
-
-gt_files = []
-for txt_file in ground_truth_files_list:
-    # print(txt_file)
-    file_id = txt_file.split(".txt", 1)[0]
-    file_id = os.path.basename(os.path.normpath(file_id))
-    # check if there is a correspondent detection-results file
-    temp_path = os.path.join(DR_PATH, (file_id + ".txt"))
-    if not os.path.exists(temp_path):
-        error_msg = "Error. File not found: {}\n".format(temp_path)
-        error_msg += "(You can avoid this error message by running extra/intersect-gt-and-dr.py)"
-        error(error_msg)
-    lines_list = file_lines_to_list(txt_file)
-    # create ground-truth dictionary
-    bounding_boxes = []
-    is_difficult = False
-    already_seen_classes = []
-    for line in lines_list:
-        try:
-            if "difficult" in line:
-                class_name, left, top, right, bottom, _difficult = line.split()
-                is_difficult = True
-            else:
-                class_name, left, top, right, bottom = line.split()
-        except ValueError:
-            error_msg = "Error: File " + txt_file + " in the wrong format.\n"
-            error_msg += " Expected: <class_name> <left> <top> <right> <bottom> ['difficult']\n"
-            error_msg += " Received: " + line
-            error_msg += "\n\nIf you have a <class_name> with spaces between words you should remove them\n"
-            error_msg += "by running the script \"remove_space.py\" or \"rename_class.py\" in the \"extra/\" folder."
-            error(error_msg)
-        # check if class is in the ignore list, if yes skip
-        if class_name in args.ignore:
-            continue
-        bbox = left + " " + top + " " + right + " " + bottom
-        if is_difficult:
-            bounding_boxes.append(
-                {"class_name": class_name, "bbox": bbox, "used": False, "difficult": True})
-            is_difficult = False
-        else:
-            bounding_boxes.append(
-                {"class_name": class_name, "bbox": bbox, "used": False})
-            # count that object
-            if class_name in gt_counter_per_class:
-                gt_counter_per_class[class_name] += 1
-            else:
-                # if class didn't exist yet
-                gt_counter_per_class[class_name] = 1
-
-            if class_name not in already_seen_classes:
-                if class_name in counter_images_per_class:
-                    counter_images_per_class[class_name] += 1
-                else:
-                    # if class didn't exist yet
-                    counter_images_per_class[class_name] = 1
-                already_seen_classes.append(class_name)
-
-    # dump bounding_boxes into a ".json" file
-    new_temp_file = TEMP_FILES_PATH + "/" + file_id + "_ground_truth.json"
-    gt_files.append(new_temp_file)
-    with open(new_temp_file, 'w') as outfile:
-        json.dump(bounding_boxes, outfile)
-
-gt_classes = list(gt_counter_per_class.keys())
-# let's sort the classes alphabetically
-gt_classes = sorted(gt_classes)
-n_classes = len(gt_classes)
-# print(gt_classes)
-# print(gt_counter_per_class)
 
-"""
- Check format of the flag --set-class-iou (if used)
-    e.g. check if class exists
-"""
-if specific_iou_flagged:
-    n_args = len(args.set_class_iou)
+def parse_class_iou(set_class_iou, gt_classes):
+    if set_class_iou is None:
+        return {}
+    n_args = len(set_class_iou)
     error_msg = \
         '\n --set-class-iou [class_1] [IoU_1] [class_2] [IoU_2] [...]'
     if n_args % 2 != 0:
         error('Error, missing arguments. Flag usage:' + error_msg)
     # [class_1] [IoU_1] [class_2] [IoU_2]
     # specific_iou_classes = ['class_1', 'class_2']
-    specific_iou_classes = args.set_class_iou[::2]  # even
+    specific_iou_classes = set_class_iou[::2]  # even
     # iou_list = ['IoU_1', 'IoU_2']
-    iou_list = args.set_class_iou[1::2]  # odd
+    iou_list = set_class_iou[1::2]  # odd
     if len(specific_iou_classes) != len(iou_list):
         error('Error, missing arguments. Flag usage:' + error_msg)
     for tmp_class in specific_iou_classes:
@@ -492,519 +247,429 @@ if specific_iou_flagged:
     for num in iou_list:
         if not is_float_between_0_and_1(num):
             error('Error, IoU must be between 0.0 and 1.0. Flag usage:' + error_msg)
-
-"""
- detection-results
-     Load each of the detection-results files into a temporary ".json" file.
-"""
-# get a list with the detection-results files
-dr_files_list = glob.glob(DR_PATH + '/*.txt')
-dr_files_list.sort()
-
-for class_index, class_name in enumerate(gt_classes):
-    bounding_boxes = []
-    for txt_file in dr_files_list:
-        # print(txt_file)
-        # the first time it checks if all the corresponding ground-truth files exist
-        file_id = txt_file.split(".txt", 1)[0]
-        file_id = os.path.basename(os.path.normpath(file_id))
-        temp_path = os.path.join(GT_PATH, (file_id + ".txt"))
-        if class_index == 0:
-            if not os.path.exists(temp_path):
-                error_msg = "Error. File not found: {}\n".format(temp_path)
-                error_msg += "(You can avoid this error message by running extra/intersect-gt-and-dr.py)"
-                error(error_msg)
-        lines = file_lines_to_list(txt_file)
-        for line in lines:
-            try:
-                # !!! our format: class_name left top right bottom confidence
-                tmp_class_name, left, top, right, bottom, confidence = line.split()
-            except ValueError:
-                error_msg = "Error: File " + txt_file + " in the wrong format.\n"
-                error_msg += " Expected: <class_name> <left> <top> <right> <bottom> <confidence> \n"
-                error_msg += " Received: " + line
-                error(error_msg)
-            if tmp_class_name == class_name:
-                # print("match")
-                bbox = left + " " + top + " " + right + " " + bottom
-                bounding_boxes.append(
-                    {"confidence": confidence, "file_id": file_id, "bbox": bbox})
-                # print(bounding_boxes)
-    # sort detection-results by decreasing confidence
-    bounding_boxes.sort(key=lambda x: float(x['confidence']), reverse=True)
-    with open(TEMP_FILES_PATH + "/" + class_name + "_dr.json", 'w') as outfile:
-        json.dump(bounding_boxes, outfile)
-
-"""
- Calculate the AP for each class
-"""
-sum_AP = 0.0
-ap_dictionary = {}
-lamr_dictionary = {}
-# json dictionary to save all information that we need to show in the results
-json_data = {
-    '_statistics': {
-        'TP': 0,
-        'FP': 0,
-        'F1': 0,
-        'mAP': 0,
-    }
-    # each class will have its own dictionary
-}
-# open file to store the output
-with open(output_files_path + "/output.txt", 'w') as output_file:
-    output_file.write("# AP and precision/recall per class\n")
-    count_true_positives = {}
-    for class_index, class_name in enumerate(gt_classes):
-        count_true_positives[class_name] = 0
-        """
-         Load detection-results of that class
-        """
-        dr_file = TEMP_FILES_PATH + "/" + class_name + "_dr.json"
-        dr_data = json.load(open(dr_file))
-
-        """
-         Assign detection-results to ground-truth objects
-        """
-        nd = len(dr_data)
-        tp = [0] * nd  # creates an array of zeros of size nd
-        fp = [0] * nd
-        for idx, detection in enumerate(dr_data):
-            file_id = detection["file_id"]
-            if show_animation:
-                # find ground truth image
-                ground_truth_img = glob.glob1(IMG_PATH, file_id + ".*")
-                # tifCounter = len(glob.glob1(myPath,"*.tif"))
-                if len(ground_truth_img) == 0:
-                    error("Error. Image not found with id: " + file_id)
-                elif len(ground_truth_img) > 1:
-                    error("Error. Multiple image with id: " + file_id)
-                else:  # found image
-                    # print(IMG_PATH + "/" + ground_truth_img[0])
-                    # Load image
-                    img = cv2.imread(IMG_PATH + "/" + ground_truth_img[0])
-                    # load image with draws of multiple detections
-                    img_cumulative_path = output_files_path + \
-                        "/images/" + ground_truth_img[0]
-                    if os.path.isfile(img_cumulative_path):
-                        img_cumulative = cv2.imread(img_cumulative_path)
-                    else:
-                        img_cumulative = img.copy()
-                    # Add bottom border to image
-                    bottom_border = 60
-                    BLACK = [0, 0, 0]
-                    img = cv2.copyMakeBorder(
-                        img, 0, bottom_border, 0, 0, cv2.BORDER_CONSTANT, value=BLACK)
-            # assign detection-results to ground truth object if any
-            # open ground-truth with that file_id
-            gt_file = TEMP_FILES_PATH + "/" + file_id + "_ground_truth.json"
-            ground_truth_data = json.load(open(gt_file))
-            ovmax = -1
-            gt_match = -1
-            # load detected object bounding-box
-            bb = [float(x) for x in detection["bbox"].split()]
-            for obj in ground_truth_data:
-                # look for a class_name match
-                if obj["class_name"] == class_name:
-                    bbgt = [float(x) for x in obj["bbox"].split()]
-                    bi = [max(bb[0], bbgt[0]), max(bb[1], bbgt[1]),
-                          min(bb[2], bbgt[2]), min(bb[3], bbgt[3])]
-                    iw = bi[2] - bi[0] + 1
-                    ih = bi[3] - bi[1] + 1
-                    if iw > 0 and ih > 0:
-                        # compute overlap (IoU) = area of intersection / area of union
-                        ua = (bb[2] - bb[0] + 1) * (bb[3] - bb[1] + 1) + (bbgt[2] - bbgt[0]
-                                                                          + 1) * (bbgt[3] - bbgt[1] + 1) - iw * ih
-                        ov = iw * ih / ua
-                        if ov > ovmax:
-                            ovmax = ov
-                            gt_match = obj
-
-            # assign detection as true positive/don't care/false positive
-            if show_animation:
-                status = "NO MATCH FOUND!"  # status is only used in the animation
-            # set minimum overlap
-            min_overlap = MINOVERLAP
-            if specific_iou_flagged:
-                if class_name in specific_iou_classes:
-                    index = specific_iou_classes.index(class_name)
-                    min_overlap = float(iou_list[index])
-            if ovmax >= min_overlap:
-                if "difficult" not in gt_match:
-                    if not bool(gt_match["used"]):
-                        # true positive
-                        tp[idx] = 1
-                        gt_match["used"] = True
-                        count_true_positives[class_name] += 1
-                        # update the ".json" file
-                        with open(gt_file, 'w') as f:
-                            f.write(json.dumps(ground_truth_data))
-                        if show_animation:
-                            status = "MATCH!"
-                    else:
-                        # false positive (multiple detection)
-                        fp[idx] = 1
-                        if show_animation:
-                            status = "REPEATED MATCH!"
+    return {class_name: float(iou) for class_name, iou in zip(specific_iou_classes, iou_list)}
+
+
+"""
+ Draw the detections of one class one by one (--no-animation disables it)
+"""
+
+
+def draw_animation(labels, result, class_index, n_classes, min_overlap, img_path, output_files_path):
+    bottom_border = 60
+    BLACK = [0, 0, 0]
+    # colors (OpenCV works with BGR)
+    white = (255, 255, 255)
+    light_blue = (255, 200, 100)
+    green = (0, 255, 0)
+    light_red = (30, 30, 255)
+    class_name = result.class_name
+    match = result.match
+    for idx, dr_row in enumerate(match.order):
+        file_id = labels.file_ids[labels.dr_images[dr_row]]
+        # find ground truth image
+        ground_truth_img = glob.glob1(img_path, file_id + ".*")
+        if len(ground_truth_img) == 0:
+            error("Error. Image not found with id: " + file_id)
+        elif len(ground_truth_img) > 1:
+            error("Error. Multiple image with id: " + file_id)
+        # Load image
+        img = cv2.imread(img_path + "/" + ground_truth_img[0])
+        # load image with draws of multiple detections
+        img_cumulative_path = output_files_path + "/images/" + ground_truth_img[0]
+        if os.path.isfile(img_cumulative_path):
+            img_cumulative = cv2.imread(img_cumulative_path)
+        else:
+            img_cumulative = img.copy()
+        # Add bottom border to image
+        img = cv2.copyMakeBorder(
+            img, 0, bottom_border, 0, 0, cv2.BORDER_CONSTANT, value=BLACK)
+
+        ovmax = match.ovmax[idx]
+        if match.tp[idx]:
+            status = "MATCH!"
+        elif ovmax >= min_overlap and match.fp[idx]:
+            status = "REPEATED MATCH!"
+        elif ovmax > 0 and match.fp[idx]:
+            status = "INSUFFICIENT OVERLAP"
+        else:
+            status = "NO MATCH FOUND!"
+
+        height, widht = img.shape[:2]
+        # 1st line
+        margin = 10
+        v_pos = int(height - margin - (bottom_border / 2.0))
+        text = "Image: " + ground_truth_img[0] + " "
+        img, line_width = draw_text_in_image(
+            img, text, (margin, v_pos), white, 0)
+        text = "Class [" + str(class_index) + "/" + \
+            str(n_classes) + "]: " + class_name + " "
+        img, line_width = draw_text_in_image(
+            img, text, (margin + line_width, v_pos), light_blue, line_width)
+        if ovmax != -1:
+            color = light_red
+            if status == "INSUFFICIENT OVERLAP":
+                text = "IoU: {0:.2f}% ".format(
+                    ovmax*100) + "< {0:.2f}% ".format(min_overlap*100)
             else:
-                # false positive
-                fp[idx] = 1
-                if ovmax > 0:
-                    status = "INSUFFICIENT OVERLAP"
-
-            """
-             Draw image to show animation
-            """
-            if show_animation:
-                height, widht = img.shape[:2]
-                # colors (OpenCV works with BGR)
-                white = (255, 255, 255)
-                light_blue = (255, 200, 100)
-                green = (0, 255, 0)
-                light_red = (30, 30, 255)
-                # 1st line
-                margin = 10
-                v_pos = int(height - margin - (bottom_border / 2.0))
-                text = "Image: " + ground_truth_img[0] + " "
-                img, line_width = draw_text_in_image(
-                    img, text, (margin, v_pos), white, 0)
-                text = "Class [" + str(class_index) + "/" + \
-                    str(n_classes) + "]: " + class_name + " "
-                img, line_width = draw_text_in_image(
-                    img, text, (margin + line_width, v_pos), light_blue, line_width)
-                if ovmax != -1:
-                    color = light_red
-                    if status == "INSUFFICIENT OVERLAP":
-                        text = "IoU: {0:.2f}% ".format(
-                            ovmax*100) + "< {0:.2f}% ".format(min_overlap*100)
-                    else:
-                        text = "IoU: {0:.2f}% ".format(
-                            ovmax*100) + ">= {0:.2f}% ".format(min_overlap*100)
-                        color = green
-                    img, _ = draw_text_in_image(
-                        img, text, (margin + line_width, v_pos), color, line_width)
-                # 2nd line
-                v_pos += int(bottom_border / 2.0)
-                rank_pos = str(idx+1)  # rank position (idx starts at 0)
-                text = "Detection #rank: " + rank_pos + \
-                    " confidence: {0:.2f}% ".format(
-                        float(detection["confidence"])*100)
-                img, line_width = draw_text_in_image(
-                    img, text, (margin, v_pos), white, 0)
-                color = light_red
-                if status == "MATCH!":
-                    color = green
-                text = "Result: " + status + " "
-                img, line_width = draw_text_in_image(
-                    img, text, (margin + line_width, v_pos), color, line_width)
-
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                if ovmax > 0:  # if there is intersections between the bounding-boxes
-                    bbgt = [int(round(float(x)))
-                            for x in gt_match["bbox"].split()]
-                    cv2.rectangle(img, (bbgt[0], bbgt[1]),
-                                  (bbgt[2], bbgt[3]), light_blue, 2)
-                    cv2.rectangle(
-                        img_cumulative, (bbgt[0], bbgt[1]), (bbgt[2], bbgt[3]), light_blue, 2)
-                    cv2.putText(img_cumulative, class_name,
-                                (bbgt[0], bbgt[1] - 5), font, 0.6, light_blue, 1, cv2.LINE_AA)
-                bb = [int(i) for i in bb]
-                cv2.rectangle(img, (bb[0], bb[1]), (bb[2], bb[3]), color, 2)
-                cv2.rectangle(img_cumulative,
-                              (bb[0], bb[1]), (bb[2], bb[3]), color, 2)
-                cv2.putText(img_cumulative, class_name,
-                            (bb[0], bb[1] - 5), font, 0.6, color, 1, cv2.LINE_AA)
-                # show image
-                cv2.imshow("Animation", img)
-                cv2.waitKey(20)  # show for 20 ms
-                # save image to output
-                output_img_path = output_files_path + "/images/detections_one_by_one/" + \
-                    class_name + "_detection" + str(idx) + ".jpg"
-                cv2.imwrite(output_img_path, img)
-                # save the image with all the objects drawn to it
-                cv2.imwrite(img_cumulative_path, img_cumulative)
-
-        # print(tp)
-        # compute precision/recall
-        cumsum = 0
-        for idx, val in enumerate(fp):
-            fp[idx] += cumsum
-            cumsum += val
-        cumsum = 0
-        for idx, val in enumerate(tp):
-            tp[idx] += cumsum
-            cumsum += val
-        # print(tp)
-        rec = tp[:]
-        for idx, val in enumerate(tp):
-            rec[idx] = float(tp[idx]) / gt_counter_per_class[class_name]
-        # print(rec)
-        prec = tp[:]
-        for idx, val in enumerate(tp):
-            prec[idx] = float(tp[idx]) / (fp[idx] + tp[idx])
-        # print(prec)
-
-        ap, mrec, mprec = voc_ap(rec[:], prec[:])
-        sum_AP += ap
-        # class_name + " AP = {0:.2f}%".format(ap*100)
-        text = "{0:.2f}%".format(ap*100) + " = " + class_name + " AP "
-        """
-         Write to output.txt
-        """
-        rounded_prec = ['%.2f' % elem for elem in prec]
-        rounded_rec = ['%.2f' % elem for elem in rec]
-        output_file.write(text + "\n Precision: " + str(rounded_prec) +
-                          "\n Recall :" + str(rounded_rec) + "\n\n")
-        if not args.quiet:
-            print(text)
-        ap_dictionary[class_name] = ap
-
-        n_images = counter_images_per_class[class_name]
-        lamr, mr, fppi = log_average_miss_rate(
-            np.array(prec), np.array(rec), n_images)
-        lamr_dictionary[class_name] = lamr
-        print('debug info-----------------------')
-        print('TP:', count_true_positives[class_name])
-        print('TP 2', tp[-1])
-        print('FP:', fp[-1])
-        """
-         Prepare data for json output
-        """
-        json_data[class_name] = {
-            'precision': prec,
-            'recall': rec,
-            'AP': ap,
-            'TP': tp[-1],
-            'FP': fp[-1],
-            'total_images': counter_images_per_class[class_name],
-            'log_average_miss_rate': lamr
-        }
-        json_data['_statistics']['precision'] = prec
-        json_data['_statistics']['recall'] = rec
-        json_data['_statistics']['mAP'] += tp[-1]
-
-        """
-         Draw plot
-        """
-        if draw_plot:
-            plt.plot(rec, prec, '-o')
-            # add a new penultimate point to the list (mrec[-2], 0.0)
-            # since the last line segment (and respective area) do not affect the AP value
-            area_under_curve_x = mrec[:-1] + [mrec[-2]] + [mrec[-1]]
-            area_under_curve_y = mprec[:-1] + [0.0] + [mprec[-1]]
-            plt.fill_between(area_under_curve_x, 0,
-                             area_under_curve_y, alpha=0.2, edgecolor='r')
-            # set window title
-            fig = plt.gcf()  # gcf - get current figure
-            fig.canvas.set_window_title('AP ' + class_name)
-            # set plot title
-            plt.title('class: ' + text)
-            # plt.suptitle('This is a somewhat long figure title', fontsize=16)
-            # set axis titles
-            plt.xlabel('Recall')
-            plt.ylabel('Precision')
-            # optional - set axes
-            axes = plt.gca()  # gca - get current axes
-            axes.set_xlim([0.0, 1.0])
-            axes.set_ylim([0.0, 1.05])  # .05 to give some extra space
-            # Alternative option -> wait for button to be pressed
-            # while not plt.waitforbuttonpress(): pass # wait for key display
-            # Alternative option -> normal display
-            # plt.show()
-            # save the plot
-            fig.savefig(output_files_path + "/classes/" + class_name + ".png")
-            plt.cla()  # clear axes for next plot
-
-    if show_animation:
-        cv2.destroyAllWindows()
+                text = "IoU: {0:.2f}% ".format(
+                    ovmax*100) + ">= {0:.2f}% ".format(min_overlap*100)
+                color = green
+            img, _ = draw_text_in_image(
+                img, text, (margin + line_width, v_pos), color, line_width)
+        # 2nd line
+        v_pos += int(bottom_border / 2.0)
+        rank_pos = str(idx+1)  # rank position (idx starts at 0)
+        text = "Detection #rank: " + rank_pos + \
+            " confidence: {0:.2f}% ".format(labels.dr_scores[dr_row]*100)
+        img, line_width = draw_text_in_image(
+            img, text, (margin, v_pos), white, 0)
+        color = light_red
+        if status == "MATCH!":
+            color = green
+        text = "Result: " + status + " "
+        img, line_width = draw_text_in_image(
+            img, text, (margin + line_width, v_pos), color, line_width)
+
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        if ovmax > 0:  # if there is intersections between the bounding-boxes
+            bbgt = [int(round(x)) for x in labels.gt_boxes[match.gt_match[idx]]]
+            cv2.rectangle(img, (bbgt[0], bbgt[1]),
+                          (bbgt[2], bbgt[3]), light_blue, 2)
+            cv2.rectangle(
+                img_cumulative, (bbgt[0], bbgt[1]), (bbgt[2], bbgt[3]), light_blue, 2)
+            cv2.putText(img_cumulative, class_name,
+                        (bbgt[0], bbgt[1] - 5), font, 0.6, light_blue, 1, cv2.LINE_AA)
+        bb = [int(i) for i in labels.dr_boxes[dr_row]]
+        cv2.rectangle(img, (bb[0], bb[1]), (bb[2], bb[3]), color, 2)
+        cv2.rectangle(img_cumulative,
+                      (bb[0], bb[1]), (bb[2], bb[3]), color, 2)
+        cv2.putText(img_cumulative, class_name,
+                    (bb[0], bb[1] - 5), font, 0.6, color, 1, cv2.LINE_AA)
+        # show image
+        cv2.imshow("Animation", img)
+        cv2.waitKey(20)  # show for 20 ms
+        # save image to output
+        output_img_path = output_files_path + "/images/detections_one_by_one/" + \
+            class_name + "_detection" + str(idx) + ".jpg"
+        cv2.imwrite(output_img_path, img)
+        # save the image with all the objects drawn to it
+        cv2.imwrite(img_cumulative_path, img_cumulative)
 
-    output_file.write("\n# mAP of all classes\n")
-    mAP = sum_AP / n_classes
-    text = "mAP = {0:.2f}%".format(mAP*100)
-    output_file.write(text + "\n")
-    print(text)
 
 """
  Draw false negatives
 """
-if show_animation:
+
+
+def draw_false_negatives(labels, results, img_path, output_files_path):
     pink = (203, 192, 255)
-    for tmp_file in gt_files:
-        ground_truth_data = json.load(open(tmp_file))
-        # print(ground_truth_data)
-        # get name of corresponding image
-        start = TEMP_FILES_PATH + '/'
-        img_id = tmp_file[tmp_file.find(
-            start)+len(start):tmp_file.rfind('_ground_truth.json')]
+    used = np.zeros(len(labels.gt_boxes), dtype=bool)
+    for result in results:
+        used[result.match.gt_match[result.match.tp == 1]] = True
+    for image_idx, img_id in enumerate(labels.file_ids):
         img_cumulative_path = output_files_path + "/images/" + img_id + ".jpg"
         img = cv2.imread(img_cumulative_path)
         if img is None:
-            img_path = IMG_PATH + '/' + img_id + ".jpg"
-            img = cv2.imread(img_path)
+            img = cv2.imread(img_path + '/' + img_id + ".jpg")
         # draw false negatives
-        for obj in ground_truth_data:
-            if not obj['used']:
-                bbgt = [int(round(float(x))) for x in obj["bbox"].split()]
-                cv2.rectangle(img, (bbgt[0], bbgt[1]),
-                              (bbgt[2], bbgt[3]), pink, 2)
+        for row in np.flatnonzero((labels.gt_images == image_idx) & ~used):
+            bbgt = [int(round(x)) for x in labels.gt_boxes[row]]
+            cv2.rectangle(img, (bbgt[0], bbgt[1]),
+                          (bbgt[2], bbgt[3]), pink, 2)
         cv2.imwrite(img_cumulative_path, img)
 
-# remove the temp_files directory
-shutil.rmtree(TEMP_FILES_PATH)
 
-"""
- Count total of detection-results
-"""
-# iterate through all the files
-det_counter_per_class = {}
-for txt_file in dr_files_list:
-    # get lines to list
-    lines_list = file_lines_to_list(txt_file)
-    for line in lines_list:
-        class_name = line.split()[0]
-        # check if class is in the ignore list, if yes skip
-        if class_name in args.ignore:
-            continue
-        # count that object
-        if class_name in det_counter_per_class:
-            det_counter_per_class[class_name] += 1
-        else:
-            # if class didn't exist yet
-            det_counter_per_class[class_name] = 1
-# print(det_counter_per_class)
-dr_classes = list(det_counter_per_class.keys())
+def main(args, labels=None):
+    """Run the evaluation; ``labels`` may be a preloaded :class:`ap_engine.VocLabels`
+    (e.g. from pipeline.py), otherwise the VOC txt files of ``args.input_dir`` are read.
+    """
+    # the optional drawing backends are looked up as globals by the helpers above
+    global cv2, plt
+
+    # if there are no classes to ignore then replace None by empty list
+    if args.ignore is None:
+        args.ignore = []
+
+    input_dir = os.path.abspath(args.input_dir)
+    print(input_dir)
+    GT_PATH = os.path.join(input_dir, 'truth')
+    DR_PATH = os.path.join(input_dir, 'pred')
+    # if there are no images then no animation can be shown
+    IMG_PATH = os.path.join(input_dir, 'images-optional')
+    if os.path.exists(IMG_PATH):
+        for dirpath, dirnames, files in os.walk(IMG_PATH):
+            if not files:
+                # no image files found
+                args.no_animation = True
+    else:
+        args.no_animation = True
 
+    # try to import OpenCV if the user didn't choose the option --no-animation
+    show_animation = False
+    if not args.no_animation:
+        try:
+            import cv2
+            show_animation = True
+        except ImportError:
+            print("\"opencv-python\" not found, please install to visualize the results.")
+            args.no_animation = True
 
-"""
- Plot the total number of occurences of each class in the ground-truth
-"""
-if draw_plot:
-    window_title = "ground-truth-info"
-    plot_title = "ground-truth\n"
-    plot_title += "(" + str(len(ground_truth_files_list)) + \
-        " files and " + str(n_classes) + " classes)"
-    x_label = "Number of objects per class"
-    output_path = output_files_path + "/ground-truth-info.png"
-    to_show = False
-    plot_color = 'forestgreen'
-    draw_plot_func(
-        gt_counter_per_class,
-        n_classes,
-        window_title,
-        plot_title,
-        x_label,
-        output_path,
-        to_show,
-        plot_color,
-        '',
-    )
+    # try to import Matplotlib if the user didn't choose the option --no-plot
+    draw_plot = False
+    if not args.no_plot:
+        try:
+            import matplotlib.pyplot as plt
+            draw_plot = True
+        except ImportError:
+            print("\"matplotlib\" not found, please install it to get the resulting plots.")
+            args.no_plot = True
 
-"""
- Write number of ground-truth objects per class to results.txt
-"""
-with open(output_files_path + "/output.txt", 'a') as output_file:
-    output_file.write("\n# Number of ground-truth objects per class\n")
-    for class_name in sorted(gt_counter_per_class):
-        output_file.write(class_name + ": " +
-                          str(gt_counter_per_class[class_name]) + "\n")
+    """
+     Create the "output/" directory
+    """
+    output_files_path = args.output_dir
+    if os.path.exists(output_files_path):  # if it exist already
+        # reset the output directory
+        shutil.rmtree(output_files_path)
+
+    os.makedirs(output_files_path)
+    if draw_plot:
+        os.makedirs(os.path.join(output_files_path, "classes"))
+    if show_animation:
+        os.makedirs(os.path.join(output_files_path,
+                    "images", "detections_one_by_one"))
 
-"""
- Finish counting true positives
-"""
-for class_name in dr_classes:
-    # if class exists in detection-result but not in ground-truth then there are no true positives in that class
-    if class_name not in gt_classes:
-        count_true_positives[class_name] = 0
-# print(count_true_positives)
+    """
+     Load ground-truth and detection-results once into arrays
+    """
+    if labels is None:
+        try:
+            if args.packed:
+                labels = ap_engine.load_npz(os.path.join(input_dir, ap_engine.PACKED_FILE), args.ignore)
+            else:
+                labels = ap_engine.load_voc_dirs(GT_PATH, DR_PATH, args.ignore)
+        except (ValueError, OSError) as e:
+            error(str(e))
 
-"""
- Plot the total number of occurences of each class in the "detection-results" folder
-"""
-if draw_plot:
-    window_title = "detection-results-info"
-    # Plot title
-    plot_title = "detection-results\n"
-    plot_title += "(" + str(len(dr_files_list)) + " files and "
-    count_non_zero_values_in_dictionary = sum(
-        int(x) > 0 for x in list(det_counter_per_class.values()))
-    plot_title += str(count_non_zero_values_in_dictionary) + \
-        " detected classes)"
-    # end Plot title
-    x_label = "Number of objects per class"
-    output_path = output_files_path + "/detection-results-info.png"
-    to_show = False
-    plot_color = 'forestgreen'
-    true_p_bar = count_true_positives
-    draw_plot_func(
-        det_counter_per_class,
-        len(det_counter_per_class),
-        window_title,
-        plot_title,
-        x_label,
-        output_path,
-        to_show,
-        plot_color,
-        true_p_bar
-    )
+    gt_counter_per_class = ap_engine.gt_counts(labels)
+    det_counter_per_class = ap_engine.detection_counts(labels)
+    # let's sort the classes alphabetically
+    gt_classes = sorted(gt_counter_per_class.keys())
+    n_classes = len(gt_classes)
+    class_iou = parse_class_iou(args.set_class_iou, gt_classes)
 
-"""
- Write number of detected objects per class to output.txt
-"""
-with open(output_files_path + "/output.txt", 'a') as output_file:
-    output_file.write("\n# Number of detected objects per class\n")
-    for class_name in sorted(dr_classes):
-        n_det = det_counter_per_class[class_name]
-        text = class_name + ": " + str(n_det)
-        text += " (tp:" + str(count_true_positives[class_name]) + ""
-        text += ", fp:" + str(n_det - count_true_positives[class_name]) + ")\n"
-        output_file.write(text)
+    """
+     Calculate the AP for each class
+    """
+    results = ap_engine.evaluate(labels, ap_engine.MINOVERLAP, class_iou)
+    json_data = ap_engine.to_json_data(results)
+    ap_dictionary = {r.class_name: r.ap for r in results}
+    lamr_dictionary = {r.class_name: r.lamr for r in results}
+    count_true_positives = {class_name: 0 for class_name in det_counter_per_class}
+    count_true_positives.update({r.class_name: r.tp for r in results})
+
+    # open file to store the output
+    with open(output_files_path + "/output.txt", 'w') as output_file:
+        output_file.write("# AP and precision/recall per class\n")
+        for class_index, result in enumerate(results):
+            class_name = result.class_name
+            if show_animation:
+                draw_animation(labels, result, class_index, n_classes,
+                               class_iou.get(class_name, ap_engine.MINOVERLAP), IMG_PATH, output_files_path)
 
-"""
- Draw log-average miss rate plot (Show lamr of all classes in decreasing order)
-"""
-if draw_plot:
-    window_title = "lamr"
-    plot_title = "log-average miss rate"
-    x_label = "log-average miss rate"
-    output_path = output_files_path + "/lamr.png"
-    to_show = False
-    plot_color = 'royalblue'
-    draw_plot_func(
-        lamr_dictionary,
-        n_classes,
-        window_title,
-        plot_title,
-        x_label,
-        output_path,
-        to_show,
-        plot_color,
-        ""
-    )
+            # class_name + " AP = {0:.2f}%".format(ap*100)
+            text = "{0:.2f}%".format(result.ap*100) + " = " + class_name + " AP "
+            """
+             Write to output.txt
+            """
+            rounded_prec = ['%.2f' % elem for elem in result.precision]
+            rounded_rec = ['%.2f' % elem for elem in result.recall]
+            output_file.write(text + "\n Precision: " + str(rounded_prec) +
+                              "\n Recall :" + str(rounded_rec) + "\n\n")
+            if not args.quiet:
+                print(text)
+                print('TP:', result.tp)
+                print('FP:', result.fp)
+
+            """
+             Draw plot
+            """
+            if draw_plot:
+                mrec = result.mrec.tolist()
+                mprec = result.mprec.tolist()
+                plt.plot(result.recall, result.precision, '-o')
+                # add a new penultimate point to the list (mrec[-2], 0.0)
+                # since the last line segment (and respective area) do not affect the AP value
+                area_under_curve_x = mrec[:-1] + [mrec[-2]] + [mrec[-1]]
+                area_under_curve_y = mprec[:-1] + [0.0] + [mprec[-1]]
+                plt.fill_between(area_under_curve_x, 0,
+                                 area_under_curve_y, alpha=0.2, edgecolor='r')
+                # set window title
+                fig = plt.gcf()  # gcf - get current figure
+                fig.canvas.set_window_title('AP ' + class_name)
+                # set plot title
+                plt.title('class: ' + text)
+                # set axis titles
+                plt.xlabel('Recall')
+                plt.ylabel('Precision')
+                # optional - set axes
+                axes = plt.gca()  # gca - get current axes
+                axes.set_xlim([0.0, 1.0])
+                axes.set_ylim([0.0, 1.05])  # .05 to give some extra space
+                # save the plot
+                fig.savefig(output_files_path + "/classes/" + class_name + ".png")
+                plt.cla()  # clear axes for next plot
+
+        if show_animation:
+            cv2.destroyAllWindows()
+
+        output_file.write("\n# mAP of all classes\n")
+        mAP = sum(ap_dictionary.values()) / n_classes
+        text = "mAP = {0:.2f}%".format(mAP*100)
+        output_file.write(text + "\n")
+        print(text)
+
+        output_file.write("\n# COCO-style mAP of all classes\n")
+        statistics = json_data['_statistics']
+        for key in ('mAP50', 'mAP75', 'mAP50_95', 'mAP_small', 'mAP_medium', 'mAP_large'):
+            value = statistics[key]
+            output_file.write(key + " = " + ("n/a" if value is None else "{0:.2f}%".format(value*100)) + "\n")
+
+    if show_animation:
+        draw_false_negatives(labels, results, IMG_PATH, output_files_path)
+
+    """
+     Plot the total number of occurences of each class in the ground-truth
+    """
+    if draw_plot:
+        window_title = "ground-truth-info"
+        plot_title = "ground-truth\n"
+        plot_title += "(" + str(len(labels.file_ids)) + \
+            " files and " + str(n_classes) + " classes)"
+        x_label = "Number of objects per class"
+        output_path = output_files_path + "/ground-truth-info.png"
+        to_show = False
+        plot_color = 'forestgreen'
+        draw_plot_func(
+            gt_counter_per_class,
+            n_classes,
+            window_title,
+            plot_title,
+            x_label,
+            output_path,
+            to_show,
+            plot_color,
+            '',
+        )
+
+    """
+     Write number of ground-truth objects per class to results.txt
+    """
+    with open(output_files_path + "/output.txt", 'a') as output_file:
+        output_file.write("\n# Number of ground-truth objects per class\n")
+        for class_name in sorted(gt_counter_per_class):
+            output_file.write(class_name + ": " +
+                              str(gt_counter_per_class[class_name]) + "\n")
+
+    """
+     Plot the total number of occurences of each class in the "detection-results" folder
+    """
+    if draw_plot:
+        window_title = "detection-results-info"
+        # Plot title
+        plot_title = "detection-results\n"
+        plot_title += "(" + str(len(labels.file_ids)) + " files and "
+        count_non_zero_values_in_dictionary = sum(
+            int(x) > 0 for x in list(det_counter_per_class.values()))
+        plot_title += str(count_non_zero_values_in_dictionary) + \
+            " detected classes)"
+        # end Plot title
+        x_label = "Number of objects per class"
+        output_path = output_files_path + "/detection-results-info.png"
+        to_show = False
+        plot_color = 'forestgreen'
+        true_p_bar = count_true_positives
+        draw_plot_func(
+            det_counter_per_class,
+            len(det_counter_per_class),
+            window_title,
+            plot_title,
+            x_label,
+            output_path,
+            to_show,
+            plot_color,
+            true_p_bar
+        )
+
+    """
+     Write number of detected objects per class to output.txt
+    """
+    with open(output_files_path + "/output.txt", 'a') as output_file:
+        output_file.write("\n# Number of detected objects per class\n")
+        for class_name in sorted(det_counter_per_class):
+            n_det = det_counter_per_class[class_name]
+            text = class_name + ": " + str(n_det)
+            text += " (tp:" + str(count_true_positives[class_name]) + ""
+            text += ", fp:" + str(n_det - count_true_positives[class_name]) + ")\n"
+            output_file.write(text)
+
+    """
+     Draw log-average miss rate plot (Show lamr of all classes in decreasing order)
+    """
+    if draw_plot:
+        window_title = "lamr"
+        plot_title = "log-average miss rate"
+        x_label = "log-average miss rate"
+        output_path = output_files_path + "/lamr.png"
+        to_show = False
+        plot_color = 'royalblue'
+        draw_plot_func(
+            lamr_dictionary,
+            n_classes,
+            window_title,
+            plot_title,
+            x_label,
+            output_path,
+            to_show,
+            plot_color,
+            ""
+        )
+
+    """
+     Draw mAP plot (Show AP's of all classes in decreasing order)
+    """
+    if draw_plot:
+        window_title = "mAP"
+        plot_title = "mAP = {0:.2f}%".format(mAP*100)
+        x_label = "Average Precision"
+        output_path = output_files_path + "/mAP.png"
+        to_show = True
+        plot_color = 'royalblue'
+        draw_plot_func(
+            ap_dictionary,
+            n_classes,
+            window_title,
+            plot_title,
+            x_label,
+            output_path,
+            to_show,
+            plot_color,
+            ""
+        )
+
+    with open(os.path.join(args.output_dir, '../all_class_AP.json'), 'w') as f:
+        json.dump(json_data, f)
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_args())
+    except AnalysisError as e:
+        # data errors are not fatal for the training version, as before
+        print(e)
+        sys.exit(0)
 
-"""
- Draw mAP plot (Show AP's of all classes in decreasing order)
-"""
-if draw_plot:
-    window_title = "mAP"
-    plot_title = "mAP = {0:.2f}%".format(mAP*100)
-    x_label = "Average Precision"
-    output_path = output_files_path + "/mAP.png"
-    to_show = True
-    plot_color = 'royalblue'
-    draw_plot_func(
-        ap_dictionary,
-        n_classes,
-        window_title,
-        plot_title,
-        x_label,
-        output_path,
-        to_show,
-        plot_color,
-        ""
-    )
-
-with open(os.path.join(args.output_dir, '../all_class_AP.json'), 'w') as f:
-    json.dump(json_data, f)
 # python all_class_AP.py -na -np -d /home/hsnl/crazyfire/docker-testing/results/project-1/version-4/voc_format_labels -o /home/hsnl/crazyfire/docker-testing/results/project_1/version_4/analysis_results/all_class_AP
 
 # in container
@@ -0,0 +1,109 @@
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import yaml
+
+from image_size_index import ImageSizeIndex
+
+
+def yolo_to_voc_boxes(xywhn: np.ndarray, img_width: int, img_height: int) -> np.ndarray:
+    """Convert normalized ``x_center y_center width height`` rows to integer
+    ``left top right bottom`` rows in pixels.
+
+    Coordinates are truncated to integers and shifted by one: in the official
+    VOC challenge the top-left pixel has coordinates (1;1).
+    """
+    x_c = xywhn[:, 0] * img_width
+    y_c = xywhn[:, 1] * img_height
+    half_width = xywhn[:, 2] * img_width / 2
+    half_height = xywhn[:, 3] * img_height / 2
+    boxes = np.stack([x_c - half_width, y_c - half_height,
+                      x_c + half_width, y_c + half_height], axis=1)
+    return np.trunc(boxes).astype(np.int64) + 1
+
+
+class AnalysisContext:
+    """Dataset and predictions of a finished training run, loaded once and
+    shared by all post-processing stages.
+
+    ``dataset.yaml`` and ``test.txt`` are parsed on construction; label files
+    and image sizes are read lazily and memoized, so a stage that needs them
+    after another one pays nothing. Image sizes also persist across runs in the
+    dataset's :class:`ImageSizeIndex`, see ``save_image_size_index``.
+    """
+
+    def __init__(self, dataset_dir: str, pred_dir: str = '/workspace/results/test'):
+        self.dataset_dir = dataset_dir
+        self.pred_dir = pred_dir
+
+        with open(os.path.join(dataset_dir, 'dataset.yaml'), 'r') as f:
+            valuesYaml = yaml.load(f, Loader=yaml.FullLoader)
+            self.class_mapping: Dict[int, str] = valuesYaml['names']
+
+        test_file = os.path.join(dataset_dir, 'test.txt')
+        if not os.path.isfile(test_file):
+            raise ValueError(f"{test_file} not found.")
+        with open(test_file, 'r') as f:
+            # parse the file names and extensions
+            self.test_images: List[Tuple[str, str]] = [
+                tuple(line.strip().removeprefix('./images/').rsplit('.', 1)) for line in f if line.strip()]
+
+        self.image_sizes = ImageSizeIndex(dataset_dir)
+        self._label_lines: Dict[str, List[List[str]]] = {}
+        self._gt = None
+        self._pred = None
+
+    def image_size(self, img_path: str) -> Tuple[int, int]:
+        return self.image_sizes.get(img_path)
+
+    def save_image_size_index(self):
+        self.image_sizes.save()
+
+    def label_lines(self, txt_file_path: str) -> List[List[str]]:
+        """Whitespace-split lines of a YOLO label file; raises FileNotFoundError."""
+        lines = self._label_lines.get(txt_file_path)
+        if lines is None:
+            with open(txt_file_path, 'r') as f:
+                lines = [line.split() for line in f if line.strip()]
+            self._label_lines[txt_file_path] = lines
+        return lines
+
+    def test_image_path(self, file_stem: str, file_ext: str) -> str:
+        return os.path.join(self.dataset_dir, 'images', file_stem + '.' + file_ext)
+
+    def _load_split(self, label_dir: str, is_pred: bool) -> Dict[str, np.ndarray]:
+        n_cols = 6 if is_pred else 5
+        converted = {}
+        img_sizes = self.image_sizes.get_many(
+            [self.test_image_path(file_stem, file_ext) for file_stem, file_ext in self.test_images])
+        for (file_stem, file_ext), (img_width, img_height) in zip(self.test_images, img_sizes):
+            txt_file_path = os.path.join(label_dir, file_stem + '.txt')
+            if not os.path.exists(txt_file_path):
+                if not is_pred:
+                    raise ValueError(f"File {txt_file_path} not found.")
+                # if yolo val.py doesn't predict any object, that file will not exist
+                lines = []
+            else:
+                lines = self.label_lines(txt_file_path)
+            if len(lines) == 0:
+                converted[file_stem] = np.zeros((0, n_cols))
+                continue
+            rows = np.array(lines, dtype=np.float64)
+            boxes = yolo_to_voc_boxes(rows[:, 1:5], img_width, img_height)
+            converted[file_stem] = np.column_stack([rows[:, 0], boxes] + ([rows[:, 5]] if is_pred else []))
+        return converted
+
+    @property
+    def gt(self) -> Dict[str, np.ndarray]:
+        """Test split ground truth per image stem: ``class_id left top right bottom`` rows."""
+        if self._gt is None:
+            self._gt = self._load_split(os.path.join(self.dataset_dir, 'labels'), is_pred=False)
+        return self._gt
+
+    @property
+    def pred(self) -> Dict[str, np.ndarray]:
+        """Test split predictions per image stem: ``class_id left top right bottom confidence`` rows."""
+        if self._pred is None:
+            self._pred = self._load_split(os.path.join(self.pred_dir, 'labels'), is_pred=True)
+        return self._pred
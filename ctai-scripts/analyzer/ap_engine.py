@@ -0,0 +1,526 @@
+# In-memory replacement for the per-detection matching loop of all_class_AP.py
+# (originally https://github.com/Cartucho/mAP/tree/master).
+#
+# Ground truth and detection results are loaded once into flat NumPy arrays,
+# every detection is paired with the ground truth boxes of its image and class
+# in a single vectorized IoU pass, and the greedy "highest confidence first"
+# assignment is resolved with array operations instead of rewriting a JSON file
+# per detection.
+import glob
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+MINOVERLAP = 0.5  # yolo default validation.run value (AP50)
+# single-file alternative to the truth/ and pred/ txt directories, see save_npz
+PACKED_FILE = 'voc_labels.npz'
+# COCO-style sweep AP@[.5:.95] and object size buckets (in pixels^2). The sweep
+# uses the same greedy VOC matching as the headline AP (so AP50 == AP when
+# MINOVERLAP is 0.5): a detection only competes for its single best GT box and
+# does not fall back to the next one like COCOeval. It also keeps the VOC
+# all-point AP integration, the "+1 pixel" box convention and has no limit on
+# detections per image, so the numbers are close to, not equal to, pycocotools.
+IOU_THRESHOLDS = np.round(np.linspace(0.5, 0.95, 10), 2)
+AREA_RANGES = {
+    'small': (0, 32 ** 2),
+    'medium': (32 ** 2, 96 ** 2),
+    'large': (96 ** 2, float('inf')),
+}
+
+
+class VocLabels:
+    """Ground truth and detection results of a test split, flattened into arrays.
+
+    Boxes are stored as float64 ``[left, top, right, bottom]`` rows in VOC pixel
+    coordinates. ``*_images`` index into ``file_ids`` and ``*_classes`` index
+    into ``class_names``; rows keep the sorted-file / line order of the inputs.
+    """
+
+    def __init__(self, file_ids: List[str], class_names: List[str]):
+        self.file_ids = file_ids
+        self.class_names = class_names
+        # image file names (with extension) of file_ids, when known
+        self.image_names: Optional[List[str]] = None
+        self.gt_boxes = np.zeros((0, 4), dtype=np.float64)
+        self.gt_classes = np.zeros(0, dtype=np.int64)
+        self.gt_images = np.zeros(0, dtype=np.int64)
+        self.gt_difficult = np.zeros(0, dtype=bool)
+        self.dr_boxes = np.zeros((0, 4), dtype=np.float64)
+        self.dr_classes = np.zeros(0, dtype=np.int64)
+        self.dr_images = np.zeros(0, dtype=np.int64)
+        self.dr_scores = np.zeros(0, dtype=np.float64)
+
+    def class_id(self, class_name: str) -> int:
+        return self.class_names.index(class_name)
+
+
+def _file_ids(path: str) -> Dict[str, str]:
+    files = sorted(glob.glob(os.path.join(path, '*.txt')))
+    return {os.path.basename(os.path.normpath(f.split('.txt', 1)[0])): f for f in files}
+
+
+def load_voc_dirs(gt_path: str, dr_path: str, ignore: Sequence[str] = ()) -> VocLabels:
+    """Read ``<class_name> <left> <top> <right> <bottom> [difficult]`` ground truth
+    files and ``<class_name> <left> <top> <right> <bottom> <confidence>`` detection
+    files into a :class:`VocLabels`.
+
+    Raises ``ValueError`` when the two directories do not hold the same file ids
+    or when a line is malformed.
+    """
+    gt_files = _file_ids(gt_path)
+    if len(gt_files) == 0:
+        raise ValueError("Error: No ground-truth files found!")
+    dr_files = _file_ids(dr_path)
+    for file_id in gt_files:
+        if file_id not in dr_files:
+            error_msg = "Error. File not found: {}\n".format(os.path.join(dr_path, file_id + ".txt"))
+            error_msg += "(You can avoid this error message by running extra/intersect-gt-and-dr.py)"
+            raise ValueError(error_msg)
+    for file_id in dr_files:
+        if file_id not in gt_files:
+            error_msg = "Error. File not found: {}\n".format(os.path.join(gt_path, file_id + ".txt"))
+            error_msg += "(You can avoid this error message by running extra/intersect-gt-and-dr.py)"
+            raise ValueError(error_msg)
+
+    ignore = set(ignore)
+    file_ids = list(gt_files.keys())
+    class_index: Dict[str, int] = {}
+    gt_rows, gt_meta = [], []
+    dr_rows, dr_meta = [], []
+
+    for image_idx, file_id in enumerate(file_ids):
+        txt_file = gt_files[file_id]
+        with open(txt_file) as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if len(parts) == 6 and parts[5] == 'difficult':
+                    difficult = True
+                elif len(parts) == 5:
+                    difficult = False
+                else:
+                    error_msg = "Error: File " + txt_file + " in the wrong format.\n"
+                    error_msg += " Expected: <class_name> <left> <top> <right> <bottom> ['difficult']\n"
+                    error_msg += " Received: " + line.strip()
+                    raise ValueError(error_msg)
+                class_name = parts[0]
+                if class_name in ignore:
+                    continue
+                class_id = class_index.setdefault(class_name, len(class_index))
+                gt_rows.append(parts[1:5])
+                gt_meta.append((class_id, image_idx, difficult))
+
+        txt_file = dr_files[file_id]
+        with open(txt_file) as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if len(parts) != 6:
+                    # !!! our format: class_name left top right bottom confidence
+                    error_msg = "Error: File " + txt_file + " in the wrong format.\n"
+                    error_msg += " Expected: <class_name> <left> <top> <right> <bottom> <confidence> \n"
+                    error_msg += " Received: " + line.strip()
+                    raise ValueError(error_msg)
+                class_name = parts[0]
+                if class_name in ignore:
+                    continue
+                class_id = class_index.setdefault(class_name, len(class_index))
+                dr_rows.append(parts[1:6])
+                dr_meta.append((class_id, image_idx))
+
+    labels = VocLabels(file_ids, list(class_index.keys()))
+    if gt_rows:
+        labels.gt_boxes = np.array(gt_rows, dtype=np.float64)
+        meta = np.array(gt_meta, dtype=np.int64)
+        labels.gt_classes, labels.gt_images = meta[:, 0], meta[:, 1]
+        labels.gt_difficult = meta[:, 2].astype(bool)
+    if dr_rows:
+        rows = np.array(dr_rows, dtype=np.float64)
+        labels.dr_boxes, labels.dr_scores = rows[:, :4], rows[:, 4]
+        meta = np.array(dr_meta, dtype=np.int64)
+        labels.dr_classes, labels.dr_images = meta[:, 0], meta[:, 1]
+    return labels
+
+
+def labels_from_arrays(gt: Dict[str, np.ndarray], dr: Dict[str, np.ndarray],
+                       class_mapping: Dict[int, str]) -> VocLabels:
+    """Build a :class:`VocLabels` from per-image arrays that are already in memory.
+
+    ``gt`` rows are ``class_id left top right bottom`` and ``dr`` rows are
+    ``class_id left top right bottom confidence``, keyed by file id (see
+    ``AnalysisContext.gt``/``AnalysisContext.pred``).
+    """
+    class_ids = np.array(sorted(class_mapping))
+    labels = VocLabels(sorted(gt), [class_mapping[i] for i in class_ids])
+    empty_images = np.zeros(0, dtype=np.int64)
+
+    def stack(per_image, n_cols):
+        rows = [per_image[file_id] for file_id in labels.file_ids if file_id in per_image]
+        images = [np.full(len(per_image[file_id]), image_idx, dtype=np.int64)
+                  for image_idx, file_id in enumerate(labels.file_ids) if file_id in per_image]
+        if not rows:
+            return np.zeros((0, n_cols)), empty_images
+        return np.concatenate(rows).reshape(-1, n_cols), np.concatenate(images)
+
+    rows, labels.gt_images = stack(gt, 5)
+    labels.gt_classes = np.searchsorted(class_ids, rows[:, 0].astype(np.int64))
+    labels.gt_boxes = rows[:, 1:5].astype(np.float64)
+    labels.gt_difficult = np.zeros(len(rows), dtype=bool)
+
+    rows, labels.dr_images = stack(dr, 6)
+    labels.dr_classes = np.searchsorted(class_ids, rows[:, 0].astype(np.int64))
+    labels.dr_boxes = rows[:, 1:5].astype(np.float64)
+    labels.dr_scores = rows[:, 5].astype(np.float64)
+    return labels
+
+
+_GT_ARRAYS = ('gt_boxes', 'gt_classes', 'gt_images', 'gt_difficult')
+_DR_ARRAYS = ('dr_boxes', 'dr_classes', 'dr_images', 'dr_scores')
+
+
+def save_npz(labels: VocLabels, path: str):
+    """Write ``labels`` to a single ``.npz`` file, read back by :func:`load_npz`."""
+    arrays = {name: getattr(labels, name) for name in _GT_ARRAYS + _DR_ARRAYS}
+    np.savez_compressed(
+        path, file_ids=np.array(labels.file_ids, dtype=str), class_names=np.array(labels.class_names, dtype=str),
+        image_names=np.array(labels.image_names if labels.image_names is not None else [], dtype=str), **arrays)
+
+
+def load_npz(path: str, ignore: Sequence[str] = ()) -> VocLabels:
+    """Read a file written by :func:`save_npz`; rows of ``ignore`` classes are dropped."""
+    with np.load(path) as data:
+        labels = VocLabels(data['file_ids'].tolist(), data['class_names'].tolist())
+        if len(data['image_names']):
+            labels.image_names = data['image_names'].tolist()
+        for name in _GT_ARRAYS + _DR_ARRAYS:
+            setattr(labels, name, data[name])
+    if len(labels.file_ids) == 0:
+        raise ValueError("Error: No ground-truth files found!")
+
+    ignored = [labels.class_names.index(name) for name in ignore if name in labels.class_names]
+    if ignored:
+        keep = ~np.isin(labels.gt_classes, ignored)
+        for name in _GT_ARRAYS:
+            setattr(labels, name, getattr(labels, name)[keep])
+        keep = ~np.isin(labels.dr_classes, ignored)
+        for name in _DR_ARRAYS:
+            setattr(labels, name, getattr(labels, name)[keep])
+    return labels
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    return (boxes[:, 2] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 1] + 1)
+
+
+def pair_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU of aligned box pairs using the VOC "+1 pixel" convention.
+
+    Pairs that do not intersect get ``-1`` so that they never win a match,
+    like the ``ovmax = -1`` initialisation of the original loop.
+    """
+    iw = np.minimum(boxes_a[:, 2], boxes_b[:, 2]) - np.maximum(boxes_a[:, 0], boxes_b[:, 0]) + 1
+    ih = np.minimum(boxes_a[:, 3], boxes_b[:, 3]) - np.maximum(boxes_a[:, 1], boxes_b[:, 1]) + 1
+    inter = iw * ih
+    ua = box_area(boxes_a) + box_area(boxes_b) - inter
+    overlap = (iw > 0) & (ih > 0)
+    iou = np.full(len(inter), -1.0)
+    np.divide(inter, ua, out=iou, where=overlap)
+    return iou
+
+
+def voc_ap(rec: np.ndarray, prec: np.ndarray):
+    """VOC2012 all-point interpolated AP; returns ``(ap, mrec, mpre)``."""
+    mrec = np.concatenate(([0.0], rec, [1.0]))
+    mpre = np.concatenate(([0.0], prec, [0.0]))
+    # make the precision monotonically decreasing (goes from the end to the beginning)
+    mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+    # indexes where the recall changes
+    i = np.flatnonzero(mrec[1:] != mrec[:-1]) + 1
+    ap = float(np.sum((mrec[i] - mrec[i - 1]) * mpre[i]))
+    return ap, mrec, mpre
+
+
+def log_average_miss_rate(prec: np.ndarray, rec: np.ndarray, num_images: int):
+    """
+        log-average miss rate:
+            Calculated by averaging miss rates at 9 evenly spaced FPPI points
+            between 10e-2 and 10e0, in log-space.
+
+        output:
+                lamr | log-average miss rate
+                mr | miss rate
+                fppi | false positives per image
+
+        references:
+            [1] Dollar, Piotr, et al. "Pedestrian Detection: An Evaluation of the
+               State of the Art." Pattern Analysis and Machine Intelligence, IEEE
+               Transactions on 34.4 (2012): 743 - 761.
+    """
+
+    # if there were no detections of that class
+    if prec.size == 0:
+        return 0, 1, 0
+
+    fppi = (1 - prec)
+    mr = (1 - rec)
+
+    fppi_tmp = np.insert(fppi, 0, -1.0)
+    mr_tmp = np.insert(mr, 0, 1.0)
+
+    # Use 9 evenly spaced reference points in log-space; for each one take the
+    # last fppi that does not exceed it (always exists since min(fppi_tmp) = -1.0)
+    ref = np.logspace(-2.0, 0.0, num=9)
+    j = len(fppi_tmp) - 1 - np.argmax(fppi_tmp[::-1, None] <= ref[None, :], axis=0)
+    ref = mr_tmp[j]
+
+    # log(0) is undefined, so we use the np.maximum(1e-10, ref)
+    lamr = math.exp(np.mean(np.log(np.maximum(1e-10, ref))))
+
+    return lamr, mr, fppi
+
+
+@dataclass
+class ClassMatch:
+    """Greedy assignment of one class's detections, ranked by decreasing confidence."""
+    order: np.ndarray      # detection row indices (into VocLabels.dr_*) in rank order
+    ovmax: np.ndarray      # best IoU against a same-class GT of the same image, -1 if none
+    gt_match: np.ndarray   # GT row index giving ``ovmax``, -1 if none
+    tp: np.ndarray         # 1 for true positives
+    fp: np.ndarray         # 1 for false positives (difficult matches are neither)
+
+
+@dataclass
+class ClassResult:
+    class_name: str
+    ap: float
+    precision: np.ndarray
+    recall: np.ndarray
+    mrec: np.ndarray
+    mprec: np.ndarray
+    tp: int
+    fp: int
+    n_gt: int
+    n_images: int
+    lamr: float
+    match: ClassMatch = field(repr=False)
+    # AP per IoU threshold of IOU_THRESHOLDS
+    ap_sweep: np.ndarray = field(default=None, repr=False)
+    # AP@[.5:.95] per AREA_RANGES bucket, None when the bucket has no GT box
+    ap_area: Dict[str, Optional[float]] = field(default_factory=dict)
+
+    @property
+    def ap50_95(self) -> float:
+        return float(np.mean(self.ap_sweep))
+
+    def ap_at(self, threshold: float) -> float:
+        return float(self.ap_sweep[np.flatnonzero(np.isclose(IOU_THRESHOLDS, threshold))[0]])
+
+
+def best_overlaps(labels: VocLabels, class_id: int):
+    """Rank the detections of ``class_id`` and find their best ground truth box.
+
+    Returns ``(order, ovmax, gt_match)``. This is the only O(pairs) step, so it
+    is computed once and can be reused for any number of IoU thresholds.
+    """
+    gt_sel = np.flatnonzero(labels.gt_classes == class_id)
+    gt_sel = gt_sel[np.argsort(labels.gt_images[gt_sel], kind='stable')]
+    gt_img = labels.gt_images[gt_sel]
+
+    dr_sel = np.flatnonzero(labels.dr_classes == class_id)
+    # sort detection-results by decreasing confidence, keeping file order for ties
+    order = dr_sel[np.argsort(-labels.dr_scores[dr_sel], kind='stable')]
+    n = len(order)
+
+    ovmax = np.full(n, -1.0)
+    gt_match = np.full(n, -1, dtype=np.int64)
+    if n == 0 or len(gt_sel) == 0:
+        return order, ovmax, gt_match
+
+    # join every detection with the GT rows of its image: GT rows of an image are
+    # contiguous in gt_sel, so each detection owns a [start, end) slice
+    dr_img = labels.dr_images[order]
+    start = np.searchsorted(gt_img, dr_img, side='left')
+    counts = np.searchsorted(gt_img, dr_img, side='right') - start
+    pair_dr = np.repeat(np.arange(n), counts)
+    offsets = np.arange(len(pair_dr)) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_gt = np.repeat(start, counts) + offsets
+    if len(pair_dr) == 0:
+        return order, ovmax, gt_match
+
+    iou = pair_iou(labels.dr_boxes[order[pair_dr]], labels.gt_boxes[gt_sel[pair_gt]])
+    # per detection keep the highest IoU, first GT in file order on ties
+    best = np.lexsort((pair_gt, -iou, pair_dr))
+    first = best[np.r_[True, pair_dr[best][1:] != pair_dr[best][:-1]]]
+    ovmax[pair_dr[first]] = iou[first]
+    hit = iou[first] >= 0
+    gt_match[pair_dr[first][hit]] = gt_sel[pair_gt[first][hit]]
+    return order, ovmax, gt_match
+
+
+def assign(labels: VocLabels, order: np.ndarray, ovmax: np.ndarray, gt_match: np.ndarray,
+           min_overlap: float, gt_ignore: Optional[np.ndarray] = None,
+           dr_ignore: Optional[np.ndarray] = None) -> ClassMatch:
+    """Resolve TP/FP for one IoU threshold.
+
+    A detection above ``min_overlap`` is a TP if it is the highest ranked one to
+    claim its GT box and a FP (repeated match) otherwise. Matches to difficult
+    (or ``gt_ignore``) boxes count as neither, and so do unmatched detections
+    flagged in ``dr_ignore`` (aligned with ``order``).
+    """
+    n = len(order)
+    hit = (ovmax >= min_overlap) & (gt_match >= 0)
+    ignored = labels.gt_difficult if gt_ignore is None else gt_ignore
+    dont_care = np.zeros(n, dtype=bool)
+    dont_care[hit] = ignored[gt_match[hit]]
+    if dr_ignore is not None:
+        dont_care |= ~hit & dr_ignore
+    candidates = np.flatnonzero(hit & ~dont_care)
+    tp = np.zeros(n, dtype=np.int64)
+    # np.unique returns the first (= highest ranked) claim of every GT box
+    _, first = np.unique(gt_match[candidates], return_index=True)
+    tp[candidates[first]] = 1
+    fp = (~dont_care).astype(np.int64) - tp
+    return ClassMatch(order, ovmax, gt_match, tp, fp)
+
+
+def sweep_ap(labels: VocLabels, class_id: int, order: np.ndarray, ovmax: np.ndarray,
+             gt_match: np.ndarray, gt_ignore: np.ndarray, dr_ignore: Optional[np.ndarray] = None):
+    """AP at every threshold of ``IOU_THRESHOLDS``, reusing one set of overlaps.
+
+    The detections are matched per threshold by :func:`assign`, like the
+    headline AP. Returns ``None`` when no GT box of the class survives
+    ``gt_ignore``.
+    """
+    n_gt = int(np.count_nonzero((labels.gt_classes == class_id) & ~gt_ignore))
+    if n_gt == 0:
+        return None
+    aps = np.empty(len(IOU_THRESHOLDS))
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        match = assign(labels, order, ovmax, gt_match, threshold, gt_ignore, dr_ignore)
+        prec, rec = precision_recall(match, n_gt)
+        aps[t] = voc_ap(rec, prec)[0]
+    return aps
+
+
+def precision_recall(match: ClassMatch, n_gt: int):
+    tp = np.cumsum(match.tp)
+    fp = np.cumsum(match.fp)
+    rec = tp / n_gt if n_gt else np.zeros(len(tp))
+    prec = np.zeros(len(tp))
+    np.divide(tp, tp + fp, out=prec, where=(tp + fp) > 0)
+    return prec, rec
+
+
+def evaluate(labels: VocLabels, min_overlap: float = MINOVERLAP,
+             class_iou: Optional[Dict[str, float]] = None) -> List[ClassResult]:
+    """Compute AP/precision/recall for every class that has ground truth.
+
+    Classes are returned in alphabetical order, like the original script.
+    ``class_iou`` overrides ``min_overlap`` for specific classes.
+    """
+    class_iou = class_iou or {}
+    counted = ~labels.gt_difficult
+    gt_area = box_area(labels.gt_boxes)
+    dr_area = box_area(labels.dr_boxes)
+    results = []
+    for class_name in sorted(labels.class_names):
+        class_id = labels.class_id(class_name)
+        gt_mask = counted & (labels.gt_classes == class_id)
+        n_gt = int(np.count_nonzero(gt_mask))
+        if n_gt == 0:
+            continue
+        n_images = len(np.unique(labels.gt_images[gt_mask]))
+
+        order, ovmax, gt_match = best_overlaps(labels, class_id)
+        match = assign(labels, order, ovmax, gt_match, class_iou.get(class_name, min_overlap))
+        prec, rec = precision_recall(match, n_gt)
+        ap, mrec, mprec = voc_ap(rec, prec)
+        lamr, _, _ = log_average_miss_rate(prec, rec, n_images)
+
+        # COCO-style metrics: the overlaps above are threshold independent, so
+        # the sweep and the size buckets only re-run the cheap assignment step
+        ap_sweep = sweep_ap(labels, class_id, order, ovmax, gt_match, labels.gt_difficult)
+        ap_area = {}
+        for area_name, (lo, hi) in AREA_RANGES.items():
+            gt_ignore = labels.gt_difficult | (gt_area < lo) | (gt_area >= hi)
+            dr_ignore = (dr_area[order] < lo) | (dr_area[order] >= hi)
+            aps = sweep_ap(labels, class_id, order, ovmax, gt_match, gt_ignore, dr_ignore)
+            ap_area[area_name] = None if aps is None else float(np.mean(aps))
+
+        results.append(ClassResult(
+            class_name=class_name, ap=ap, precision=prec, recall=rec, mrec=mrec, mprec=mprec,
+            tp=int(match.tp.sum()), fp=int(match.fp.sum()), n_gt=n_gt, n_images=n_images,
+            lamr=lamr, match=match, ap_sweep=ap_sweep, ap_area=ap_area))
+    return results
+
+
+def detection_counts(labels: VocLabels) -> Dict[str, int]:
+    counts = np.bincount(labels.dr_classes, minlength=len(labels.class_names))
+    return {name: int(counts[i]) for i, name in enumerate(labels.class_names) if counts[i] > 0}
+
+
+def gt_counts(labels: VocLabels) -> Dict[str, int]:
+    counts = np.bincount(labels.gt_classes[~labels.gt_difficult], minlength=len(labels.class_names))
+    return {name: int(counts[i]) for i, name in enumerate(labels.class_names) if counts[i] > 0}
+
+
+def _mean(values) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def coco_metrics(result: ClassResult) -> dict:
+    metrics = {
+        'AP50': result.ap_at(0.5),
+        'AP75': result.ap_at(0.75),
+        'AP50_95': result.ap50_95,
+    }
+    for area_name in AREA_RANGES:
+        metrics['AP_' + area_name] = result.ap_area.get(area_name)
+    return metrics
+
+
+def to_json_data(results: List[ClassResult]) -> dict:
+    """Build the ``all_class_AP.json`` document.
+
+    Besides the VOC AP at the configured threshold every class carries
+    ``AP50``/``AP75``/``AP50_95`` and ``AP_small``/``AP_medium``/``AP_large``
+    (``null`` when the class has no GT box of that size); ``_statistics`` holds
+    their class means as ``mAP50``, ``mAP50_95``, ``mAP_small``...
+    """
+    total_tp = sum(r.tp for r in results)
+    total_fp = sum(r.fp for r in results)
+    total_gt = sum(r.n_gt for r in results)
+    precision = total_tp / (total_tp + total_fp) if total_tp + total_fp else 0.0
+    recall = total_tp / total_gt if total_gt else 0.0
+    json_data = {
+        '_statistics': {
+            'TP': total_tp,
+            'FP': total_fp,
+            'F1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            'mAP': sum(r.ap for r in results) / len(results) if results else 0.0,
+            'precision': precision,
+            'recall': recall,
+        }
+        # each class will have its own dictionary
+    }
+    class_metrics = [coco_metrics(r) for r in results]
+    for key in ('AP50', 'AP75', 'AP50_95') + tuple('AP_' + area_name for area_name in AREA_RANGES):
+        json_data['_statistics']['m' + key] = _mean(m[key] for m in class_metrics)
+    for r, metrics in zip(results, class_metrics):
+        json_data[r.class_name] = {
+            'precision': r.precision.tolist(),
+            'recall': r.recall.tolist(),
+            'AP': r.ap,
+            'TP': r.tp,
+            'FP': r.fp,
+            'total_images': r.n_images,
+            'log_average_miss_rate': r.lamr,
+            **metrics,
+        }
+    return json_data
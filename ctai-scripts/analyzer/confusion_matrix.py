@@ -5,6 +5,8 @@ import argparse
 import yaml
 import json
 
+import ap_engine
+
 
 def box_iou_calc(boxes1, boxes2):
     def box_area(box):
@@ -21,80 +23,122 @@ def box_iou_calc(boxes1, boxes2):
 
 
 class ConfusionMatrix:
+    """Confusion matrix of a test split; ``matrix[pred_class][gt_class]``, the last
+    row/column being the background (FN/FP).
+
+    Cell entries are not kept as Python objects: every ``process_batch`` call
+    appends one block of NumPy columns (cell, image index, gt/pred row index,
+    boxes) which are only concatenated and grouped per cell when the matrix is
+    returned.
+    """
+
     def __init__(self, num_classes: int, CONF_THRESHOLD, IOU_THRESHOLD):
-        self.matrix = [[[] for _ in range(num_classes + 1)]
-                       for _ in range(num_classes + 1)]
         self.num_classes = num_classes
         self.CONF_THRESHOLD = CONF_THRESHOLD
         self.IOU_THRESHOLD = IOU_THRESHOLD
+        self.images = []
+        self._blocks = []
 
-    def process_batch(self, detections, labels: np.ndarray, image_path: str):
-
-        try:
-            gt_classes = labels[:, 0].astype(np.int16)
-        except (IndexError, TypeError):
-            # labels are empty, end of process, add all to FN
-            if (len(detections) == 0):
-                return
-            detections = detections[detections[:, 4] > self.CONF_THRESHOLD]
-            for i, detection in enumerate(detections):
-                detection_class = detections[i][5].astype(np.int16)
-                self.matrix[detection_class][self.num_classes].append(
-                    {"gtIdx": None, "pdIdx": i, "img": image_path, "gtBbox": None, "pdBbox": detections[i][:5].tolist()})  # FP
-            return
-
-        try:
-            detections = detections[detections[:, 4] >= self.CONF_THRESHOLD]
-        except (IndexError, TypeError):
-            # detections are empty, end of process
-            for i, label in enumerate(labels):
-                gt_class = gt_classes[i]
-                self.matrix[self.num_classes][gt_class].append(
-                    # FN: add with None for det_bbox_idx
-                    {"gtIdx": i,  "pdIdx": None,  "img": image_path, "gtBbox": labels[i][1:].tolist(), "pdBbox": None})
+    def _append(self, pred_classes, gt_classes, gt_idx, pd_idx, gt_boxes, pd_boxes):
+        n = len(pred_classes)
+        if n == 0:
             return
+        self._blocks.append((
+            pred_classes.astype(np.int64) * (self.num_classes + 1) + gt_classes.astype(np.int64),
+            np.full(n, len(self.images) - 1, dtype=np.int64),
+            gt_idx.astype(np.int64), pd_idx.astype(np.int64),
+            gt_boxes.astype(np.int64), pd_boxes.astype(np.float64)))
 
-        detection_classes = detections[:, 5].astype(np.int16)
-        all_ious = box_iou_calc(labels[:, 1:], detections[:, :4])
-        want_idx = np.where(all_ious > self.IOU_THRESHOLD)
-        all_matches = [[want_idx[0][i], want_idx[1][i], all_ious[want_idx[0]
-                                                                 [i], want_idx[1][i]]] for i in range(want_idx[0].shape[0])]
-        all_matches = np.array(all_matches)
-        if all_matches.shape[0] > 0:
-            all_matches = all_matches[all_matches[:, 2].argsort()[::-1]]
-            all_matches = all_matches[np.unique(
-                all_matches[:, 1], return_index=True)[1]]
-            all_matches = all_matches[all_matches[:, 2].argsort()[::-1]]
-            all_matches = all_matches[np.unique(
-                all_matches[:, 0], return_index=True)[1]]
-
-        for i, label in enumerate(labels):
-            gt_class = gt_classes[i]
-            if all_matches.shape[0] > 0 and all_matches[all_matches[:, 0] == i].shape[0] == 1:
-                detection_index = int(
-                    all_matches[all_matches[:, 0] == i, 1][0])
-                detection_class = detection_classes[detection_index]
-                self.matrix[detection_class][gt_class].append({"gtIdx": int(gt_class), "pdIdx": int(
-                    detection_class), "img": image_path, "gtBbox": labels[i][1:].tolist(), "pdBbox": detections[detection_index][:5].tolist()})  # TP
-            else:
-                self.matrix[self.num_classes][gt_class].append({"gtIdx": int(
-                    gt_class), "pdIdx": None, "img": image_path, "gtBbox": labels[i][1:].tolist(), "pbBbox": None})  # FN
-
-        for i, detection in enumerate(detections):
-            if not all_matches.shape[0] or (all_matches.shape[0] and all_matches[all_matches[:, 1] == i].shape[0] == 0):
-                detection_class = detection_classes[i]
-                self.matrix[detection_class][self.num_classes].append(
-                    {"gtIdx": None, "pdIdx": int(detection_class), "img": image_path,
-                     "gtBbox": None, "pdBbox": detections[i][:5].tolist()})
+    def process_batch(self, detections, labels: np.ndarray, image_path: str):
+        """Add one image; ``detections`` rows are ``x1 y1 x2 y2 conf class`` and
+        ``labels`` rows are ``class x1 y1 x2 y2``, either may be empty."""
+        self.images.append(image_path)
+        labels = np.asarray(labels).reshape(-1, 5)
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+        background = self.num_classes
+
+        # indices into the original prediction rows are kept for the UI
+        pd_idx = np.nonzero(detections[:, 4] >= self.CONF_THRESHOLD)[0]
+        detections = detections[pd_idx]
+        gt_classes = labels[:, 0].astype(np.int64)
+        detection_classes = detections[:, 5].astype(np.int64)
+
+        # greedy matching: each detection keeps its best GT above the IoU
+        # threshold, then each GT keeps its best remaining detection
+        gt_to_det = np.full(len(labels), -1, dtype=np.int64)
+        if len(labels) and len(detections):
+            all_ious = box_iou_calc(labels[:, 1:], detections[:, :4])
+            gt_i, det_i = np.nonzero(all_ious > self.IOU_THRESHOLD)
+            all_matches = np.stack([gt_i, det_i, all_ious[gt_i, det_i]], axis=1)
+            if all_matches.shape[0] > 0:
+                all_matches = all_matches[all_matches[:, 2].argsort()[::-1]]
+                all_matches = all_matches[np.unique(
+                    all_matches[:, 1], return_index=True)[1]]
+                all_matches = all_matches[all_matches[:, 2].argsort()[::-1]]
+                all_matches = all_matches[np.unique(
+                    all_matches[:, 0], return_index=True)[1]]
+                gt_to_det[all_matches[:, 0].astype(np.int64)] = all_matches[:, 1].astype(np.int64)
+
+        matched = gt_to_det >= 0
+        det_matched = np.zeros(len(detections), dtype=bool)
+        det_matched[gt_to_det[matched]] = True
+
+        # TP and misclassified: GT matched with a detection
+        tp_det = gt_to_det[matched]
+        self._append(detection_classes[tp_det], gt_classes[matched], np.nonzero(matched)[0], pd_idx[tp_det],
+                     labels[matched, 1:], detections[tp_det, :5])
+        # FN: GT without detection
+        fn = ~matched
+        self._append(np.full(fn.sum(), background), gt_classes[fn], np.nonzero(fn)[0], np.full(fn.sum(), -1),
+                     labels[fn, 1:], np.zeros((fn.sum(), 5)))
+        # FP: detection without GT
+        fp = ~det_matched
+        self._append(detection_classes[fp], np.full(fp.sum(), background), np.full(fp.sum(), -1), pd_idx[fp],
+                     np.zeros((fp.sum(), 4)), detections[fp, :5])
+
+    def _columns(self):
+        if not self._blocks:
+            return (np.zeros(0, dtype=np.int64),) * 4 + (np.zeros((0, 4), dtype=np.int64), np.zeros((0, 5)))
+        return tuple(np.concatenate(column) for column in zip(*self._blocks))
+
+    def counts(self) -> np.ndarray:
+        size = self.num_classes + 1
+        return np.bincount(self._columns()[0], minlength=size * size).reshape(size, size)
 
     def return_matrix(self):
-        return self.matrix
+        """``matrix[pred_class][gt_class]`` as columnar cells:
+        ``{"img": [...], "gtIdx": [...], "pdIdx": [...], "gtBbox": [...], "pdBbox": [...]}``.
+
+        ``img`` indexes ``self.images``, ``gtIdx``/``pdIdx`` are the line numbers in
+        the ground truth/prediction label file of that image. Columns that do not
+        apply to a cell (GT of a background column, prediction of a background row)
+        are empty lists.
+        """
+        size = self.num_classes + 1
+        cells, images, gt_idx, pd_idx, gt_boxes, pd_boxes = self._columns()
+        order = np.argsort(cells, kind='stable')
+        bounds = np.searchsorted(cells[order], np.arange(size * size + 1))
+        matrix = []
+        for pred_class in range(size):
+            row = []
+            for gt_class in range(size):
+                cell = pred_class * size + gt_class
+                sel = order[bounds[cell]:bounds[cell + 1]]
+                has_gt = gt_class != self.num_classes
+                has_pd = pred_class != self.num_classes
+                row.append({
+                    "img": images[sel].tolist(),
+                    "gtIdx": gt_idx[sel].tolist() if has_gt else [],
+                    "pdIdx": pd_idx[sel].tolist() if has_pd else [],
+                    "gtBbox": gt_boxes[sel].tolist() if has_gt else [],
+                    "pdBbox": pd_boxes[sel].tolist() if has_pd else [],
+                })
+            matrix.append(row)
+        return matrix
 
     def print_matrix(self):
-        for i in range(self.num_classes + 1):
-            for j in range(self.num_classes + 1):
-                print(f"{len(self.matrix[i][j])}",
-                      end='\n' if j == self.num_classes else ' ')
+        for row in self.counts():
+            print(' '.join(str(count) for count in row))
 
 # Example of using the updated ConfusionMatrix class
 # det = np.array([[349, 832, 470, 907, 0.9968715906143188, 0], [469, 789, 676, 886, 0.9854957461357117, 0], [759, 887, 907, 1065, 0.9964740872383118, 4], [1234, 736, 1341, 757, 0.7642012238502502, 11], [1683, 513, 1759, 556, 0.8026162385940552, 13], [1883, 438, 1919, 503, 0.7332593202590942, 13], [478, 293, 514, 338, 0.70100337266922, 13]])
@@ -163,7 +207,7 @@ def process_directory(dataset_dir, pred_dir, gt_dir):
     if not os.path.isfile(test_file):
         ValueError(f"{test_file} not found.")
 
-    with open(os.path.join(args.dataset_dir, 'dataset.yaml'),  'r') as f:
+    with open(os.path.join(dataset_dir, 'dataset.yaml'),  'r') as f:
         valuesYaml = yaml.load(f, Loader=yaml.FullLoader)
         class_mapping = valuesYaml['names']
         reversed_class_mapping = {v: k for k, v in class_mapping.items()}
@@ -184,6 +228,79 @@ def process_directory(dataset_dir, pred_dir, gt_dir):
     return gt, det, class_mapping
 
 
+def load_packed(dataset_dir, packed_file):
+    """Same as `process_directory`, but from the voc_labels.npz written by `yolo_to_voc.py --packed`."""
+    with open(os.path.join(dataset_dir, 'dataset.yaml'),  'r') as f:
+        class_mapping = yaml.load(f, Loader=yaml.FullLoader)['names']
+    reversed_class_mapping = {v: k for k, v in class_mapping.items()}
+
+    labels = ap_engine.load_npz(packed_file)
+    class_ids = np.array([reversed_class_mapping[name] for name in labels.class_names], dtype=np.int64)
+    image_index = {file_id: i for i, file_id in enumerate(labels.file_ids)}
+
+    def split_per_image(rows, images):
+        order = np.argsort(images, kind='stable')
+        bounds = np.searchsorted(images[order], np.arange(1, len(labels.file_ids)))
+        return np.split(rows[order], bounds)
+
+    # `class_id x1 y1 x2 y2` and `x1 y1 x2 y2 conf class_id`, like parse_txt_file
+    gt_rows = split_per_image(
+        np.column_stack([class_ids[labels.gt_classes], labels.gt_boxes]).astype(np.int64), labels.gt_images)
+    det_rows = split_per_image(
+        np.column_stack([labels.dr_boxes, labels.dr_scores, class_ids[labels.dr_classes]]), labels.dr_images)
+
+    gt = {}
+    det = {}
+    with open(os.path.join(dataset_dir, 'test.txt'), 'r', encoding='utf-8') as file:
+        for line in file:
+            image_path = line.strip()
+            if not image_path:
+                continue
+            image_name, image_ext = os.path.splitext(os.path.basename(image_path))
+            i = image_index[image_name]
+            gt[f'{image_name}{image_ext}'] = gt_rows[i] if len(gt_rows[i]) else np.array([])
+            det[f'{image_name}{image_ext}'] = det_rows[i] if len(det_rows[i]) else np.array([])
+    return gt, det, class_mapping
+
+
+def load_from_context(context):
+    """Same as `process_directory`, but from the arrays already loaded in an AnalysisContext."""
+    gt = {}
+    det = {}
+    for image_name, image_ext in context.test_images:
+        gt_rows = context.gt[image_name]
+        pred_rows = context.pred[image_name]
+        # `class_id x1 y1 x2 y2` and `x1 y1 x2 y2 conf class_id`, empty arrays like parse_txt_file
+        gt[f'{image_name}.{image_ext}'] = gt_rows.astype(np.int64) if len(gt_rows) else np.array([])
+        det[f'{image_name}.{image_ext}'] = pred_rows[:, [1, 2, 3, 4, 5, 0]] if len(pred_rows) else np.array([])
+    return gt, det, context.class_mapping
+
+
+def read_conf_threshold(conf_threshold_file, default=0.3):
+    # try read confidence threshold from results.json file, if failed, use default value
+    try:
+        with open(conf_threshold_file, 'r') as f:
+            results = json.load(f)
+            return float(results["all"]['conf_threshold'])
+    except:
+        print('Failed to read confidence threshold from results.json file, using default value')
+        return default
+
+
+def compute_confusion_matrix(ground_truths, detections, class_mapping, conf_threshold, iou_threshold):
+    CM = ConfusionMatrix(num_classes=len(
+        class_mapping), CONF_THRESHOLD=conf_threshold, IOU_THRESHOLD=iou_threshold)
+    for image_path in detections:
+        CM.process_batch(detections[image_path],
+                         ground_truths[image_path], image_path)
+    return CM
+
+
+def save_confusion_matrix(CM, class_mapping, output_dir):
+    with open(os.path.join(output_dir, 'confusion_matrix.json'), 'w') as f:
+        json.dump({'images': CM.images, 'confusion_matrix': CM.return_matrix(), 'class_mapping': class_mapping}, f)
+
+
 '''
         Confusion Matrix
                      ^
@@ -207,6 +324,8 @@ if __name__ == "__main__":
                         default='truth', help='ground truth directory name')
     parser.add_argument('--output-dir', type=str,
                         default='/workspace/results/analysis_results', help='output directory')
+    parser.add_argument('--packed', action='store_true',
+                        help='read the label dir\'s voc_labels.npz (yolo_to_voc.py --packed) instead of the txt files')
     parser.add_argument('--IOU_THRESHOLD', type=float,
                         default=0.6, help='IoU threshold')
 
@@ -218,41 +337,27 @@ if __name__ == "__main__":
     if (not os.path.exists(args.output_dir)):
         os.makedirs(args.output_dir)
 
-    # try read confidence threshold from results.json file, if failed, use value from args
-    try:
-        with open(args.conf_threshold_file, 'r') as f:
-            results = json.load(f)
-            args.CONF_THRESHOLD = float(results["all"]['conf_threshold'])
-            f.close()
-    except:
-        print('Failed to read confidence threshold from results.json file, using default value')
-        args.CONF_THRESHOLD = 0.3
-        pass
-
-    pred_label_path = os.path.join(args.label_dir, args.pred_dir_name)
-    gt_label_path = os.path.join(args.label_dir, args.gt_dir_name)
-    # Process the test directory and print the results
-    ground_truths, detections, class_mapping = process_directory(
-        args.dataset_dir, pred_label_path, gt_label_path)
-    # print(ground_truths)
-    # print(detections)
-
-    CM = ConfusionMatrix(num_classes=len(
-        class_mapping), CONF_THRESHOLD=args.CONF_THRESHOLD, IOU_THRESHOLD=args.IOU_THRESHOLD)
-    for image_path in detections:
-        CM.process_batch(detections[image_path],
-                         ground_truths[image_path], image_path)
-
-    cm = CM.return_matrix()
+    if args.CONF_THRESHOLD is None:
+        args.CONF_THRESHOLD = read_conf_threshold(args.conf_threshold_file)
+
+    if args.packed:
+        ground_truths, detections, class_mapping = load_packed(
+            args.dataset_dir, os.path.join(args.label_dir, ap_engine.PACKED_FILE))
+    else:
+        pred_label_path = os.path.join(args.label_dir, args.pred_dir_name)
+        gt_label_path = os.path.join(args.label_dir, args.gt_dir_name)
+        # Process the test directory and print the results
+        ground_truths, detections, class_mapping = process_directory(
+            args.dataset_dir, pred_label_path, gt_label_path)
+
+    CM = compute_confusion_matrix(ground_truths, detections, class_mapping,
+                                  args.CONF_THRESHOLD, args.IOU_THRESHOLD)
     CM.print_matrix()
     print(class_mapping)
-    # print(cm)
-    with open(os.path.join(args.output_dir, 'confusion_matrix.json'), 'w') as f:
-        json.dump({'confusion_matrix': cm, 'class_mapping': class_mapping}, f)
-        f.close()
+    save_confusion_matrix(CM, class_mapping, args.output_dir)
 
-# each cell in confusion matrix will be: [gt_class, pred_class, image_path, gt_bbox, pred_bbox]
-# , where gt_class and pred_class are the class ids, image_path is the path to the image, gt_bbox are the format [x1, y1, x2, y2] and pred_bbox are the format [x1, y1, x2, y2, confidence]
+# confusion_matrix.json: {"images": [image_name, ...], "confusion_matrix": matrix[pred_class][gt_class], "class_mapping": {...}}
+# each cell is columnar: {"img": [image index], "gtIdx": [...], "pdIdx": [...], "gtBbox": [[x1, y1, x2, y2]], "pdBbox": [[x1, y1, x2, y2, confidence]]}
 # python confusion_matrix.py --dataset-dir /home/hsnl/crazyfire/docker-testing/datasets/project-1/version-4/dataset --label-dir /home/hsnl/crazyfire/docker-testing/results/project_1/version_4/mAP/input --output-dir /home/hsnl/crazyfire/docker-testing/results/project-1/version-4/analysis_results
 
 # in container:
@@ -1,34 +1,13 @@
 import glob
 import os
 import argparse
-import yaml
 import json
-import imagesize
-
-def convert_yolo_coordinates_to_voc(x_c_n, y_c_n, width_n, height_n, img_width, img_height):
-    ## remove normalization given the size of the image
-    x_c = float(x_c_n) * img_width
-    y_c = float(y_c_n) * img_height
-    width = float(width_n) * img_width
-    height = float(height_n) * img_height
-    ## compute half width and half height
-    half_width = width / 2
-    half_height = height / 2
-    ## compute left, top, right, bottom
-    ## in the official VOC challenge the top-left pixel in the image has coordinates (1;1)
-    left = int(x_c - half_width) + 1
-    top = int(y_c - half_height) + 1
-    right = int(x_c + half_width) + 1
-    bottom = int(y_c + half_height) + 1
-    return left, top, right, bottom
-
-parser = argparse.ArgumentParser(description='')
-parser.add_argument('--dataset-dir', '-d' ,type=str, help='dataset dir', default='/workspace/dataset')
-parser.add_argument('--output-dir', '-o', type=str, help='output dir',default='/workspace/results/analysis_results')
-args = parser.parse_args()
-
-if(os.path.exists(args.output_dir) == False):
-    os.makedirs(args.output_dir)
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from analysis_context import AnalysisContext, yolo_to_voc_boxes
+from image_size_index import CHUNK_SIZE
 
 #   const data = {
 #     imagesCount: 387,
@@ -46,66 +25,142 @@ if(os.path.exists(args.output_dir) == False):
 #     },
 #   }
 
-data = {}
-data['annotationsCount'] = 0
-data['ratio'] = {}
-data['nullExamples'] = []
-data['trainSplit'] = {}
-data['classDistribution'] = {}
-
-# tmp lists to store the ratios for statistics
-img_ratios = []
-annotation_ratios = []
-img_files = glob.glob(os.path.join(args.dataset_dir, "images", "*"))
-
-data['imagesCount'] = len(img_files)
-
-# print('img_files:', img_files)
-
-# statistics for the train split
-with open(os.path.join(args.dataset_dir, 'train.txt'), 'r') as f:
-    data['trainSplit']['train'] = len(f.readlines())
-with open(os.path.join(args.dataset_dir, 'val.txt'), 'r') as f:
-    data['trainSplit']['validation'] = len(f.readlines())
-with open(os.path.join(args.dataset_dir, 'test.txt'), 'r') as f:
-    data['trainSplit']['test'] = len(f.readlines())
-
-with open(os.path.join(args.dataset_dir, 'dataset.yaml'),  'r') as f:
-    valuesYaml = yaml.load(f, Loader=yaml.FullLoader)
-    class_mapping = valuesYaml['names']
-    print(class_mapping)
-    
-for img_file in img_files:
-    label_file = os.path.join(args.dataset_dir, 'labels', os.path.basename(os.path.splitext(img_file)[0] + '.txt'))
-    img_width, img_height = imagesize.get(img_file)
-    img_ratios.append({'w': img_width, 'h': img_height, 'img': img_file})
-    with open(label_file, 'r') as f:
-        lines = f.readlines()
+def check_labels(label_files, img_sizes):
+    """Parse the label files of a chunk of images (run in a worker process).
+
+    Returns the indexes (in the chunk) of the images without annotation and
+    compact per-annotation arrays: image index, class id and VOC box.
+    """
+    null_examples = []
+    img_idx = []
+    classes = []
+    boxes = []
+    for i, (label_file, (img_width, img_height)) in enumerate(zip(label_files, img_sizes)):
+        with open(label_file, 'r') as f:
+            lines = [line.split() for line in f if line.strip()]
         if len(lines) == 0:
-            data['nullExamples'].append(label_file)
-        else:
-            data['annotationsCount'] += len(lines)
-            for line in lines:
-                # line = "class_id x_center y_center width height"
-                class_name = class_mapping[int(line.split()[0])]
-                if class_name not in data['classDistribution']:
-                    data['classDistribution'][class_name] = 1
-                else:
-                    data['classDistribution'][class_name] += 1
-                
-                left, top, right, bottom = convert_yolo_coordinates_to_voc(*line.split()[1:], img_width, img_height)
-                annotation_ratios.append({'w': right - left, 'h': bottom - top, 'bbox': f'{class_name} {left} {top} {right} {bottom}', 'img': img_file})
-
-sorted_img_ratios = sorted(img_ratios, key=lambda x: x['w'] * x['h'])
-sorted_annotation_ratios = sorted(annotation_ratios, key=lambda x: x['w'] * x['h'])
-
-data['ratio']['image'] = { 'median': sorted_img_ratios[len(sorted_img_ratios) // 2], 'largest': sorted_img_ratios[-1], 'smallest': sorted_img_ratios[0] }
-data['ratio']['annotation'] = { 'median': sorted_annotation_ratios[len(sorted_annotation_ratios) // 2], 'largest': sorted_annotation_ratios[-1], 'smallest': sorted_annotation_ratios[0] }
-
-# store the data in a json file to output_dir
-with open(os.path.join(args.output_dir, 'dataset_check.json'), 'w') as f:
-    json.dump(data, f)
-
-print("dataset check generated successfully!")
+            null_examples.append(i)
+            continue
+        # line = "class_id x_center y_center width height"
+        rows = np.array([parts[:5] for parts in lines], dtype=np.float64)
+        img_idx.append(np.full(len(rows), i, dtype=np.int32))
+        classes.append(rows[:, 0].astype(np.int32))
+        boxes.append(yolo_to_voc_boxes(rows[:, 1:5], img_width, img_height).astype(np.int32))
+    if not img_idx:
+        return null_examples, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.int32)
+    return null_examples, np.concatenate(img_idx), np.concatenate(classes), np.concatenate(boxes)
+
+
+def stable_select(keys, k):
+    """Index of the k-th item of ``sorted(range(len(keys)), key=keys.__getitem__)``
+    (a stable sort, ties keep their order) without sorting."""
+    value = np.partition(keys, k)[k]
+    return np.flatnonzero(keys == value)[k - np.count_nonzero(keys < value)]
+
+
+def ratio_summary(w, h, describe):
+    """median/largest/smallest by area, same picks as a stable sort of the items by ``w * h``."""
+    areas = w.astype(np.int64) * h
+    if len(areas) == 0:
+        return None
+    picks = {'median': len(areas) // 2, 'largest': len(areas) - 1, 'smallest': 0}
+    return {name: describe(int(stable_select(areas, k))) for name, k in picks.items()}
+
+
+def check_dataset(context, workers=None):
+    """Collect the dataset statistics; image sizes come from the context's image size index.
+
+    Label files are parsed by ``workers`` processes (all CPUs by default, 1 runs in-process)
+    and annotations are only kept as compact arrays.
+    """
+    dataset_dir = context.dataset_dir
+    class_mapping = context.class_mapping
+
+    data = {}
+    data['annotationsCount'] = 0
+    data['ratio'] = {}
+    data['nullExamples'] = []
+    data['trainSplit'] = {}
+    data['classDistribution'] = {}
+
+    img_files = glob.glob(os.path.join(dataset_dir, "images", "*"))
+    label_files = [os.path.join(dataset_dir, 'labels', os.path.basename(os.path.splitext(img_file)[0] + '.txt'))
+                   for img_file in img_files]
+
+    data['imagesCount'] = len(img_files)
+
+    # statistics for the train split
+    with open(os.path.join(dataset_dir, 'train.txt'), 'r') as f:
+        data['trainSplit']['train'] = len(f.readlines())
+    with open(os.path.join(dataset_dir, 'val.txt'), 'r') as f:
+        data['trainSplit']['validation'] = len(f.readlines())
+    data['trainSplit']['test'] = len(context.test_images)
+
+    img_sizes = context.image_sizes.get_many(img_files, workers)
+    tasks = [(label_files[start:start + CHUNK_SIZE], img_sizes[start:start + CHUNK_SIZE])
+             for start in range(0, len(img_files), CHUNK_SIZE)]
+    if workers == 1 or len(tasks) <= 1:
+        results = [check_labels(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(check_labels, *zip(*tasks)))
+
+    img_idx, classes, boxes = [], [], []
+    for chunk_idx, (null_examples, chunk_img_idx, chunk_classes, chunk_boxes) in enumerate(results):
+        offset = chunk_idx * CHUNK_SIZE
+        data['nullExamples'].extend(label_files[offset + i] for i in null_examples)
+        img_idx.append(chunk_img_idx + offset)
+        classes.append(chunk_classes)
+        boxes.append(chunk_boxes)
+    img_idx = np.concatenate(img_idx) if img_idx else np.zeros(0, dtype=np.int32)
+    classes = np.concatenate(classes) if classes else np.zeros(0, dtype=np.int32)
+    boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.int32)
+    data['annotationsCount'] = len(classes)
+
+    # class names in order of first appearance
+    class_ids, first_seen, counts = np.unique(classes, return_index=True, return_counts=True)
+    for i in np.argsort(first_seen):
+        data['classDistribution'][class_mapping[int(class_ids[i])]] = int(counts[i])
+
+    img_w = np.array([size[0] for size in img_sizes], dtype=np.int64)
+    img_h = np.array([size[1] for size in img_sizes], dtype=np.int64)
+    data['ratio']['image'] = ratio_summary(
+        img_w, img_h, lambda i: {'w': int(img_w[i]), 'h': int(img_h[i]), 'img': img_files[i]})
+
+    ann_w = boxes[:, 2] - boxes[:, 0]
+    ann_h = boxes[:, 3] - boxes[:, 1]
+
+    def describe_annotation(i):
+        left, top, right, bottom = (int(v) for v in boxes[i])
+        return {'w': int(ann_w[i]), 'h': int(ann_h[i]),
+                'bbox': f'{class_mapping[int(classes[i])]} {left} {top} {right} {bottom}',
+                'img': img_files[img_idx[i]]}
+
+    data['ratio']['annotation'] = ratio_summary(ann_w, ann_h, describe_annotation)
+    return data
+
+
+def save_dataset_check(data, output_dir):
+    # store the data in a json file to output_dir
+    with open(os.path.join(output_dir, 'dataset_check.json'), 'w') as f:
+        json.dump(data, f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--dataset-dir', '-d' ,type=str, help='dataset dir', default='/workspace/dataset')
+    parser.add_argument('--output-dir', '-o', type=str, help='output dir',default='/workspace/results/analysis_results')
+    parser.add_argument('--workers', '-w', type=int, help='worker processes, default: number of CPUs', default=None)
+    args = parser.parse_args()
+
+    if(os.path.exists(args.output_dir) == False):
+        os.makedirs(args.output_dir)
+
+    context = AnalysisContext(args.dataset_dir)
+    print(context.class_mapping)
+    save_dataset_check(check_dataset(context, args.workers), args.output_dir)
+    context.save_image_size_index()
+
+    print("dataset check generated successfully!")
 
 # python dataset_check.py --dataset-dir /home/hsnl/crazyfire/docker-testing/datasets/project-1/version-4/dataset --output-dir /home/hsnl/crazyfire/docker-testing/results/project-1/version-4/analysis_results
\ No newline at end of file
@@ -0,0 +1,94 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import imagesize
+
+# image sizes of a dataset, stored next to dataset.yaml so that every analysis
+# run (and every script of a run) reads the image headers only once
+INDEX_FILE = '.image_size_index.json'
+# images per task when reading headers in a process pool
+CHUNK_SIZE = 512
+
+
+def read_image_sizes(img_paths: Sequence[str]) -> List[Tuple[int, int]]:
+    return [imagesize.get(img_path) for img_path in img_paths]
+
+
+def chunks(items: Sequence, size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ImageSizeIndex:
+    """``path -> (width, height)`` cache of a dataset, persisted in ``INDEX_FILE``.
+
+    Entries are keyed by the path relative to the dataset dir and store the
+    file mtime; an entry whose image changed since it was read is read again.
+    """
+
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir = dataset_dir
+        self.path = os.path.join(dataset_dir, INDEX_FILE)
+        self._entries: Dict[str, List[int]] = {}
+        self._dirty = False
+        try:
+            with open(self.path, 'r') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _key(self, img_path: str) -> str:
+        return os.path.relpath(img_path, self.dataset_dir)
+
+    def _cached(self, img_path: str, mtime: int) -> Optional[Tuple[int, int]]:
+        entry = self._entries.get(self._key(img_path))
+        if entry is not None and entry[2] == mtime:
+            return entry[0], entry[1]
+        return None
+
+    def _store(self, img_path: str, mtime: int, size: Tuple[int, int]):
+        self._entries[self._key(img_path)] = [size[0], size[1], mtime]
+        self._dirty = True
+
+    def get(self, img_path: str) -> Tuple[int, int]:
+        mtime = os.stat(img_path).st_mtime_ns
+        size = self._cached(img_path, mtime)
+        if size is None:
+            size = imagesize.get(img_path)
+            self._store(img_path, mtime, size)
+        return size
+
+    def get_many(self, img_paths: Sequence[str], workers: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Sizes of ``img_paths`` in order; images missing from the index are
+        read by ``workers`` processes (all CPUs by default, 1 reads in-process)."""
+        mtimes = [os.stat(img_path).st_mtime_ns for img_path in img_paths]
+        sizes = [self._cached(img_path, mtime) for img_path, mtime in zip(img_paths, mtimes)]
+        stale = [i for i, size in enumerate(sizes) if size is None]
+        if not stale:
+            return sizes
+
+        stale_paths = [img_paths[i] for i in stale]
+        if workers == 1 or len(stale_paths) <= CHUNK_SIZE:
+            read = read_image_sizes(stale_paths)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                read = [size for chunk in executor.map(read_image_sizes, chunks(stale_paths)) for size in chunk]
+        for i, size in zip(stale, read):
+            sizes[i] = size
+            self._store(img_paths[i], mtimes[i], size)
+        return sizes
+
+    def save(self):
+        if not self._dirty:
+            return
+        # the dataset dir may be mounted read-only, the index is only a cache
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Failed to save image size index {self.path}: {e}")
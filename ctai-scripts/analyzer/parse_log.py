@@ -1,5 +1,6 @@
 import argparse
 import csv
+import fcntl
 import glob
 import json
 import os
@@ -31,9 +32,27 @@ parser.add_argument(
     required=True,
     choices=["yolov5", "tflite"],
 )
+parser.add_argument(
+    "--full",
+    action="store_true",
+    help="ignore the saved cursor and parse the whole log again",
+)
 
 args = parser.parse_args()
 
+# cap of records decoded per invocation, the next cron run resumes from the cursor
+MAX_RECORDS_PER_RUN = 1000000
+# cursor and parsed state kept between cron runs, see LogParser.load_state
+STATE_FILE = ".parse_log_state.json"
+LOCK_FILE = ".parse_log.lock"
+# parsed members restored from the state file, train_metrics of yolov5 is
+# rebuilt from results.csv in post_process on every run
+STATE_MEMBERS = ["ETA", "cur_epoch", "total_epoch", "start_at", "system_metrics"]
+
+YOLOV5_ETA_PATTERN = re.compile(r"^(\d+)/(\d+)\s.*\s(\d+)%\|.*?(\d+:\d+[\d:]*)<(\d+:\d+[\d:]*)")
+TFLITE_EPOCH_PATTERN = re.compile(r"Epoch (\d+)/")
+TFLITE_METRIC_PATTERN = re.compile(r"ETA: ((?:[\d]+:)?[\d]{1,2}:[\d]{2}|[\d]+s)|(\w+): ([\d\.]+)")
+
 """
 the structure of the train_metrics:
 {
@@ -63,14 +82,58 @@ class LogParser:
         self.start_at = None
         self.duration = None
         self.complete_at = None
+        self.log_file = None
+        # byte offset in the datastore right after the last fully parsed record
+        self.offset = None
+
+    def state_path(self):
+        return os.path.join(self.args.out_dir, STATE_FILE)
+
+    def load_state(self):
+        """Restore the cursor and parsed members saved by the previous run, if
+        they belong to the current log file and the file did not shrink."""
+        try:
+            with open(self.state_path(), "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (
+            state.get("model_type") != self.args.model_type
+            or state.get("log_file") != os.path.realpath(self.log_file)
+            or state.get("offset", 0) > os.path.getsize(self.log_file)
+        ):
+            return
+        self.offset = state["offset"]
+        for member in STATE_MEMBERS:
+            setattr(self, member, state[member])
+        if self.args.model_type != "yolov5":
+            self.train_metrics = state["train_metrics"]
+
+    def save_state(self):
+        if self.offset is None:
+            return
+        state = {member: getattr(self, member) for member in STATE_MEMBERS}
+        state.update(
+            model_type=self.args.model_type,
+            log_file=os.path.realpath(self.log_file),
+            offset=self.offset,
+        )
+        if self.args.model_type != "yolov5":
+            state["train_metrics"] = self.train_metrics
+        write_atomic(self.state_path(), json.dumps(state, default=str))
 
     def open_log(self):
+        self.log_file = glob.glob(
+            os.path.join(self.args.project_dir, "wandb", "latest-run", "*.wandb")
+        )[0]
         self.ds = datastore.DataStore()
-        self.ds.open_for_scan(
-            glob.glob(
-                os.path.join(self.args.project_dir, "wandb", "latest-run", "*.wandb")
-            )[0]
-        )
+        self.ds.open_for_scan(self.log_file)
+        if not self.args.full:
+            self.load_state()
+        if self.offset is not None:
+            self.ds.seek(self.offset)
+        else:
+            self.offset = self.ds.get_offset()
 
     def get_status(self):
 
@@ -102,19 +165,24 @@ class LogParser:
 
     def parse(self):
         # use for loop instead of while loop to avoid unknown case cause infinite loop
-        for i in range(1000000):
+        for i in range(MAX_RECORDS_PER_RUN):
             pb = self.parse_one()
             if pb == None:
-                return
+                break
             # parse depend on each case
             if pb.HasField("run"):
                 self.parse_run(pb)
             # parse train log
             elif pb.HasField("output_raw"):
-                self.parse_out(pb, args.model_type)
+                self.parse_out(pb, self.args.model_type)
             # parse system log
             elif pb.HasField("stats"):
                 self.parse_stats(pb)
+            # a record that is still being written is not counted, the next
+            # run reads it again from here
+            self.offset = self.ds.get_offset()
+        if self.status == "Completed" and self.start_at is not None:
+            self.complete_at = self.start_at + self.duration
 
     def parse_one(self) -> Union[wandb_internal_pb2.Record, None]:
         # last block(padding) may raise following error:
@@ -132,8 +200,6 @@ class LogParser:
 
     def parse_run(self, pb):
         self.start_at = pb.run.start_time.seconds
-        if self.status == "Completed":
-            self.complete_at = self.start_at + self.duration
 
     def parse_out(self, pb, model_type):
         if model_type == "yolov5":
@@ -146,8 +212,7 @@ class LogParser:
     def parse_yolov5_out(self, pb):
 
         # parse the ETA
-        ETA_pattern = r"^(\d+)/(\d+)\s.*\s(\d+)%\|.*?(\d+:\d+[\d:]*)<(\d+:\d+[\d:]*)"
-        match = re.search(ETA_pattern, pb.output_raw.line.strip())
+        match = YOLOV5_ETA_PATTERN.search(pb.output_raw.line.strip())
         if match:
             # epoch in yolo is 0-based
             cur_ep = int(match.group(1))
@@ -163,15 +228,13 @@ class LogParser:
             # print(f'epcoh: {cur_ep}, remain time: {time_ep_remain} pass time: {time_ep_pass} progress: {progress} self.ETA: {self.ETA}')
 
     def parse_tflite_model_maker_out(self, pb):
-        epoch_pattern = r"Epoch (\d+)/"
-        match = re.search(epoch_pattern, pb.output_raw.line)
+        match = TFLITE_EPOCH_PATTERN.search(pb.output_raw.line)
         if match:
             self.cur_epoch = match.group(1)
             # print(self.cur_epoch)
             return
 
-        metric_pattern = r"ETA: ((?:[\d]+:)?[\d]{1,2}:[\d]{2}|[\d]+s)|(\w+): ([\d\.]+)"
-        matches = re.findall(metric_pattern, pb.output_raw.line)
+        matches = TFLITE_METRIC_PATTERN.findall(pb.output_raw.line)
         print(pb.output_raw.line)
         if matches:
             record = {"timestamp": pb.output_raw.timestamp.seconds}
@@ -223,12 +286,11 @@ class LogParser:
         output_file_path = os.path.join(self.args.out_dir, "log.json")
         # Convert the dictionary representation to a JSON string
         result = json.dumps(self.to_dict(), default=str, indent=4)
-        # Write result to the output file
-        with open(output_file_path, "w") as f:
-            f.write(result)
+        # Write result to the output file, the UI may read it at any time
+        write_atomic(output_file_path, result)
 
     def post_process(self):
-        if args.model_type == "yolov5":
+        if self.args.model_type == "yolov5":
             self.post_process_yolov5()
 
     def post_process_yolov5(self):
@@ -270,14 +332,32 @@ class LogParser:
                     # })
 
 
+def write_atomic(path, content):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
 # TODO: separate the different framework to different parser
 def main():
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+    # cron starts a run every 5 seconds, skip if the previous one is still parsing
+    lock = open(os.path.join(args.out_dir, LOCK_FILE), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("another parse_log is running, skip")
+        return
+
     logParser = LogParser(args)
     status = logParser.get_status()
     if status != "Queued":
         print("parsing log...")
         logParser.open_log()
         logParser.parse()
+        logParser.save_state()
         logParser.post_process()
     logParser.to_json()
 
@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import all_class_AP
+import ap_engine
+from analysis_context import AnalysisContext
+from confusion_matrix import compute_confusion_matrix, load_from_context, read_conf_threshold, save_confusion_matrix
+from dataset_check import check_dataset, save_dataset_check
+from train_performance import TRAINING_STATUS_PARSERS, save_training_status
+from yolo_to_voc import convert
+
+# Runs every post-processing step of start_and_monitor.sh in one process: the
+# dataset and the predictions are parsed once into an AnalysisContext and
+# shared by all stages instead of being re-read by each script. A failed stage is
+# logged and does not fail the run: start_and_monitor.sh marks the version as
+# "Failed" on a non-zero exit status, although the training itself succeeded.
+
+
+def log(message):
+    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}", flush=True)
+
+
+def run_stage(timings, failed_stages, name, func, *args, **kwargs):
+    """Run one stage and return its result, or ``None`` if it fails: the other
+    stages still run, as when the stages were separate scripts."""
+    log(f"Starting {name}")
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    except all_class_AP.AnalysisError as e:
+        log(f"{name} failed: {e}")
+    except Exception:
+        log(f"{name} failed:\n{traceback.format_exc()}")
+    else:
+        timings.append((name, time.perf_counter() - start))
+        log(f"Finished {name} in {timings[-1][1]:.3f}s")
+        return result
+    timings.append((name + ' (failed)', time.perf_counter() - start))
+    failed_stages.append(name)
+    return None
+
+
+def load_context(dataset_dir, pred_dir):
+    # the labels are read lazily, load them here so that the stage measures the loading
+    context = AnalysisContext(dataset_dir, pred_dir)
+    context.gt
+    context.pred
+    return context
+
+
+def run_all_class_AP(context, voc_dir, output_dir):
+    labels = ap_engine.labels_from_arrays(context.gt, context.pred, context.class_mapping)
+    args = all_class_AP.parse_args(['-na', '-np', '-d', voc_dir, '-o', os.path.join(output_dir, 'all_class_AP')])
+    all_class_AP.main(args, labels)
+
+
+def run_confusion_matrix(context, output_dir, conf_threshold, iou_threshold):
+    ground_truths, detections, _ = load_from_context(context)
+    CM = compute_confusion_matrix(ground_truths, detections, context.class_mapping,
+                                  conf_threshold, iou_threshold)
+    CM.print_matrix()
+    save_confusion_matrix(CM, context.class_mapping, output_dir)
+
+
+def main(args):
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    if args.CONF_THRESHOLD is None:
+        args.CONF_THRESHOLD = read_conf_threshold(args.conf_threshold_file)
+
+    timings = []
+    failed_stages = []
+    context = run_stage(timings, failed_stages, "loading dataset", load_context, args.dataset_dir, args.pred_dir)
+    if context is not None:
+        run_stage(timings, failed_stages, "yolo_to_voc", convert, context, args.voc_dir, packed=True)
+        run_stage(timings, failed_stages, "all_class_AP", run_all_class_AP, context, args.voc_dir, args.output_dir)
+        run_stage(timings, failed_stages, "confusion_matrix", run_confusion_matrix, context, args.output_dir,
+                  args.CONF_THRESHOLD, args.IOU_THRESHOLD)
+        run_stage(timings, failed_stages, "dataset_check",
+                  lambda: save_dataset_check(check_dataset(context, args.workers), args.output_dir))
+        context.save_image_size_index()
+    else:
+        log("Skipping the analyses of the test split")
+    status_args = argparse.Namespace(result_dir=args.result_dir, out_dir=args.output_dir, model_type=args.model_type)
+    run_stage(timings, failed_stages, "train_performance", save_training_status, status_args)
+
+    log("Post-processing timings:")
+    for name, seconds in timings:
+        print(f"  {name:<28}{seconds:>10.3f}s")
+    print(f"  {'total':<28}{sum(seconds for _, seconds in timings):>10.3f}s")
+
+    if failed_stages:
+        log(f"Failed stages: {', '.join(failed_stages)}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run all post-processing analyses of a training run')
+    parser.add_argument('--dataset-dir', '-d', type=str, default='/workspace/dataset',
+                        help='dataset directory, containing dataset.yaml, test.txt, images/ and labels/')
+    parser.add_argument('--pred-dir', '-p', type=str, default='/workspace/results/test',
+                        help='yolo val.py output directory, containing labels/')
+    parser.add_argument('--result-dir', '-r', type=str, default='/workspace/results',
+                        help='training results directory')
+    parser.add_argument('--voc-dir', type=str, default='/workspace/results/voc_format_labels',
+                        help='output directory of the VOC format labels')
+    parser.add_argument('--output-dir', '-o', type=str, default='/workspace/results/analysis_results',
+                        help='output directory')
+    parser.add_argument('--model_type', '-t', type=str, required=True,
+                        choices=TRAINING_STATUS_PARSERS.keys(), help='model type')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='worker processes of dataset_check, default: number of CPUs')
+    parser.add_argument('--IOU_THRESHOLD', type=float, default=0.6,
+                        help='confusion matrix IoU threshold')
+
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--conf-threshold-file', type=str, help='file containing confidence threshold',
+                       default='/workspace/results/test/results.json')
+    group.add_argument('--CONF_THRESHOLD', type=float, help='confidence threshold')
+
+    sys.exit(main(parser.parse_args()))
+
+# in container:
+# python pipeline.py -t yolov5
@@ -50,12 +50,9 @@ stop_cron() {
 run_post_processing() {
     log_message "Starting post-processing"
 
-    run_python_script "yolo_to_voc.py" -gt
-    run_python_script "yolo_to_voc.py" -pred
-    run_python_script "all_class_AP.py" -na -np
-    run_python_script "confusion_matrix.py"
-    run_python_script "dataset_check.py"
-    run_python_script "train_performance.py" -t "${IMAGE_NAME}"
+    # yolo_to_voc, all_class_AP, confusion_matrix, dataset_check and
+    # train_performance in one process, sharing the parsed dataset
+    run_python_script "pipeline.py" -t "${IMAGE_NAME}"
 
     log_message "Finished post-processing"
 }
@@ -0,0 +1,160 @@
+import os
+
+import numpy as np
+import pytest
+
+import ap_engine
+
+CLASSES = ['car', 'person', 'truck']
+
+
+def baseline_voc_ap(rec, prec):
+    # voc_ap of the original all_class_AP.py
+    rec.insert(0, 0.0)
+    rec.append(1.0)
+    mrec = rec[:]
+    prec.insert(0, 0.0)
+    prec.append(0.0)
+    mpre = prec[:]
+    for i in range(len(mpre) - 2, -1, -1):
+        mpre[i] = max(mpre[i], mpre[i + 1])
+    i_list = []
+    for i in range(1, len(mrec)):
+        if mrec[i] != mrec[i - 1]:
+            i_list.append(i)
+    ap = 0.0
+    for i in i_list:
+        ap += ((mrec[i] - mrec[i - 1]) * mpre[i])
+    return ap
+
+
+def baseline_ap(gt, dr, class_name, min_overlap):
+    """The per-detection matching loop of the original all_class_AP.py."""
+    ground_truth = {
+        file_id: [dict(obj, used=False) for obj in objects]
+        for file_id, objects in gt.items()
+    }
+    n_gt = sum(1 for objects in gt.values() for obj in objects
+               if obj['class_name'] == class_name and not obj['difficult'])
+    detections = [dict(det, file_id=file_id) for file_id, dets in dr.items()
+                  for det in dets if det['class_name'] == class_name]
+    detections.sort(key=lambda x: x['confidence'], reverse=True)
+
+    tp = [0] * len(detections)
+    fp = [0] * len(detections)
+    for idx, detection in enumerate(detections):
+        ovmax = -1
+        gt_match = None
+        bb = detection['bbox']
+        for obj in ground_truth[detection['file_id']]:
+            if obj['class_name'] != class_name:
+                continue
+            bbgt = obj['bbox']
+            bi = [max(bb[0], bbgt[0]), max(bb[1], bbgt[1]), min(bb[2], bbgt[2]), min(bb[3], bbgt[3])]
+            iw = bi[2] - bi[0] + 1
+            ih = bi[3] - bi[1] + 1
+            if iw > 0 and ih > 0:
+                ua = (bb[2] - bb[0] + 1) * (bb[3] - bb[1] + 1) + \
+                    (bbgt[2] - bbgt[0] + 1) * (bbgt[3] - bbgt[1] + 1) - iw * ih
+                ov = iw * ih / ua
+                if ov > ovmax:
+                    ovmax = ov
+                    gt_match = obj
+        if ovmax >= min_overlap:
+            if not gt_match['difficult']:
+                if not gt_match['used']:
+                    tp[idx] = 1
+                    gt_match['used'] = True
+                else:
+                    fp[idx] = 1
+        else:
+            fp[idx] = 1
+
+    cumsum = 0
+    for idx, val in enumerate(fp):
+        fp[idx] += cumsum
+        cumsum += val
+    cumsum = 0
+    for idx, val in enumerate(tp):
+        tp[idx] += cumsum
+        cumsum += val
+    rec = [val / n_gt for val in tp]
+    prec = [tp[idx] / (fp[idx] + tp[idx]) for idx in range(len(tp))]
+    return baseline_voc_ap(rec, prec)
+
+
+@pytest.fixture
+def voc_dirs(tmp_path):
+    """A small test split with overlapping, repeated and difficult boxes."""
+    rng = np.random.default_rng(7)
+    gt, dr = {}, {}
+    gt_dir, dr_dir = tmp_path / 'truth', tmp_path / 'pred'
+    gt_dir.mkdir()
+    dr_dir.mkdir()
+    for image_idx in range(25):
+        file_id = f'{image_idx:04d}'
+        n = int(rng.integers(1, 6))
+        left_top = rng.integers(0, 400, (n, 2))
+        size = rng.integers(10, 200, (n, 2))
+        gt[file_id] = [
+            {'class_name': CLASSES[rng.integers(len(CLASSES))],
+             'bbox': [*left_top[i].tolist(), *(left_top[i] + size[i]).tolist()],
+             'difficult': bool(rng.random() < 0.1)}
+            for i in range(n)
+        ]
+        dr[file_id] = []
+        for _ in range(int(rng.integers(0, 8))):
+            obj = gt[file_id][rng.integers(n)]
+            class_name = obj['class_name'] if rng.random() < 0.8 else CLASSES[rng.integers(len(CLASSES))]
+            bbox = (np.array(obj['bbox']) + rng.integers(-20, 21, 4)).tolist()
+            dr[file_id].append({'class_name': class_name, 'bbox': bbox,
+                                'confidence': round(float(rng.random()), 6)})
+
+        with open(os.path.join(gt_dir, file_id + '.txt'), 'w') as f:
+            for obj in gt[file_id]:
+                f.write(' '.join([obj['class_name'], *map(str, obj['bbox'])] +
+                                 (['difficult'] if obj['difficult'] else [])) + '\n')
+        with open(os.path.join(dr_dir, file_id + '.txt'), 'w') as f:
+            for det in dr[file_id]:
+                f.write(' '.join([det['class_name'], *map(str, det['bbox']), str(det['confidence'])]) + '\n')
+    return str(gt_dir), str(dr_dir), gt, dr
+
+
+def test_matches_baseline_ap(voc_dirs):
+    gt_dir, dr_dir, gt, dr = voc_dirs
+    results = ap_engine.evaluate(ap_engine.load_voc_dirs(gt_dir, dr_dir))
+
+    assert [r.class_name for r in results] == CLASSES
+    for r in results:
+        assert r.ap == pytest.approx(baseline_ap(gt, dr, r.class_name, ap_engine.MINOVERLAP))
+
+
+def test_matches_baseline_ap_sweep(voc_dirs):
+    gt_dir, dr_dir, gt, dr = voc_dirs
+    results = ap_engine.evaluate(ap_engine.load_voc_dirs(gt_dir, dr_dir))
+
+    for r in results:
+        expected = [baseline_ap(gt, dr, r.class_name, threshold) for threshold in ap_engine.IOU_THRESHOLDS]
+        assert r.ap_sweep == pytest.approx(expected)
+        assert r.ap_at(0.5) == r.ap
+        assert r.ap50_95 == pytest.approx(np.mean(expected))
+
+
+def test_class_iou_overrides_threshold(voc_dirs):
+    gt_dir, dr_dir, gt, dr = voc_dirs
+    results = ap_engine.evaluate(ap_engine.load_voc_dirs(gt_dir, dr_dir), class_iou={'person': 0.75})
+
+    for r in results:
+        min_overlap = 0.75 if r.class_name == 'person' else ap_engine.MINOVERLAP
+        assert r.ap == pytest.approx(baseline_ap(gt, dr, r.class_name, min_overlap))
+
+
+def test_packed_labels_give_the_same_results(voc_dirs, tmp_path):
+    gt_dir, dr_dir, _, _ = voc_dirs
+    npz_path = str(tmp_path / ap_engine.PACKED_FILE)
+    ap_engine.save_npz(ap_engine.load_voc_dirs(gt_dir, dr_dir), npz_path)
+
+    for ignore in ((), ('truck',)):
+        expected = ap_engine.to_json_data(ap_engine.evaluate(ap_engine.load_voc_dirs(gt_dir, dr_dir, ignore)))
+        packed = ap_engine.to_json_data(ap_engine.evaluate(ap_engine.load_npz(npz_path, ignore)))
+        assert packed == expected
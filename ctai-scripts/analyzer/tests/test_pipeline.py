@@ -0,0 +1,122 @@
+import json
+import os
+import struct
+import subprocess
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+ANALYZER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLASSES = {0: 'car', 1: 'person', 2: 'truck'}
+
+
+def write_png(path, width, height):
+    # a header is enough for imagesize
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+                chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b''))
+
+
+def run_script(*args):
+    subprocess.run([sys.executable, *args], cwd=ANALYZER_DIR, check=True, capture_output=True)
+
+
+@pytest.fixture
+def training_run(tmp_path):
+    """A finished yolov5 run: dataset, test split predictions and results.csv."""
+    rng = np.random.default_rng(3)
+    dataset_dir, result_dir = tmp_path / 'dataset', tmp_path / 'results'
+    pred_dir = result_dir / 'test'
+    for path in (dataset_dir / 'images', dataset_dir / 'labels', pred_dir / 'labels', result_dir / 'exp'):
+        path.mkdir(parents=True)
+
+    with open(dataset_dir / 'dataset.yaml', 'w') as f:
+        f.write('names:\n' + ''.join(f'  {i}: {name}\n' for i, name in CLASSES.items()))
+    images = []
+    for image_idx in range(30):
+        name = f'{image_idx:04d}.png'
+        write_png(dataset_dir / 'images' / name, int(rng.integers(200, 800)), int(rng.integers(200, 800)))
+        images.append(f'./images/{name}')
+
+        n = int(rng.integers(0, 5))
+        xywh = np.column_stack([rng.uniform(0.2, 0.8, (n, 2)), rng.uniform(0.05, 0.3, (n, 2))])
+        classes = rng.integers(0, 3, n)
+        with open(dataset_dir / 'labels' / f'{image_idx:04d}.txt', 'w') as f:
+            f.writelines(f'{c} ' + ' '.join(f'{v:.6f}' for v in box) + '\n' for c, box in zip(classes, xywh))
+        if n and image_idx % 7:
+            j = rng.integers(0, n, int(rng.integers(1, 6)))
+            pred = xywh[j] + rng.normal(0, 0.01, (len(j), 4))
+            with open(pred_dir / 'labels' / f'{image_idx:04d}.txt', 'w') as f:
+                f.writelines(f'{c} ' + ' '.join(f'{v:.6f}' for v in box) + f' {rng.random():.5f}\n'
+                             for c, box in zip(classes[j], pred))
+
+    with open(dataset_dir / 'test.txt', 'w') as f:
+        f.write('\n'.join(images[:20]) + '\n')
+    with open(dataset_dir / 'train.txt', 'w') as f:
+        f.write('\n'.join(images[20:27]) + '\n')
+    with open(dataset_dir / 'val.txt', 'w') as f:
+        f.write('\n'.join(images[27:]) + '\n')
+    with open(pred_dir / 'results.json', 'w') as f:
+        json.dump({'all': {'conf_threshold': 0.25}}, f)
+    with open(result_dir / 'exp' / 'results.csv', 'w') as f:
+        f.write('epoch,train/box_loss,train/obj_loss,train/cls_loss,metrics/precision,metrics/recall,'
+                'metrics/mAP_0.5,val/box_loss,val/obj_loss,val/cls_loss\n')
+        for epoch in range(3):
+            f.write(f'{epoch},0.1,0.2,0.3,0.{epoch + 4},0.{epoch + 3},0.{epoch + 2},0.4,0.5,0.6\n')
+    return str(dataset_dir), str(pred_dir), str(result_dir)
+
+
+def read_outputs(voc_dir, output_dir):
+    outputs = {}
+    for split in ('truth', 'pred'):
+        for name in sorted(os.listdir(os.path.join(voc_dir, split))):
+            with open(os.path.join(voc_dir, split, name)) as f:
+                outputs[f'{split}/{name}'] = f.read()
+    for name in ('all_class_AP.json', 'confusion_matrix.json', 'dataset_check.json', 'training_status.json'):
+        with open(os.path.join(output_dir, name)) as f:
+            outputs[name] = json.load(f)
+    return outputs
+
+
+def test_pipeline_matches_separate_scripts(training_run, tmp_path):
+    dataset_dir, pred_dir, result_dir = training_run
+    conf_file = os.path.join(pred_dir, 'results.json')
+
+    # the post-processing of start_and_monitor.sh before pipeline.py
+    voc_dir, output_dir = str(tmp_path / 'scripts' / 'voc'), str(tmp_path / 'scripts' / 'analysis')
+    for split in ('-gt', '-pred'):
+        run_script('yolo_to_voc.py', split, '-d', dataset_dir, '-p', pred_dir, '-o', voc_dir)
+    run_script('all_class_AP.py', '-na', '-np', '-d', voc_dir, '-o', os.path.join(output_dir, 'all_class_AP'))
+    run_script('confusion_matrix.py', '--dataset-dir', dataset_dir, '--label-dir', voc_dir,
+               '--output-dir', output_dir, '--conf-threshold-file', conf_file)
+    run_script('dataset_check.py', '-d', dataset_dir, '-o', output_dir, '-w', '1')
+    run_script('train_performance.py', '-d', result_dir, '-o', output_dir, '-t', 'yolov5')
+
+    pipeline_voc_dir, pipeline_output_dir = str(tmp_path / 'pipeline' / 'voc'), str(tmp_path / 'pipeline' / 'analysis')
+    run_script('pipeline.py', '-t', 'yolov5', '-d', dataset_dir, '-p', pred_dir, '-r', result_dir,
+               '--voc-dir', pipeline_voc_dir, '-o', pipeline_output_dir, '-w', '1',
+               '--conf-threshold-file', conf_file)
+
+    assert read_outputs(pipeline_voc_dir, pipeline_output_dir) == read_outputs(voc_dir, output_dir)
+
+
+def test_pipeline_exits_0_when_a_stage_fails(training_run, tmp_path):
+    dataset_dir, pred_dir, result_dir = training_run
+    os.remove(os.path.join(dataset_dir, 'train.txt'))
+    output_dir = str(tmp_path / 'analysis')
+
+    result = subprocess.run(
+        [sys.executable, 'pipeline.py', '-t', 'yolov5', '-d', dataset_dir, '-p', pred_dir, '-r', result_dir,
+         '--voc-dir', str(tmp_path / 'voc'), '-o', output_dir, '-w', '1', '--CONF_THRESHOLD', '0.25'],
+        cwd=ANALYZER_DIR, capture_output=True, text=True)
+
+    assert result.returncode == 0
+    assert 'Failed stages: dataset_check' in result.stdout
+    # the other stages still ran
+    for name in ('all_class_AP.json', 'confusion_matrix.json', 'training_status.json'):
+        assert os.path.exists(os.path.join(output_dir, name))
+    assert not os.path.exists(os.path.join(output_dir, 'dataset_check.json'))
@@ -73,9 +73,19 @@ class YOLOv5_TrainStatusParser(TrainStatusParser):
         return self.indicator
 
 
-if __name__ == "__main__":
+TRAINING_STATUS_PARSERS = { "yolov5": YOLOv5_TrainStatusParser }
+
+
+def save_training_status(args):
+    parser = TRAINING_STATUS_PARSERS[args.model_type](args)
+    status = parser.parse_status(args.result_dir)
+    indicator = parser.parse_indicator(args.result_dir)
+
+    with open(os.path.join(args.out_dir, 'training_status.json'), 'w') as f:
+        json.dump({"status": status, "indicator": indicator}, f)
+
 
-    TRAINING_STATUS_PARSERS = { "yolov5": YOLOv5_TrainStatusParser }
+if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='')
     parser.add_argument('--result-dir', '-d', type=str,
@@ -88,12 +98,7 @@ if __name__ == "__main__":
 
     if (os.path.exists(args.out_dir) == False):
         os.makedirs(args.out_dir)
-    
-    parser = TRAINING_STATUS_PARSERS[args.model_type](args)
-    status = parser.parse_status(args.result_dir)
-    indicator = parser.parse_indicator(args.result_dir)
 
-    with open(os.path.join(args.out_dir, 'training_status.json'), 'w') as f:
-        json.dump({"status": status, "indicator": indicator}, f)
+    save_training_status(args)
 
 
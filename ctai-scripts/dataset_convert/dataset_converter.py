@@ -4,67 +4,68 @@ import random
 import shutil
 import sys
 import glob
-import asyncio
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
-class_mapping = {}
-cur_num_classes = 0
-lock = asyncio.Lock()
+from image_store import ImageStore
 
 
-async def unzip_and_process(zip_path, tmp_dir, output_dir):
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        extract_to = os.path.join(
-            tmp_dir, os.path.splitext(os.path.basename(zip_path))[0])
-        zip_ref.extractall(path=extract_to)
-    print(f"Unzipped {zip_path} successfully")
-    await process_task(extract_to, output_dir)
-
+def read_annotations(zip_path):
+    """Read the CVAT YOLO export ``zip_path`` without extracting it (run in a worker process).
 
-async def process_task(src_dir, output_dir):
-    async with lock:
-        global cur_num_classes
-        local_class_mapping = []
+    Returns the class names of its ``obj.names`` (None if it has none) and the
+    ``(label file name, [(local class id, "x y w h"), ...])`` of ``obj_train_data``.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
         try:
-            with open(os.path.join(src_dir, 'obj.names'), 'r') as file:
-                for line in file:
-                    class_name = line.strip()
-                    local_class_mapping.append(class_name)
-                    if class_name and class_name not in class_mapping:
-                        class_mapping[class_name] = cur_num_classes
-                        cur_num_classes += 1
-                        print(f"Updated class mapping: {class_mapping}")
-        except FileNotFoundError:
-            print(f"No obj.names file in {src_dir}, skipping...")
-            return
-        
-        # label_files = glob.glob(os.path.join(
-        #     src_dir, 'obj_train_data', '*.txt'))
-        
-        # find all .txt files in the obj_train_data and obj_train_data/*/ directories
-        label_files = glob.glob(os.path.join(src_dir, 'obj_train_data', '**', '*.txt'), recursive=True)
-        
-        for label_file in label_files:
-            with open(label_file, 'r') as file:
-                for line in file:
-                    class_id, x, y, w, h = line.split()
-                    mapped_id = class_mapping[local_class_mapping[int(
-                        class_id)]]
-                    output_file_path = os.path.join(
-                        output_dir, 'labels', os.path.basename(label_file))
-                    with open(output_file_path, 'a') as out_file:
-                        out_file.write(f"{mapped_id} {x} {y} {w} {h}\n")
-
-
-async def unzip_files_async(annotations_dir, tmp_dir, output_dir):
+            class_names = [line.strip() for line in zip_ref.read('obj.names').decode().splitlines()]
+        except KeyError:
+            return None, []
+        # all .txt files in the obj_train_data and obj_train_data/*/ directories
+        labels = []
+        for member in zip_ref.namelist():
+            if not member.startswith('obj_train_data/') or not member.endswith('.txt'):
+                continue
+            rows = []
+            for line in zip_ref.read(member).decode().splitlines():
+                class_id, x, y, w, h = line.split()
+                rows.append((int(class_id), f"{x} {y} {w} {h}"))
+            labels.append((os.path.basename(member), rows))
+    return class_names, labels
+
+
+def convert_annotations(annotations_dir, output_dir, workers=None):
+    """Remap the labels of every annotation zip to one class mapping and write them to ``output_dir/labels``.
+
+    Zips are read in parallel; the class mapping is merged in zip order, so
+    class ids only depend on the order of the zips and their ``obj.names``.
+    """
     zip_files = glob.glob(os.path.join(annotations_dir, '*.zip'))
     print(f"Found {len(zip_files)} zip files in {annotations_dir}")
-    tasks = [unzip_and_process(zip_path, tmp_dir, output_dir)
-             for zip_path in zip_files]
-    await asyncio.gather(*tasks)
-
 
-def prepare_files(input_dir, output_dir, use_symlink, train, val, test):
+    class_mapping = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for zip_path, (class_names, labels) in zip(zip_files, executor.map(read_annotations, zip_files)):
+            if class_names is None:
+                print(f"No obj.names file in {zip_path}, skipping...")
+                continue
+            for class_name in class_names:
+                if class_name and class_name not in class_mapping:
+                    class_mapping[class_name] = len(class_mapping)
+                    print(f"Updated class mapping: {class_mapping}")
+
+            # one buffered write per label file
+            for label_name, rows in labels:
+                if not rows:
+                    continue
+                lines = [f"{class_mapping[class_names[class_id]]} {xywh}\n" for class_id, xywh in rows]
+                with open(os.path.join(output_dir, 'labels', label_name), 'a') as out_file:
+                    out_file.writelines(lines)
+            print(f"Processed {zip_path} successfully")
+    return class_mapping
+
+
+def prepare_files(input_dir, output_dir, use_symlink, train, val, test, store_dir=None):
     # Ensure the output directory exists
     label_dir = os.path.join(output_dir, 'labels')
     os.makedirs(label_dir, exist_ok=True)
@@ -96,6 +97,17 @@ def prepare_files(input_dir, output_dir, use_symlink, train, val, test):
             except OSError as e:
                 print(f"Failed to create symlink: {e}")
                 sys.exit(1)
+    elif store_dir:
+        # Link every image from the content-addressed store, only new images take space
+        if os.path.exists(output_img_dir):
+            if os.path.islink(output_img_dir):
+                os.unlink(output_img_dir)
+            else:
+                shutil.rmtree(output_img_dir)
+        stats = ImageStore(store_dir).materialize_tree(
+            input_img_dir, output_img_dir, exclude={'manifest.jsonl'})
+        print(f"Images materialized from {store_dir}: {stats['new']} new in store, "
+              f"{stats['hardlink']} hardlinks, {stats['reflink']} reflinks, {stats['copy']} copies")
     else:
         # Copy the images folder
         if os.path.exists(output_img_dir):
@@ -108,16 +120,7 @@ def prepare_files(input_dir, output_dir, use_symlink, train, val, test):
     # remove CVAT manifest file if exists
     if os.path.exists(os.path.join(output_img_dir, 'manifest.jsonl')):
         os.remove(os.path.join(output_img_dir, 'manifest.jsonl'))
-    # create train, val, test txt files
-    train_file = open(os.path.join(output_dir, 'train.txt'), 'w')
-    val_file = open(os.path.join(output_dir, 'val.txt'), 'w')
-    test_file = open(os.path.join(output_dir, 'test.txt'), 'w')
-
     file_names = os.listdir(output_img_dir)
-    # Close the train, val, test files
-    train_file.close()
-    val_file.close()
-    test_file.close()
 
     # Iterate over each file in the image folder
     for file_name in file_names:
@@ -130,19 +133,16 @@ def prepare_files(input_dir, output_dir, use_symlink, train, val, test):
     num_files = len(file_names)
     train_end = int(num_files * train)
     val_end = int(num_files * (train + val))
-    for i, file_name in enumerate(file_names):
-        if i < train_end:
-            with open(os.path.join(output_dir, 'train.txt'), 'a') as file:
-                file.write(f"./images/{file_name}\n")
-        elif i < val_end:
-            with open(os.path.join(output_dir, 'val.txt'), 'a') as file:
-                file.write(f"./images/{file_name}\n")
-        else:
-            with open(os.path.join(output_dir, 'test.txt'), 'a') as file:
-                file.write(f"./images/{file_name}\n")
-
-
-def create_dataset_yaml(output_dir):
+    # create train, val, test txt files
+    splits = {'train.txt': file_names[:train_end],
+              'val.txt': file_names[train_end:val_end],
+              'test.txt': file_names[val_end:]}
+    for split_file, split_names in splits.items():
+        with open(os.path.join(output_dir, split_file), 'w') as file:
+            file.writelines(f"./images/{file_name}\n" for file_name in split_names)
+
+
+def create_dataset_yaml(output_dir, class_mapping):
     with open(os.path.join(output_dir, 'dataset.yaml'), 'w') as file:
         file.write(f"path: ../dataset\n")
         file.write(f"train: train.txt\n")
@@ -162,12 +162,16 @@ def main():
                         help='Directory where label text files will be created.')
     parser.add_argument('--sym-link', action='store_true', default=False,
                         help='Create a symlink instead of copying the images folder.')
+    parser.add_argument('--store', type=str, default=None,
+                        help='Content-addressed image store directory; images are hardlinked (or reflinked) from it instead of copied.')
     parser.add_argument('--train', type=float, default=0.8,
                         help='Percentage of data for training.')
     parser.add_argument('--val', type=float, default=0.1,
                         help='Percentage of data for validation.')
     parser.add_argument('--test', type=float, default=0.1,
                         help='Percentage of data for testing.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes reading the annotation zips, default: number of CPUs.')
 
     args = parser.parse_args()
     args.output_dir = os.path.join(args.output_dir, 'dataset')
@@ -178,15 +182,11 @@ def main():
         return
 
     prepare_files(args.input_dir, args.output_dir,
-                  args.sym_link, args.train, args.val, args.test)
+                  args.sym_link, args.train, args.val, args.test, args.store)
     annotations_dir = os.path.join(args.input_dir, 'annotations')
-    tmp_dir = os.path.join(args.output_dir, 'tmp')
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(unzip_files_async(
-        annotations_dir, tmp_dir, args.output_dir))
-    create_dataset_yaml(args.output_dir)
-
-    shutil.rmtree(os.path.join(args.output_dir, 'tmp'), ignore_errors=True)
+    class_mapping = convert_annotations(
+        annotations_dir, args.output_dir, args.workers)
+    create_dataset_yaml(args.output_dir, class_mapping)
 
     print("Dataset transformation completed.")
 
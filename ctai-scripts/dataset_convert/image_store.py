@@ -0,0 +1,117 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# ioctl(dst_fd, FICLONE, src_fd) shares the extents of src with dst (btrfs, xfs, ...)
+FICLONE = 0x40049409
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def reflink(src, dst):
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def link_or_copy(src, dst):
+    """Create ``dst`` with the content of ``src`` as cheaply as the filesystem allows.
+
+    Returns how it was done: 'hardlink', 'reflink' or 'copy'.
+    """
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        reflink(src, dst)
+        return 'reflink'
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+class ImageStore:
+    """Content-addressed image store: every distinct image is kept once under
+    ``objects/<sha256[:2]>/<sha256>`` and dataset versions are materialized from
+    it with hardlinks (or reflinks, or copies as a last resort).
+
+    Objects are shared by every version linking them, images must never be
+    modified in place. The sha256 of a source image is cached by path, size
+    and mtime in ``hash_cache.json``, so materializing an already imported
+    dataset again only costs metadata operations.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.cache_path = os.path.join(root, 'hash_cache.json')
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        try:
+            with open(self.cache_path, 'r') as f:
+                self._hash_cache = json.load(f)
+        except (OSError, ValueError):
+            self._hash_cache = {}
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def digest(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self._hash_cache.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        self._hash_cache[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def add(self, path, digest=None):
+        """Put the image ``path`` into the store; returns the object path and whether it was new."""
+        obj_path = self.object_path(digest or self.digest(path))
+        if os.path.exists(obj_path):
+            return obj_path, False
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        tmp_path = f'{obj_path}.{os.getpid()}.tmp'
+        link_or_copy(path, tmp_path)
+        # another run may have stored the same content meanwhile, either copy is fine
+        os.replace(tmp_path, obj_path)
+        return obj_path, True
+
+    def materialize_tree(self, src_dir, dst_dir, exclude=(), workers=None):
+        """Mirror ``src_dir`` into ``dst_dir`` through the store; returns a Counter of
+        'new' objects and of the 'hardlink'/'reflink'/'copy' used for the files of ``dst_dir``."""
+        files = []
+        for root, _, names in os.walk(src_dir):
+            files.extend(os.path.join(root, name) for name in sorted(names) if name not in exclude)
+        # hashing only happens for images not seen before, hashlib releases the GIL
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = list(executor.map(self.digest, files))
+
+        stats = Counter()
+        for src_path, digest in zip(files, digests):
+            obj_path, new = self.add(src_path, digest)
+            stats['new'] += new
+            dst_path = os.path.join(dst_dir, os.path.relpath(src_path, src_dir))
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            stats[link_or_copy(obj_path, dst_path)] += 1
+        self.save()
+        return stats
+
+    def save(self):
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._hash_cache, f)
+        os.replace(tmp_path, self.cache_path)
@@ -1,69 +1,280 @@
-import subprocess
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import Dict, List
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import time
+import traceback
+from collections import deque
+from http import HTTPStatus
+from typing import Deque, Dict, List, Optional
 from urllib.parse import parse_qs, urlparse
 
+# List of required parameters for the training script, in its argument order
+REQUIRED_PARAMS: List[str] = [
+    "datasetPath",
+    "projectId",
+    "versionId",
+    "train",
+    "val",
+    "test",
+    "epochs",
+    "batchSize",
+    "learningRate",
+    "modelName",
+]
 
-class TrainingHTTPRequestHandler(BaseHTTPRequestHandler):
-    # List of required parameters for the training script
-    REQUIRED_PARAMS: List[str] = [
-        "datasetPath",
-        "projectId",
-        "versionId",
-        "train",
-        "val",
-        "test",
-        "epochs",
-        "batchSize",
-        "learningRate",
-        "modelName",
-    ]
-
-    def do_GET(self) -> None:
-        """Handle GET requests."""
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        query_components = parse_qs(parsed_path.query)
-
-        if path == "/train":
-            self.handle_train_request(query_components)
-        else:
-            self.send_error(404, "Not Found")
+# the script output is read in chunks, asyncio's readline() fails on lines over 64 KiB
+OUTPUT_CHUNK_SIZE = 64 * 1024
+# longer lines are split
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+class Job:
+    """One run of the training script and its captured output."""
+
+    def __init__(self, job_id: str, args: List[str], max_output_lines: int) -> None:
+        self.id = job_id
+        self.args = args
+        self.status = "queued"
+        self.returncode: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # only the last lines are kept, line_count is the number of lines ever written
+        self.output: Deque[str] = deque(maxlen=max_output_lines)
+        self.line_count = 0
+        self.changed = asyncio.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    async def append_output(self, line: str) -> None:
+        async with self.changed:
+            self.output.append(line)
+            self.line_count += 1
+            self.changed.notify_all()
+
+    async def set_status(self, status: str) -> None:
+        async with self.changed:
+            self.status = status
+            self.changed.notify_all()
+
+    def to_dict(self, tail: int = 20) -> Dict:
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "returncode": self.returncode,
+            "args": dict(zip(REQUIRED_PARAMS, self.args)),
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "outputLines": self.line_count,
+            "outputTail": list(self.output)[-tail:] if tail else [],
+        }
+
+
+class TrainingGateway:
+    """Queue training requests and run them with bounded concurrency."""
+
+    def __init__(self, script: str, concurrency: int, queue_size: int, max_output_lines: int,
+                 max_finished_jobs: int = 100) -> None:
+        self.script = script
+        self.concurrency = concurrency
+        self.max_output_lines = max_output_lines
+        self.max_finished_jobs = max_finished_jobs
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=queue_size)
+        self.jobs: Dict[str, Job] = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, args: List[str]) -> Job:
+        """Queue a job; raises asyncio.QueueFull when the queue is full."""
+        job = Job(f"{int(time.time())}-{next(self._ids)}", args, self.max_output_lines)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        return job
+
+    async def worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.run_job(job)
+            except Exception:
+                # the worker must survive any job failure, otherwise the queue stalls
+                print(f"[{job.id}] Job failed with an unexpected error:")
+                traceback.print_exc()
+                await job.append_output(f"Job failed: {traceback.format_exc(limit=1)}")
+                job.finished_at = time.time()
+                await job.set_status("failed")
+            finally:
+                self.queue.task_done()
+                self.evict_finished_jobs()
+
+    def evict_finished_jobs(self) -> None:
+        """Forget the oldest finished jobs beyond max_finished_jobs."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(len(finished) - self.max_finished_jobs, 0)]:
+            del self.jobs[job_id]
 
-    def handle_train_request(self, params: Dict[str, List[str]]) -> None:
-        """Handle the training request by running the bash script."""
-        missing_params = [
-            param for param in self.REQUIRED_PARAMS if param not in params
-        ]
+    async def run_job(self, job: Job) -> None:
+        """Execute the bash script with the job arguments, capturing stdout and stderr."""
+        command = ["bash", self.script] + job.args
+        print(f"[{job.id}] Executing command: {' '.join(command)}")
+        job.started_at = time.time()
+        await job.set_status("running")
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True)
+            await self.read_output(job, process.stdout)
+            job.returncode = await process.wait()
+        except OSError as e:
+            await job.append_output(f"Failed to execute script: {e}")
+        finally:
+            if process is not None and process.returncode is None:
+                # the script's children hold the output pipe too, kill the whole group
+                os.killpg(process.pid, signal.SIGKILL)
+                await process.wait()
+        job.finished_at = time.time()
+        await job.set_status("succeeded" if job.returncode == 0 else "failed")
+        print(f"[{job.id}] {job.status} (returncode {job.returncode})")
+
+    @staticmethod
+    async def read_output(job: Job, stream: asyncio.StreamReader) -> None:
+        """Append the lines of ``stream`` to the job output, whatever their length."""
+        partial = b""
+        while True:
+            chunk = await stream.read(OUTPUT_CHUNK_SIZE)
+            if not chunk:
+                break
+            *lines, partial = (partial + chunk).split(b"\n")
+            while len(partial) > MAX_LINE_LENGTH:
+                lines.append(partial[:MAX_LINE_LENGTH])
+                partial = partial[MAX_LINE_LENGTH:]
+            for line in lines:
+                await job.append_output(line.decode(errors="replace").rstrip("\r"))
+        if partial:
+            await job.append_output(partial.decode(errors="replace").rstrip("\r"))
+
+    async def stream_output(self, job: Job, writer: asyncio.StreamWriter) -> None:
+        """Send the job output as it is produced until the job is done (chunked encoding)."""
+        next_line = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.line_count > next_line or job.done)
+                first_kept = job.line_count - len(job.output)
+                lines = list(job.output)[max(next_line - first_kept, 0):]
+                next_line = job.line_count
+                done = job.done
+            if lines:
+                write_chunk(writer, "".join(line + "\n" for line in lines).encode())
+                await writer.drain()
+            if done:
+                write_chunk(writer, b"")
+                await writer.drain()
+                return
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            # skip the headers, requests have no body
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            try:
+                method, target, _ = request_line.decode().split(" ", 2)
+            except ValueError:
+                return
+            if method != "GET":
+                send_json(writer, HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Only GET is supported"})
+            else:
+                await self.handle_get(target, writer)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_get(self, target: str, writer: asyncio.StreamWriter) -> None:
+        """Route GET requests."""
+        parsed_path = urlparse(target)
+        parts = [part for part in parsed_path.path.split("/") if part]
+
+        if parts == ["train"]:
+            self.handle_train_request(parse_qs(parsed_path.query), writer)
+        elif parts == ["health"]:
+            running = sum(job.status == "running" for job in self.jobs.values())
+            send_json(writer, HTTPStatus.OK, {"status": "ok", "queued": self.queue.qsize(), "running": running})
+        elif parts == ["jobs"]:
+            send_json(writer, HTTPStatus.OK, {"jobs": [job.to_dict(tail=0) for job in self.jobs.values()]})
+        elif len(parts) in (2, 3) and parts[0] == "jobs" and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            if len(parts) == 2:
+                send_json(writer, HTTPStatus.OK, job.to_dict())
+            elif parts[2] == "output":
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                             b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+                await self.stream_output(job, writer)
+            else:
+                send_json(writer, HTTPStatus.NOT_FOUND, {"error": "Not Found"})
+        else:
+            send_json(writer, HTTPStatus.NOT_FOUND, {"error": "Not Found"})
 
+    def handle_train_request(self, params: Dict[str, List[str]], writer: asyncio.StreamWriter) -> None:
+        """Queue a training job and answer with its id without waiting for it."""
+        missing_params = [param for param in REQUIRED_PARAMS if param not in params]
         if missing_params:
-            self.send_error(400, f"Missing parameters: {', '.join(missing_params)}")
+            send_json(writer, HTTPStatus.BAD_REQUEST, {"error": f"Missing parameters: {', '.join(missing_params)}"})
             return
 
-        args = [params[param][0] for param in self.REQUIRED_PARAMS]
-        self.run_script(args)
+        try:
+            job = self.submit([params[param][0] for param in REQUIRED_PARAMS])
+        except asyncio.QueueFull:
+            send_json(writer, HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many queued training jobs"})
+            return
+        send_json(writer, HTTPStatus.ACCEPTED, {"jobId": job.id, "status": job.status})
 
-    def run_script(self, args: List[str]) -> None:
-        """Execute the bash script with the provided arguments."""
-        command = ["bash", "./train_task.sh"] + args
-        print(f"Executing command: {' '.join(command)}")
 
-        try:
-            subprocess.run(command, check=True)
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(b"Script executed successfully!")
-        except subprocess.CalledProcessError as e:
-            self.send_error(500, f"Failed to execute script: {str(e)}")
+def write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
 
 
-def run_server(port: int = 8087) -> None:
-    """Run the HTTP server."""
-    server_address = ("0.0.0.0", port)
-    httpd = HTTPServer(server_address, TrainingHTTPRequestHandler)
-    print(f"Server running on port {port}...")
-    httpd.serve_forever()
+def send_json(writer: asyncio.StreamWriter, status: HTTPStatus, body: Dict) -> None:
+    payload = json.dumps(body).encode()
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+
+
+async def run_server(host: str = "0.0.0.0", port: int = 8087, script: str = "./train_task.sh",
+                     concurrency: int = 1, queue_size: int = 16, max_output_lines: int = 10000,
+                     max_finished_jobs: int = 100) -> None:
+    """Run the HTTP gateway and its job workers."""
+    gateway = TrainingGateway(script, concurrency, queue_size, max_output_lines, max_finished_jobs)
+    workers = [asyncio.create_task(gateway.worker()) for _ in range(concurrency)]
+    server = await asyncio.start_server(gateway.handle_connection, host, port)
+    print(f"Server running on port {port} ({concurrency} concurrent jobs, queue of {queue_size})...")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for worker in workers:
+            worker.cancel()
 
 
 if __name__ == "__main__":
-    run_server()
+    parser = argparse.ArgumentParser(description="Training job gateway, runs train_task.sh for each /train request")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8087)
+    parser.add_argument("--script", type=str, default="./train_task.sh",
+                        help="script run with the training parameters, e.g. a stub for local testing")
+    parser.add_argument("--concurrency", type=int, default=1, help="training jobs run at the same time")
+    parser.add_argument("--queue-size", type=int, default=16, help="queued jobs before /train answers 503")
+    parser.add_argument("--output-lines", type=int, default=10000, help="output lines kept per job")
+    parser.add_argument("--finished-jobs", type=int, default=100, help="finished jobs kept for /jobs")
+    args = parser.parse_args()
+
+    asyncio.run(run_server(args.host, args.port, args.script, args.concurrency, args.queue_size, args.output_lines,
+                           args.finished_jobs))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# easy_http_server.py is run as a script from ctai-scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
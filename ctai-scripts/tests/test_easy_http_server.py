@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlencode
+
+import pytest
+
+from easy_http_server import REQUIRED_PARAMS, TrainingGateway
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# training parameters in REQUIRED_PARAMS order
+PARAMS = ["data", "1", "2", "0.7", "0.2", "0.1", "3", "4", "0.01", "yolov5"]
+
+
+async def get(port, target):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b"\r\n\r\n", 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+async def wait_for_job(port, job_id, timeout=10):
+    async def poll():
+        while True:
+            status, job = await get(port, f"/jobs/{job_id}")
+            assert status == 200
+            if job["status"] not in ("queued", "running"):
+                return job
+            await asyncio.sleep(0.05)
+    return await asyncio.wait_for(poll(), timeout)
+
+
+def run_gateway(script, scenario):
+    """Serve a gateway running ``script`` on a free port while ``scenario(port)`` runs."""
+    async def main():
+        gateway = TrainingGateway(script, concurrency=1, queue_size=4, max_output_lines=100)
+        workers = [asyncio.create_task(gateway.worker())]
+        server = await asyncio.start_server(gateway.handle_connection, "127.0.0.1", 0)
+        try:
+            return await scenario(server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+            for worker in workers:
+                worker.cancel()
+    return asyncio.run(main())
+
+
+def train_query(params):
+    return "/train?" + urlencode(dict(zip(REQUIRED_PARAMS, params)))
+
+
+@pytest.fixture
+def stub_script(tmp_path):
+    # fails when the epochs parameter is "fail"
+    script = tmp_path / "train_stub.sh"
+    script.write_text('echo "training version $3 for $7 epochs"\n[ "$7" != fail ] || exit 3\n')
+    return str(script)
+
+
+def test_train_job_succeeds(stub_script):
+    async def scenario(port):
+        status, body = await get(port, train_query(PARAMS))
+        assert status == 202
+        assert body["status"] == "queued"
+        return await wait_for_job(port, body["jobId"])
+
+    job = run_gateway(stub_script, scenario)
+    assert job["status"] == "succeeded"
+    assert job["returncode"] == 0
+    assert job["args"] == dict(zip(REQUIRED_PARAMS, PARAMS))
+    assert job["outputTail"] == ["training version 2 for 3 epochs"]
+
+
+def test_train_job_fails(stub_script):
+    params = PARAMS[:6] + ["fail"] + PARAMS[7:]
+
+    async def scenario(port):
+        status, body = await get(port, train_query(params))
+        assert status == 202
+        return await wait_for_job(port, body["jobId"])
+
+    job = run_gateway(stub_script, scenario)
+    assert job["status"] == "failed"
+    assert job["returncode"] == 3
+
+
+def test_train_request_errors(stub_script):
+    async def scenario(port):
+        status, body = await get(port, "/train?projectId=1")
+        assert status == 400
+        assert "datasetPath" in body["error"]
+
+        status, _ = await get(port, "/jobs/unknown")
+        assert status == 404
+
+    run_gateway(stub_script, scenario)
+
+
+def test_failed_train_task_marks_version_failed(tmp_path, monkeypatch):
+    patches = []
+
+    class CTAIHandler(BaseHTTPRequestHandler):
+        def do_PATCH(self):
+            patches.append((self.path, json.loads(self.rfile.read(int(self.headers["Content-Length"])))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    ctai = HTTPServer(("127.0.0.1", 0), CTAIHandler)
+    threading.Thread(target=ctai.serve_forever, daemon=True).start()
+    # no dataset_converter.py in the working directory: the dataset conversion fails
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PARENTS_DIR", str(tmp_path / "training-task"))
+    monkeypatch.setenv("CTAI_API_URL", f"http://127.0.0.1:{ctai.server_address[1]}/api")
+
+    async def scenario(port):
+        _, body = await get(port, train_query(PARAMS))
+        return await wait_for_job(port, body["jobId"])
+
+    try:
+        job = run_gateway(os.path.join(SCRIPTS_DIR, "train_task.sh"), scenario)
+    finally:
+        ctai.shutdown()
+    assert job["status"] == "failed"
+    assert patches == [("/api/versions/2", {"status": "Failed"})]
@@ -7,8 +7,12 @@
 # and starts the training pod in Kubernetes.
 #
 # Usage: ./train_task.sh <origin_data_name> <project_id> <version_id> <train_split> <val_split> <test_split> <epochs> <batch_size> <learning_rate> <image_name>
+#
+# The training gateway answers the CTAI request before this script runs, so a
+# failing step marks the version as "Failed" itself.
 
-set -e
+# -E: the ERR trap also fires in functions
+set -eE
 
 # Configuration
 CONFIG_FILE="../setup/.env"
@@ -24,6 +28,7 @@ CTAI_DATASET_DIR=${CTAI_DATASET_DIR:-"../mnt/ctai-dataset/ctai"}
 SCRIPTS_DIR=${SCRIPTS_DIR:-"."}
 K8S_TEMPLATE_DIR=${K8S_TEMPLATE_DIR:-"../ctai-scheduler/kubernetes/templates"}
 MODEL_WEIGHTS=${MODEL_WEIGHTS:-"yolov5n.pt"}
+CTAI_API_URL=${CTAI_API_URL:-"http://192.168.2.94/api"}
 
 # Command line arguments
 ORIGIN_DATA_NAME=$1
@@ -42,6 +47,24 @@ PROJECT_NAME="project-${PROJECT_ID}"
 VERSION_NAME="version-${VERSION_ID}"
 DATA_DIR="${PARENTS_DIR}/${PROJECT_NAME}/${VERSION_NAME}"
 TARGET_DIR="${CTAI_DATASET_DIR}/${ORIGIN_DATA_NAME}"
+# content-addressed images shared by every version, see dataset_convert/image_store.py
+IMAGE_STORE_DIR="${CTAI_DATASET_DIR}/.image_store"
+API_ENDPOINT="${CTAI_API_URL}/versions/${VERSION_ID}"
+
+# Update status function
+update_status() {
+    local status=$1
+    curl --data "{\"status\": \"${status}\"}" -X PATCH "${API_ENDPOINT}"
+}
+
+# Error handling function
+handle_error() {
+    echo "Error occurred. Updating status to Failed."
+    update_status "Failed" || echo "Failed to update the version status."
+    exit 1
+}
+
+trap 'handle_error' ERR
 
 # Function to create necessary directories
 create_directory() {
@@ -53,6 +76,7 @@ data_convert() {
     python3 "${SCRIPTS_DIR}/dataset_convert/dataset_converter.py" \
         --input_dir "${TARGET_DIR}" \
         --output_dir "${DATA_DIR}" \
+        --store "${IMAGE_STORE_DIR}" \
         --train "${TRAIN_SPLIT}" \
         --val "${VAL_SPLIT}" \
         --test "${TEST_SPLIT}"
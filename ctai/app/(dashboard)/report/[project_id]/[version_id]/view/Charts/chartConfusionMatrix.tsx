@@ -21,7 +21,7 @@ interface IImgsrc {
     content: string;
 }
 
-const ChartConfusionMatrix: React.FC<ChartConfusionMatrixProps> = ({ class_mapping: classMapping, confusion_matrix: matrix, versionId }) => {
+const ChartConfusionMatrix: React.FC<ChartConfusionMatrixProps> = ({ class_mapping: classMapping, confusion_matrix: matrix, images, versionId }) => {
     let series = [];
     let labelArray = Object.keys(classMapping).map(key => classMapping[key]);
     labelArray.push('Background');
@@ -29,7 +29,7 @@ const ChartConfusionMatrix: React.FC<ChartConfusionMatrixProps> = ({ class_mappi
     for (let i = 0; i < labelArray.length; i++) {
         let data = [];
         for (let j = 0; j < labelArray.length; j++) {
-            data.push({ x: labelArray[j], y: matrix[i][j].length });
+            data.push({ x: labelArray[j], y: matrix[i][j].img.length });
         }
         series.push({
             name: labelArray[i],
@@ -37,6 +37,18 @@ const ChartConfusionMatrix: React.FC<ChartConfusionMatrixProps> = ({ class_mappi
         });
     }
 
+    // expand a columnar cell into annotations, only done for the clicked cell
+    const expandCell = (predictIdx: number, truthIdx: number): Array<IAnnotation> => {
+        const cell = matrix[predictIdx][truthIdx];
+        return cell.img.map((imgIdx, k) => ({
+            gtIdx: cell.gtIdx.length ? cell.gtIdx[k] : null,
+            pdIdx: cell.pdIdx.length ? cell.pdIdx[k] : null,
+            img: images[imgIdx],
+            gtBbox: cell.gtBbox.length ? cell.gtBbox[k] : null,
+            pdBbox: cell.pdBbox.length ? cell.pdBbox[k] : null,
+        }));
+    };
+
     const { isOpen, onOpen, onOpenChange } = useDisclosure();
     const { isOpen: isImgOpen, onOpen: onImgOpen, onOpenChange: onImgOpenChange } = useDisclosure();
     const [selectedcell, setSelectedCell] = useState<ICell | null>();
@@ -104,11 +116,10 @@ const ChartConfusionMatrix: React.FC<ChartConfusionMatrixProps> = ({ class_mappi
                         const predictIdx = config.seriesIndex;
                         const truthIdx = config.dataPointIndex;
                         console.log(matrix[predictIdx][truthIdx]);
-                        console.log(typeof matrix[predictIdx][truthIdx]);
-                        console.log(typeof matrix[predictIdx][truthIdx][0]);
-                        if (matrix[predictIdx][truthIdx].length > 0) {
-                            setSelectedCell({ predictIdx, truthIdx, value: matrix[predictIdx][truthIdx] });
-                            mutation.mutate({ cell: { predictIdx, truthIdx, value: matrix[predictIdx][truthIdx] }, page: currentPage });
+                        if (matrix[predictIdx][truthIdx].img.length > 0) {
+                            const cell = { predictIdx, truthIdx, value: expandCell(predictIdx, truthIdx) };
+                            setSelectedCell(cell);
+                            mutation.mutate({ cell, page: currentPage });
                         }
                     }
                 },
@@ -674,7 +674,7 @@ function EvaluationDetail({ projectId, versionId }: { projectId: number, version
               ? <Spinner aria-label="Loading..." className="w-full h-full flex items-center justify-items-center" />
               : isError
                 ? <div>Error</div>
-                : <ChartConfusionMatrix class_mapping={data!.class_mapping} confusion_matrix={data!.confusion_matrix} versionId={versionId} />
+                : <ChartConfusionMatrix class_mapping={data!.class_mapping} confusion_matrix={data!.confusion_matrix} images={data!.images} versionId={versionId} />
             }
           </div>
           <GradientBar />
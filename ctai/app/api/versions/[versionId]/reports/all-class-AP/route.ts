@@ -10,9 +10,18 @@ export interface IAllClassAP {
     recall: number;
     f1: number;
     mAP: number;
+    // COCO-style metrics from analysis_results/all_class_AP.json, when the analyzer produced them
+    mAP50_95?: number | null;
+    mAP75?: number | null;
+    mAP_small?: number | null;
+    mAP_medium?: number | null;
+    mAP_large?: number | null;
   };
 }
 
+// all_class_AP.json keys copied into each class entry; "all" takes them from "_statistics"
+const COCO_METRICS = ['AP50_95', 'AP75', 'AP_small', 'AP_medium', 'AP_large'];
+
 /**
  * Retrieves the indicators(mAP,Precision,Recall...) from a JSON file based on the provided versionId.
  * @param req - The request object.
@@ -52,6 +61,20 @@ export async function GET(req: Request, { params }: { params: { versionId: numbe
 
     const data = fs.readFileSync(resolvedPath, 'utf8');
     const training_status = JSON.parse(data);
+
+    const apFilePath = path.resolve(path.join(process.cwd(), `train_process`,  `project-${projectId}`, `version-${versionId}` , 'results',  'analysis_results', 'all_class_AP.json'));
+    if (fs.existsSync(apFilePath)) {
+      const allClassAP = JSON.parse(fs.readFileSync(apFilePath, 'utf8'));
+      for (const key of Object.keys(training_status)) {
+        const source = key === 'all' ? allClassAP['_statistics'] : allClassAP[key];
+        if (!source) {
+          continue;
+        }
+        for (const metric of COCO_METRICS) {
+          training_status[key][`m${metric}`] = source[key === 'all' ? `m${metric}` : metric] ?? null;
+        }
+      }
+    }
     return new Response(JSON.stringify(training_status), { status: 200 });
 
   }
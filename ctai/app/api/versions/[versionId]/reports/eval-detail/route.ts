@@ -6,16 +6,52 @@ import path from 'path';
 
 export interface IAnnotation {
   gtIdx: number | null;
-  predIdx: number | null;
+  pdIdx: number | null;
   img: string;
   gtBbox: Array<number> | null; // [x1, y1, x2, y2]
   pdBbox: Array<number> | null; // [x1, y1, x2, y2, confidence]
 }
+// columnar cell: the k-th annotation is made of the k-th item of each array,
+// gtIdx/gtBbox are empty for the background column and pdIdx/pdBbox for the background row
+export interface IConfusionCell {
+  img: Array<number>; // index into IEvalDetail.images
+  gtIdx: Array<number>;
+  pdIdx: Array<number>;
+  gtBbox: Array<Array<number>>;
+  pdBbox: Array<Array<number>>;
+}
 export interface IEvalDetail {
-  confusion_matrix: Array<Array<Array<IAnnotation>>>;
+  images: Array<string>;
+  confusion_matrix: Array<Array<IConfusionCell>>; // [predict][truth]
   class_mapping: { [key: string]: string };
 }
 
+// confusion_matrix.json written before the columnar format held one object per annotation
+function toColumnar(legacyMatrix: Array<Array<Array<any>>>): Pick<IEvalDetail, 'images' | 'confusion_matrix'> {
+  const images: Array<string> = [];
+  const imageIdx = new Map<string, number>();
+  const confusion_matrix = legacyMatrix.map(row => row.map(annotations => {
+    const cell: IConfusionCell = { img: [], gtIdx: [], pdIdx: [], gtBbox: [], pdBbox: [] };
+    for (const annotation of annotations) {
+      if (!imageIdx.has(annotation.img)) {
+        imageIdx.set(annotation.img, images.length);
+        images.push(annotation.img);
+      }
+      cell.img.push(imageIdx.get(annotation.img)!);
+      if (annotation.gtBbox) {
+        cell.gtIdx.push(annotation.gtIdx);
+        cell.gtBbox.push(annotation.gtBbox);
+      }
+      if (annotation.pdBbox) {
+        cell.pdIdx.push(annotation.pdIdx);
+        cell.pdBbox.push(annotation.pdBbox);
+      }
+    }
+    return cell;
+  }));
+  return { images, confusion_matrix };
+}
+
 /**
  * Handles the GET request for retrieving confusion matrix for a specific version.
  * @param req - The request object.
@@ -54,8 +90,11 @@ export async function GET(req: Request, { params }: { params: { versionId: numbe
     }
 
     const data = fs.readFileSync(resolvedPath, 'utf8');
-    const training_status = JSON.parse(data);
-    return new Response(JSON.stringify(training_status), { status: 200 });
+    const evalDetail = JSON.parse(data);
+    if (!evalDetail.images) {
+      Object.assign(evalDetail, toColumnar(evalDetail.confusion_matrix));
+    }
+    return new Response(JSON.stringify(evalDetail), { status: 200 });
 
   }
   catch (error) {
@@ -133,7 +133,8 @@ export async function POST(req: Request, { params }: { params: { versionId: numb
                     console.error(res.statusText)
                     return new Response(JSON.stringify({ error: 'Failed to train model' }), { status: 500 });
                 }
-                return new Response(JSON.stringify({ success: true }), { status: 200 })
+                // the training gateway only queues the job, its progress is at /jobs/{jobId} of the gateway
+                return res.json().then((job) => new Response(JSON.stringify({ success: true, jobId: job.jobId }), { status: 200 }))
             }).catch((error) => {
                 return new Response(JSON.stringify({ error: 'Failed to train model' }), { status: 500 });
             });
@@ -192,7 +192,7 @@ export function getEvalDetailPrompt(evalDetail: IEvalDetail) {
                 matrixText += "X".padEnd(15) + " | ";
                 continue;
             }
-            matrixText += evalDetail.confusion_matrix[i][j].length.toString().padEnd(15) + " | ";
+            matrixText += evalDetail.confusion_matrix[i][j].img.length.toString().padEnd(15) + " | ";
         }
         matrixText += "\n";
     }
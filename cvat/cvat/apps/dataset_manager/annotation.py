@@ -5,12 +5,13 @@
 
 from copy import copy, deepcopy
 
-import math
-from typing import Optional, Sequence
+import heapq
+from typing import Iterator, Optional, Sequence, Tuple
 import numpy as np
-from itertools import chain
+from itertools import chain, groupby
 from scipy.optimize import linear_sum_assignment
 from shapely import geometry
+from shapely.prepared import prep
 
 from cvat.apps.engine.models import ShapeType, DimensionType
 from cvat.apps.engine.serializers import LabeledDataSerializer
@@ -106,18 +107,29 @@ class AnnotationIR:
         ]
 
         if len(segment_shapes) < len(track['shapes']):
-            interpolated_shapes = TrackManager.get_interpolated_shapes(
+            interpolated_shapes = TrackManager.get_interpolated_track(
                 track, start, stop, dimension)
-            scoped_shapes = filter_track_shapes(interpolated_shapes)
-
-            if scoped_shapes:
-                if not scoped_shapes[0]['keyframe']:
-                    segment_shapes.insert(0, scoped_shapes[0])
-                if scoped_shapes[-1]['keyframe'] and \
-                        scoped_shapes[-1]['outside']:
-                    segment_shapes.append(scoped_shapes[-1])
+
+            # The same as filter_track_shapes(), but only the boundary
+            # shapes are created
+            frames = interpolated_shapes.frames
+            scoped_indices = np.flatnonzero((start <= frames) & (frames <= stop))
+            visible_indices = np.flatnonzero(~interpolated_shapes.outside[scoped_indices])
+            if len(visible_indices):
+                scoped_indices = scoped_indices[visible_indices[0]:]
+            else:
+                scoped_indices = scoped_indices[:0]
+
+            if len(scoped_indices):
+                first_index = scoped_indices[0]
+                last_index = scoped_indices[-1]
+                if not interpolated_shapes.keyframe[first_index]:
+                    segment_shapes.insert(0, interpolated_shapes[first_index])
+                if interpolated_shapes.keyframe[last_index] and \
+                        interpolated_shapes.outside[last_index]:
+                    segment_shapes.append(interpolated_shapes[last_index])
                 elif stop + 1 < len(interpolated_shapes) and \
-                        interpolated_shapes[stop + 1]['outside']:
+                        interpolated_shapes.outside[stop + 1]:
                     segment_shapes.append(interpolated_shapes[stop + 1])
 
             for shape in segment_shapes:
@@ -184,6 +196,35 @@ class AnnotationManager:
             use_server_track_ids=use_server_track_ids
         )
 
+    def iter_shapes_by_frame(self,
+        end_frame: int,
+        dimension: DimensionType,
+        *,
+        included_frames: Optional[Sequence[int]] = None,
+        include_outside: bool = False,
+        use_server_track_ids: bool = False
+    ) -> Iterator[Tuple[int, list]]:
+        """
+        Yields (frame, shapes) pairs in the frame order. The shapes of a frame
+        are the same and in the same order as in to_shapes().
+        """
+
+        shapes_by_frame = {}
+        for shape in self.data.shapes:
+            if included_frames is None or shape["frame"] in included_frames:
+                shapes_by_frame.setdefault(shape["frame"], []).append(shape)
+
+        tracks = TrackManager(self.data.tracks, dimension)
+        for frame, frame_items in groupby(heapq.merge(
+            ((frame, shapes_by_frame[frame]) for frame in sorted(shapes_by_frame)),
+            tracks.iter_shapes_by_frame(end_frame,
+                included_frames=included_frames, include_outside=include_outside,
+                use_server_track_ids=use_server_track_ids
+            ),
+            key=lambda item: item[0]
+        ), key=lambda item: item[0]):
+            yield frame, [shape for _, frame_shapes in frame_items for shape in frame_shapes]
+
     def to_tracks(self):
         tracks = self.data.tracks
         shapes = ShapeManager(self.data.shapes)
@@ -221,6 +262,30 @@ class ObjectManager:
     def _modify_unmatched_object(self, obj, end_frame):
         raise NotImplementedError()
 
+    def _calc_similarity_matrix(self, objects0, objects1, start_frame, overlap, dimension):
+        # Managers can override it to compute the similarity of all the pairs at once
+        similarity = np.empty(shape=(len(objects0), len(objects1)), dtype=float)
+        for i, obj0 in enumerate(objects0):
+            for j, obj1 in enumerate(objects1):
+                similarity[i][j] = self._calc_objects_similarity(
+                    obj0, obj1, start_frame, overlap, dimension)
+
+        return similarity
+
+    @staticmethod
+    def _group_by_label(objects0, objects1):
+        # Objects with different labels are never similar, so only the indexes
+        # of the labels present in both lists are returned
+        indexes0 = {}
+        for i, obj in enumerate(objects0):
+            indexes0.setdefault(obj.get("label_id"), []).append(i)
+        indexes1 = {}
+        for j, obj in enumerate(objects1):
+            indexes1.setdefault(obj.get("label_id"), []).append(j)
+
+        return [(indexes0[label_id], indexes1[label_id])
+            for label_id in indexes0 if label_id in indexes1]
+
     def merge(self, objects, start_frame, overlap, dimension):
         # 1. Split objects on two parts: new and which can be intersected
         # with existing objects.
@@ -248,31 +313,35 @@ class ObjectManager:
 
         # 4. Build cost matrix for each frame and find correspondence using
         # Hungarian algorithm. In this case min_cost_thresh is stronger
-        # because we compare only on one frame.
+        # because we compare only on one frame. Objects with different labels
+        # can't be matched, so there is a separate cost matrix for each label.
         min_cost_thresh = self._get_cost_threshold()
         for frame in int_objects_by_frame:
             if frame in old_objects_by_frame:
                 int_objects = int_objects_by_frame[frame]
                 old_objects = old_objects_by_frame[frame]
-                cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
-                    dtype=float)
-                # 5.1 Construct cost matrix for the frame.
-                for i, int_obj in enumerate(int_objects):
-                    for j, old_obj in enumerate(old_objects):
-                        cost_matrix[i][j] = 1 - self._calc_objects_similarity(
-                            int_obj, old_obj, start_frame, overlap, dimension)
-
-                # 6. Find optimal solution using Hungarian algorithm.
-                row_ind, col_ind = linear_sum_assignment(cost_matrix)
                 old_objects_indexes = list(range(0, len(old_objects)))
                 int_objects_indexes = list(range(0, len(int_objects)))
-                for i, j in zip(row_ind, col_ind):
-                    # Reject the solution if the cost is too high. Remember
-                    # inside int_objects_indexes objects which were handled.
-                    if cost_matrix[i][j] <= min_cost_thresh:
-                        old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
-                        int_objects_indexes[i] = -1
-                        old_objects_indexes[j] = -1
+                for int_label_indexes, old_label_indexes in self._group_by_label(
+                    int_objects, old_objects
+                ):
+                    # 5. Construct cost matrix for the label on the frame.
+                    cost_matrix = 1 - self._calc_similarity_matrix(
+                        [int_objects[i] for i in int_label_indexes],
+                        [old_objects[j] for j in old_label_indexes],
+                        start_frame, overlap, dimension)
+
+                    # 6. Find optimal solution using Hungarian algorithm.
+                    row_ind, col_ind = linear_sum_assignment(cost_matrix)
+                    for label_i, label_j in zip(row_ind, col_ind):
+                        # Reject the solution if the cost is too high. Remember
+                        # inside int_objects_indexes objects which were handled.
+                        if cost_matrix[label_i][label_j] <= min_cost_thresh:
+                            i = int_label_indexes[label_i]
+                            j = old_label_indexes[label_j]
+                            old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
+                            int_objects_indexes[i] = -1
+                            old_objects_indexes[j] = -1
 
                 # 7. Add all new objects which were not processed.
                 for i in int_objects_indexes:
@@ -413,6 +482,101 @@ class ShapeManager(ObjectManager):
                 return 0 # FIXME: need some similarity for points, polylines, ellipses and 2D cuboids
         return 0
 
+    @staticmethod
+    def _calc_boxes_similarity(boxes0, boxes1):
+        # IoU of all the pairs of axis-aligned boxes, the same values as
+        # _calc_objects_similarity gives for geometry.box() polygons
+        def normalize(boxes):
+            return (np.minimum(boxes[:, 0], boxes[:, 2]), np.minimum(boxes[:, 1], boxes[:, 3]),
+                np.maximum(boxes[:, 0], boxes[:, 2]), np.maximum(boxes[:, 1], boxes[:, 3]))
+
+        x_min0, y_min0, x_max0, y_max0 = normalize(boxes0)
+        x_min1, y_min1, x_max1, y_max1 = normalize(boxes1)
+        area0 = (x_max0 - x_min0) * (y_max0 - y_min0)
+        area1 = (x_max1 - x_min1) * (y_max1 - y_min1)
+
+        overlap_width = np.minimum.outer(x_max0, x_max1) - np.maximum.outer(x_min0, x_min1)
+        overlap_height = np.minimum.outer(y_max0, y_max1) - np.maximum.outer(y_min0, y_min1)
+        overlap_area = np.clip(overlap_width, 0, None) * np.clip(overlap_height, 0, None)
+        union_area = np.add.outer(area0, area1) - overlap_area
+
+        # boxes without area are lines or points, their similarity is 0
+        has_area = np.outer(area0 > 0, area1 > 0)
+        return np.divide(overlap_area, union_area,
+            out=np.zeros_like(overlap_area), where=has_area)
+
+    @staticmethod
+    def _calc_polygons_similarity_matrix(points0, points1):
+        def make_polygons(points):
+            polygons = [geometry.Polygon(pairwise(p)) for p in points]
+            # invalid polygons and lines with many points are never similar to anything
+            areas = np.array([p.area if p.is_valid else 0 for p in polygons], dtype=float)
+            bounds = np.array([p.bounds if area else (0, 0, 0, 0)
+                for p, area in zip(polygons, areas)], dtype=float)
+            return polygons, areas, bounds
+
+        polygons0, areas0, bounds0 = make_polygons(points0)
+        polygons1, areas1, bounds1 = make_polygons(points1)
+
+        # Only the polygons with overlapping bounding boxes can intersect
+        candidates = np.outer(areas0 > 0, areas1 > 0)
+        candidates &= np.less.outer(bounds0[:, 0], bounds1[:, 2])
+        candidates &= np.greater.outer(bounds0[:, 2], bounds1[:, 0])
+        candidates &= np.less.outer(bounds0[:, 1], bounds1[:, 3])
+        candidates &= np.greater.outer(bounds0[:, 3], bounds1[:, 1])
+
+        similarity = np.zeros(shape=(len(polygons0), len(polygons1)), dtype=float)
+        prepared_polygons0 = {}
+        for i, j in zip(*np.nonzero(candidates)):
+            prepared_polygon0 = prepared_polygons0.get(i)
+            if prepared_polygon0 is None:
+                prepared_polygon0 = prepared_polygons0[i] = prep(polygons0[i])
+            if prepared_polygon0.intersects(polygons1[j]):
+                overlap_area = polygons0[i].intersection(polygons1[j]).area
+                similarity[i][j] = overlap_area / (areas0[i] + areas1[j] - overlap_area)
+
+        return similarity
+
+    def _calc_similarity_matrix(self, objects0, objects1, start_frame, overlap, dimension):
+        similarity = np.zeros(shape=(len(objects0), len(objects1)), dtype=float)
+        for indexes0, indexes1 in self._group_by_label(objects0, objects1):
+            for shape_type in [ShapeType.RECTANGLE, ShapeType.CUBOID, ShapeType.POLYGON]:
+                if shape_type == ShapeType.CUBOID and dimension != DimensionType.DIM_3D:
+                    continue # FIXME: need some similarity for 2D cuboids
+
+                type_indexes0 = [i for i in indexes0 if objects0[i]["type"] == shape_type]
+                type_indexes1 = [j for j in indexes1 if objects1[j]["type"] == shape_type]
+                if not type_indexes0 or not type_indexes1:
+                    continue
+
+                points0 = [objects0[i]["points"] for i in type_indexes0]
+                points1 = [objects1[j]["points"] for j in type_indexes1]
+                if shape_type == ShapeType.RECTANGLE:
+                    # FIXME: need to consider rotated boxes
+                    type_similarity = self._calc_boxes_similarity(
+                        np.array(points0, dtype=float), np.array(points1, dtype=float))
+                elif shape_type == ShapeType.CUBOID:
+                    def get_views(points):
+                        points = np.array([p[0:9] for p in points], dtype=float)
+                        x_c, y_c, z_c = points[:, 0], points[:, 1], points[:, 2]
+                        x_len, y_len, z_len = points[:, 6], points[:, 7], points[:, 8]
+                        top_view = np.stack([x_c - x_len / 2, y_c - y_len / 2,
+                            x_c + x_len / 2, y_c + y_len / 2], axis=1)
+                        side_view = np.stack([x_c - x_len / 2, z_c - z_len / 2,
+                            x_c + x_len / 2, z_c + z_len / 2], axis=1)
+                        return top_view, side_view
+
+                    top_view0, side_view0 = get_views(points0)
+                    top_view1, side_view1 = get_views(points1)
+                    type_similarity = self._calc_boxes_similarity(top_view0, top_view1) * \
+                        self._calc_boxes_similarity(side_view0, side_view1)
+                else:
+                    type_similarity = self._calc_polygons_similarity_matrix(points0, points1)
+
+                similarity[np.ix_(type_indexes0, type_indexes1)] = type_similarity
+
+        return similarity
+
     @staticmethod
     def _unite_objects(obj0, obj1):
         # TODO: improve the trivial implementation
@@ -421,6 +585,125 @@ class ShapeManager(ObjectManager):
     def _modify_unmatched_object(self, obj, end_frame):
         pass
 
+class InterpolatedShapes(Sequence[dict]):
+    """
+    Shapes of a track on a range of frames. The frame numbers, the outside
+    and the keyframe flags are available as arrays, the shapes themselves
+    are only created when they are accessed. Keyframes are returned as is,
+    other shapes are new objects on each access.
+    """
+
+    def __init__(self, keyframes, *,
+        frames, sources, keyframe, outside, rotations,
+        point_blocks, point_block_ids, point_rows
+    ):
+        self._keyframes = keyframes
+        # The copied shapes must not see the later changes of the keyframes
+        self._sources = [
+            dict(shape, attributes=deepcopy_simple(shape["attributes"]))
+            for shape in keyframes
+        ]
+        self._source_ids = sources
+        self._rotations = rotations
+        self._point_blocks = point_blocks
+        self._point_block_ids = point_block_ids
+        self._point_rows = point_rows
+
+        self.frames = frames
+        self.keyframe = keyframe
+        self.outside = outside
+
+    @classmethod
+    def empty(cls):
+        return cls([],
+            frames=np.empty(0, dtype=int),
+            sources=np.empty(0, dtype=int),
+            keyframe=np.empty(0, dtype=bool),
+            outside=np.empty(0, dtype=bool),
+            rotations=np.empty(0),
+            point_blocks=[],
+            point_block_ids=np.empty(0, dtype=int),
+            point_rows=np.empty(0, dtype=int),
+        )
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        index = range(len(self))[index]
+        if isinstance(index, range):
+            return [self._get_shape(i) for i in index]
+
+        return self._get_shape(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get_shape(i)
+
+    def _get_shape(self, index):
+        if self.keyframe[index]:
+            return self._keyframes[self._source_ids[index]]
+
+        source = self._sources[self._source_ids[index]]
+        shape = source.copy()
+        shape["attributes"] = deepcopy_simple(source["attributes"])
+        shape["keyframe"] = False
+        shape["frame"] = int(self.frames[index])
+
+        rotation = self._rotations[index]
+        if not np.isnan(rotation):
+            shape["rotation"] = float(rotation)
+
+        point_block_id = self._point_block_ids[index]
+        if point_block_id == -1:
+            points = source["points"]
+        else:
+            points = self._point_blocks[point_block_id][self._point_rows[index]]
+
+        if isinstance(points, np.ndarray):
+            shape["points"] = points.tolist()
+        else:
+            shape["points"] = points.copy()
+
+        return shape
+
+class _ExportedTrackShapes:
+    # The shapes of a track returned by TrackManager.to_shapes(),
+    # they are only created by make_shape()
+
+    def __init__(self, track, track_id, shapes: InterpolatedShapes,
+        indices: Optional[np.ndarray] = None, elements: Optional[list] = None
+    ):
+        self.track = track
+        self.track_id = track_id
+        self.shapes = shapes
+        self.indices = np.arange(len(shapes)) if indices is None else indices
+        self.elements = elements or []
+
+    def __len__(self):
+        return len(self.indices)
+
+    def get_frame(self, i) -> int:
+        return int(self.shapes.frames[self.indices[i]])
+
+    def make_shape(self, i) -> dict:
+        shape = self.shapes[self.indices[i]]
+        shape["label_id"] = self.track["label_id"]
+        shape["group"] = self.track["group"]
+        shape["track_id"] = self.track_id
+        shape["source"] = self.track["source"]
+        shape["attributes"] += self.track["attributes"]
+        shape["elements"] = []
+
+        frame = shape["frame"]
+        for element in self.elements:
+            element_index = np.searchsorted(element.shapes.frames, frame)
+            if element_index < len(element.shapes) and \
+                    element.shapes.frames[element_index] == frame:
+                shape["elements"].append(element.make_shape(element_index))
+
+        return shape
+
 class TrackManager(ObjectManager):
     def __init__(self, objects, dimension):
         self._dimension = dimension
@@ -433,52 +716,105 @@ class TrackManager(ObjectManager):
     ) -> list:
         shapes = []
         for idx, track in enumerate(self.objects):
-            track_id = track["id"] if use_server_track_ids else idx
-            track_shapes = {}
-
-            for shape in TrackManager.get_interpolated_shapes(
-                track,
-                0,
-                end_frame,
-                self._dimension,
-                include_outside=include_outside,
-                included_frames=included_frames,
-            ):
-                shape["label_id"] = track["label_id"]
-                shape["group"] = track["group"]
-                shape["track_id"] = track_id
-                shape["source"] = track["source"]
-                shape["attributes"] += track["attributes"]
-                shape["elements"] = []
-
-                track_shapes[shape["frame"]] = shape
-
-            if not track_shapes:
-                # This track has no elements on the included frames
-                continue
+            track_shapes = self._get_exported_track_shapes(track, idx, end_frame,
+                included_frames=included_frames, include_outside=include_outside,
+                use_server_track_ids=use_server_track_ids
+            )
+            shapes.extend(track_shapes.make_shape(i) for i in range(len(track_shapes)))
+        return shapes
 
-            if track.get("elements"):
-                track_elements = TrackManager(track["elements"], self._dimension)
-                element_shapes = track_elements.to_shapes(end_frame,
-                    included_frames=set(track_shapes.keys()).intersection(included_frames or []),
-                    include_outside=True, # elements are controlled by the parent shape
+    def iter_shapes_by_frame(self, end_frame: int, *,
+        included_frames: Optional[Sequence[int]] = None,
+        include_outside: bool = False,
+        use_server_track_ids: bool = False
+    ) -> Iterator[Tuple[int, list]]:
+        """
+        Yields (frame, shapes) pairs in the frame order with the same shapes
+        as to_shapes(). The shapes are only created when their frame is reached,
+        the tracks are interpolated when their first keyframe is reached.
+        """
+
+        pending_tracks = sorted(
+            (min(shape["frame"] for shape in track["shapes"]), idx)
+            for idx, track in enumerate(self.objects)
+            if track["shapes"]
+        )
+        pending_tracks.reverse()
+
+        active_tracks = [] # a heap of (frame, track idx, shape index, track shapes)
+        while pending_tracks or active_tracks:
+            frame = active_tracks[0][0] if active_tracks else None
+            if pending_tracks and (frame is None or pending_tracks[-1][0] <= frame):
+                _, idx = pending_tracks.pop()
+                track_shapes = self._get_exported_track_shapes(self.objects[idx], idx, end_frame,
+                    included_frames=included_frames, include_outside=include_outside,
                     use_server_track_ids=use_server_track_ids
                 )
+                if len(track_shapes):
+                    heapq.heappush(active_tracks, (track_shapes.get_frame(0), idx, 0, track_shapes))
+                continue
 
-                for shape in element_shapes:
-                    track_shapes[shape["frame"]]["elements"].append(shape)
+            frame_shapes = []
+            while active_tracks and active_tracks[0][0] == frame:
+                _, idx, i, track_shapes = heapq.heappop(active_tracks)
+                frame_shapes.append(track_shapes.make_shape(i))
+                if i + 1 < len(track_shapes):
+                    heapq.heappush(active_tracks,
+                        (track_shapes.get_frame(i + 1), idx, i + 1, track_shapes))
+
+            yield frame, frame_shapes
+
+    def _get_exported_track_shapes(self, track, idx, end_frame, *,
+        included_frames, include_outside, use_server_track_ids
+    ) -> _ExportedTrackShapes:
+        track_id = track["id"] if use_server_track_ids else idx
+        track_shapes = TrackManager.get_interpolated_track(
+            track,
+            0,
+            end_frame,
+            self._dimension,
+            include_outside=include_outside,
+            included_frames=included_frames,
+        )
 
-                # The whole shape can be filtered out, if all its elements are outside,
-                # and outside shapes are not requested.
-                if not include_outside:
-                    track_shapes = {
-                        frame_number: shape for frame_number, shape in track_shapes.items()
-                        if not shape["elements"]
-                        or not all(elem["outside"] for elem in shape["elements"])
-                    }
+        if not track_shapes:
+            # This track has no elements on the included frames
+            return _ExportedTrackShapes(track, track_id, track_shapes, np.empty(0, dtype=int))
+
+        selected_shapes = np.ones(len(track_shapes), dtype=bool)
+        elements = []
+        if track.get("elements"):
+            element_frames = set(track_shapes.frames.tolist()).intersection(included_frames or [])
+            elements = [
+                _ExportedTrackShapes(
+                    element,
+                    element["id"] if use_server_track_ids else element_idx,
+                    TrackManager.get_interpolated_track(
+                        element,
+                        0,
+                        end_frame,
+                        self._dimension,
+                        include_outside=True, # elements are controlled by the parent shape
+                        included_frames=element_frames,
+                    ),
+                )
+                for element_idx, element in enumerate(track["elements"])
+            ]
 
-            shapes.extend(track_shapes.values())
-        return shapes
+            # The whole shape can be filtered out, if all its elements are outside,
+            # and outside shapes are not requested.
+            if not include_outside:
+                has_elements = np.zeros(len(track_shapes), dtype=bool)
+                has_visible_elements = np.zeros(len(track_shapes), dtype=bool)
+                for element in elements:
+                    indices = np.searchsorted(track_shapes.frames, element.shapes.frames)
+                    has_elements[indices] = True
+                    has_visible_elements[indices] |= ~element.shapes.outside
+
+                selected_shapes = ~has_elements | has_visible_elements
+
+        return _ExportedTrackShapes(track, track_id, track_shapes,
+            np.flatnonzero(selected_shapes), elements)
 
     @staticmethod
     def _get_objects_by_frame(objects, start_frame):
@@ -502,38 +838,72 @@ class TrackManager(ObjectManager):
         return 0.5
 
     @staticmethod
-    def _calc_objects_similarity(obj0, obj1, start_frame, overlap, dimension):
-        if obj0["label_id"] == obj1["label_id"]:
-            # Here start_frame is the start frame of next segment
-            # and stop_frame is the stop frame of current segment
-            # end_frame == stop_frame + 1
-            end_frame = start_frame + overlap
-            obj0_shapes = TrackManager.get_interpolated_shapes(obj0, start_frame, end_frame, dimension)
-            obj1_shapes = TrackManager.get_interpolated_shapes(obj1, start_frame, end_frame, dimension)
-            if not obj0_shapes or not obj1_shapes:
-                return 0
-
-            obj0_shapes_by_frame = {shape["frame"]:shape for shape in obj0_shapes}
-            obj1_shapes_by_frame = {shape["frame"]:shape for shape in obj1_shapes}
-
-            count, error = 0, 0
-            for frame in range(start_frame, end_frame):
-                shape0 = obj0_shapes_by_frame.get(frame)
-                shape1 = obj1_shapes_by_frame.get(frame)
-                if shape0 and shape1:
-                    if shape0["outside"] != shape1["outside"]:
-                        error += 1
-                    else:
-                        error += 1 - ShapeManager._calc_objects_similarity(shape0, shape1, start_frame, overlap, dimension)
-                    count += 1
-                elif shape0 or shape1:
+    def _get_shapes_by_frame(track, start_frame, overlap, dimension):
+        # Here start_frame is the start frame of next segment
+        # and stop_frame is the stop frame of current segment
+        # end_frame == stop_frame + 1
+        end_frame = start_frame + overlap
+        shapes = TrackManager.get_interpolated_shapes(track, start_frame, end_frame, dimension)
+        return {shape["frame"]:shape for shape in shapes}
+
+    @staticmethod
+    def _calc_shapes_similarity(obj0_shapes_by_frame, obj1_shapes_by_frame,
+        start_frame, overlap, dimension
+    ):
+        if not obj0_shapes_by_frame or not obj1_shapes_by_frame:
+            return 0
+
+        count, error = 0, 0
+        for frame in range(start_frame, start_frame + overlap):
+            shape0 = obj0_shapes_by_frame.get(frame)
+            shape1 = obj1_shapes_by_frame.get(frame)
+            if shape0 and shape1:
+                if shape0["outside"] != shape1["outside"]:
                     error += 1
-                    count += 1
+                else:
+                    error += 1 - ShapeManager._calc_objects_similarity(shape0, shape1, start_frame, overlap, dimension)
+                count += 1
+            elif shape0 or shape1:
+                error += 1
+                count += 1
+
+        return 1 - error / (count or 1)
 
-            return 1 - error / (count or 1)
+    @staticmethod
+    def _calc_objects_similarity(obj0, obj1, start_frame, overlap, dimension):
+        if obj0["label_id"] == obj1["label_id"]:
+            return TrackManager._calc_shapes_similarity(
+                TrackManager._get_shapes_by_frame(obj0, start_frame, overlap, dimension),
+                TrackManager._get_shapes_by_frame(obj1, start_frame, overlap, dimension),
+                start_frame, overlap, dimension)
         else:
             return 0
 
+    def _calc_similarity_matrix(self, objects0, objects1, start_frame, overlap, dimension):
+        # Each track is interpolated once, not once for every pair
+        similarity = np.zeros(shape=(len(objects0), len(objects1)), dtype=float)
+        for indexes0, indexes1 in self._group_by_label(objects0, objects1):
+            shapes0 = [self._get_shapes_by_frame(objects0[i], start_frame, overlap, dimension)
+                for i in indexes0]
+            shapes1 = [self._get_shapes_by_frame(objects1[j], start_frame, overlap, dimension)
+                for j in indexes1]
+            for i, obj0_shapes_by_frame in zip(indexes0, shapes0):
+                for j, obj1_shapes_by_frame in zip(indexes1, shapes1):
+                    similarity[i][j] = self._calc_shapes_similarity(
+                        obj0_shapes_by_frame, obj1_shapes_by_frame,
+                        start_frame, overlap, dimension)
+
+        return similarity
+
+    def finish_tracks(self, tracks, end_frame):
+        """
+        Makes the tracks outside from end_frame, like merge() does with the tracks
+        of the previous segment that have no match in the next one
+        """
+        for track in tracks:
+            if track["shapes"]:
+                self._modify_unmatched_object(track, end_frame)
+
     def _modify_unmatched_object(self, obj, end_frame):
         shape = obj["shapes"][-1]
         if not shape["outside"]:
@@ -551,27 +921,51 @@ class TrackManager(ObjectManager):
         included_frames: Optional[Sequence[int]] = None,
         include_outside: bool = False,
     ):
-        def copy_shape(source, frame, points=None, rotation=None):
-            copied = source.copy()
-            copied["attributes"] = deepcopy_simple(source["attributes"])
-
-            copied["keyframe"] = False
-            copied["frame"] = frame
-            if rotation is not None:
-                copied["rotation"] = rotation
+        return list(TrackManager.get_interpolated_track(
+            track, start_frame, end_frame, dimension,
+            included_frames=included_frames, include_outside=include_outside
+        ))
 
+    @staticmethod
+    def get_interpolated_track(
+        track, start_frame, end_frame, dimension, *,
+        included_frames: Optional[Sequence[int]] = None,
+        include_outside: bool = False,
+    ) -> InterpolatedShapes:
+        # The rows of the result, added by segments between the keyframes
+        row_frames = []
+        row_sources = []
+        row_keyframes = []
+        row_rotations = []
+        row_point_blocks = []
+        row_point_rows = []
+        point_blocks = []
+
+        def add_rows(frames, source_id, *, is_keyframe=False, points=None, rotations=None):
+            count = len(frames)
+            if not count:
+                return
+
+            row_frames.append(np.asarray(frames, dtype=int))
+            row_sources.append(np.full(count, source_id, dtype=int))
+            row_keyframes.append(np.full(count, is_keyframe, dtype=bool))
+            row_rotations.append(np.full(count, np.nan) if rotations is None else rotations)
             if points is None:
-                points = copied["points"]
-
-            if isinstance(points, np.ndarray):
-                points = points.tolist()
+                row_point_blocks.append(np.full(count, -1, dtype=int))
             else:
-                points = points.copy()
+                row_point_blocks.append(np.full(count, len(point_blocks), dtype=int))
+                point_blocks.append(points)
+            row_point_rows.append(np.arange(count))
 
-            if points is not None:
-                copied["points"] = points
+        def get_frames(start, stop):
+            frames = np.arange(start, stop)
+            if included_frames is not None and len(frames):
+                frames = frames[np.fromiter(
+                    (frame in included_frames for frame in range(start, stop)),
+                    dtype=bool, count=len(frames)
+                )]
 
-            return copied
+            return frames
 
         def find_angle_diff(right_angle, left_angle):
             angle_diff = right_angle - left_angle
@@ -583,50 +977,23 @@ class TrackManager(ObjectManager):
 
             return angle_diff
 
-        def simple_interpolation(shape0, shape1):
-            shapes = []
+        def simple_interpolation(source_id, shape0, shape1, frames):
             distance = shape1["frame"] - shape0["frame"]
             diff = np.subtract(shape1["points"], shape0["points"])
 
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                offset = (frame - shape0["frame"]) / distance
-                rotation = (shape0["rotation"] + find_angle_diff(
-                    shape1["rotation"], shape0["rotation"],
-                ) * offset + 360) % 360
-                points = shape0["points"] + diff * offset
-
-                if included_frames is None or frame in included_frames:
-                    shapes.append(copy_shape(shape0, frame, points, rotation))
-
-            return shapes
-
-        def simple_3d_interpolation(shape0, shape1):
-            result = simple_interpolation(shape0, shape1)
-            angles = (shape0["points"][3:6] + shape1["points"][3:6])
-            distance = shape1["frame"] - shape0["frame"]
-
-            for shape in result:
-                offset = (shape["frame"] - shape0["frame"]) / distance
-                for i, angle0 in enumerate(angles):
-                    if i < 3:
-                        angle1 = angles[i + 3]
-                        angle0 = (angle0 if angle0 >= 0 else angle0 + math.pi * 2) * 180 / math.pi
-                        angle1 = (angle1 if angle1 >= 0 else angle1 + math.pi * 2) * 180 / math.pi
-                        angle = angle0 + find_angle_diff(angle1, angle0) * offset * math.pi / 180
-                        shape["points"][i + 3] = angle if angle <= math.pi else angle - math.pi * 2
+            offsets = (frames - shape0["frame"]) / distance
+            rotations = (shape0["rotation"] + find_angle_diff(
+                shape1["rotation"], shape0["rotation"],
+            ) * offsets + 360) % 360
+            points = shape0["points"] + diff * offsets[:, np.newaxis]
 
-            return result
+            add_rows(frames, source_id, points=points, rotations=rotations)
 
-        def points_interpolation(shape0, shape1):
+        def points_interpolation(source_id, shape0, shape1, frames):
             if len(shape0["points"]) == 2 and len(shape1["points"]) == 2:
-                return simple_interpolation(shape0, shape1)
+                simple_interpolation(source_id, shape0, shape1, frames)
             else:
-                shapes = []
-                for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                    if included_frames is None or frame in included_frames:
-                        shapes.append(copy_shape(shape0, frame))
-
-            return shapes
+                add_rows(frames, source_id)
 
         def interpolate_position(left_position, right_position, offset):
             def to_array(points):
@@ -824,8 +1191,7 @@ class TrackManager(ObjectManager):
 
             return to_array(reducedPoints).tolist()
 
-        def polyshape_interpolation(shape0, shape1):
-            shapes = []
+        def polyshape_interpolation(source_id, shape0, shape1, frames):
             is_polygon = shape0["type"] == ShapeType.POLYGON
             if is_polygon:
                 # Make the polygon closed for computations
@@ -835,23 +1201,20 @@ class TrackManager(ObjectManager):
                 shape1["points"] = shape1["points"] + shape1["points"][:2]
 
             distance = shape1["frame"] - shape0["frame"]
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
+            points = []
+            for frame in frames.tolist():
                 offset = (frame - shape0["frame"]) / distance
-                points = interpolate_position(shape0, shape1, offset)
+                frame_points = interpolate_position(shape0, shape1, offset)
 
-                if included_frames is None or frame in included_frames:
-                    shapes.append(copy_shape(shape0, frame, points))
+                if is_polygon:
+                    # Remove the extra point added
+                    frame_points = frame_points[:-2]
 
-            if is_polygon:
-                # Remove the extra point added
-                shape0["points"] = shape0["points"][:-2]
-                shape1["points"] = shape1["points"][:-2]
-                for shape in shapes:
-                    shape["points"] = shape["points"][:-2]
+                points.append(frame_points)
 
-            return shapes
+            add_rows(frames, source_id, points=points)
 
-        def interpolate(shape0, shape1):
+        def interpolate(source_id, shape0, shape1, frames):
             is_same_type = shape0["type"] == shape1["type"]
             is_rectangle = shape0["type"] == ShapeType.RECTANGLE
             is_ellipse = shape0["type"] == ShapeType.ELLIPSE
@@ -864,28 +1227,16 @@ class TrackManager(ObjectManager):
             if not is_same_type:
                 raise NotImplementedError()
 
-            shapes = []
-            if dimension == DimensionType.DIM_3D:
-                shapes = simple_3d_interpolation(shape0, shape1)
             if is_rectangle or is_cuboid or is_ellipse or is_skeleton:
-                shapes = simple_interpolation(shape0, shape1)
+                simple_interpolation(source_id, shape0, shape1, frames)
             elif is_points:
-                shapes = points_interpolation(shape0, shape1)
+                points_interpolation(source_id, shape0, shape1, frames)
             elif is_polygon or is_polyline:
-                shapes = polyshape_interpolation(shape0, shape1)
+                polyshape_interpolation(source_id, shape0, shape1, frames)
             else:
                 raise NotImplementedError()
 
-            return shapes
-
-        def propagate(shape, end_frame, *, included_frames=None):
-            return [
-                copy_shape(shape, i)
-                for i in range(shape["frame"] + 1, end_frame)
-                if included_frames is None or i in included_frames
-            ]
-
-        shapes = []
+        keyframes = []
         prev_shape = None
         for shape in sorted(track["shapes"], key=lambda shape: shape["frame"]):
             curr_frame = shape["frame"]
@@ -896,18 +1247,11 @@ class TrackManager(ObjectManager):
                 #        vvvvvvv
                 # ---- | ------- | ----- | ----->
                 #     prev      end   cur kf
-                interpolated = interpolate(prev_shape, shape)
-                interpolated.append(shape)
+                interpolate(len(keyframes) - 1, prev_shape, shape,
+                    get_frames(prev_shape["frame"] + 1, end_frame))
 
-                for shape in sorted(interpolated, key=lambda shape: shape["frame"]):
-                    if shape["frame"] < end_frame:
-                        shapes.append(shape)
-                    else:
-                        break
-
-                # Update the last added shape
                 shape["keyframe"] = True
-                prev_shape = shape
+                prev_shape = None
 
                 break # The track finishes here
 
@@ -920,35 +1264,55 @@ class TrackManager(ObjectManager):
                         shape["attributes"].append(deepcopy_simple(attr))
 
                 if not prev_shape["outside"] or include_outside:
-                    shapes.extend(interpolate(prev_shape, shape))
+                    interpolate(len(keyframes) - 1, prev_shape, shape,
+                        get_frames(prev_shape["frame"] + 1, curr_frame))
 
             shape["keyframe"] = True
-            shapes.append(shape)
+            keyframes.append(shape)
+            add_rows([curr_frame], len(keyframes) - 1, is_keyframe=True)
             prev_shape = shape
 
         if prev_shape and (not prev_shape["outside"] or include_outside):
             # When the latest keyframe of a track is less than the end_frame
             # and it is not outside, need to propagate
-            shapes.extend(propagate(prev_shape, end_frame, included_frames=included_frames))
+            add_rows(get_frames(prev_shape["frame"] + 1, end_frame), len(keyframes) - 1)
 
-        shapes = [
-            shape for shape in shapes
+        if not row_frames:
+            return InterpolatedShapes.empty()
 
-            # After interpolation there can be a finishing frame
-            # outside of the task boundaries. Filter it out to avoid errors.
-            # https://github.com/openvinotoolkit/cvat/issues/2827
-            if track["frame"] <= shape["frame"] < end_frame
+        frames = np.concatenate(row_frames)
+        sources = np.concatenate(row_sources)
+        is_keyframe = np.concatenate(row_keyframes)
+        outside = np.array([shape["outside"] for shape in keyframes], dtype=bool)[sources]
 
-            # Exclude outside shapes.
-            # Keyframes should be included regardless the outside value
-            # If really needed, they can be excluded on the later stages,
-            # but here they represent a finishing shape in a visible sequence
-            if shape["keyframe"] or not shape["outside"] or include_outside
+        # After interpolation there can be a finishing frame
+        # outside of the task boundaries. Filter it out to avoid errors.
+        # https://github.com/openvinotoolkit/cvat/issues/2827
+        selected = (track["frame"] <= frames) & (frames < end_frame)
 
-            if included_frames is None or shape["frame"] in included_frames
-        ]
+        # Exclude outside shapes.
+        # Keyframes should be included regardless the outside value
+        # If really needed, they can be excluded on the later stages,
+        # but here they represent a finishing shape in a visible sequence
+        if not include_outside:
+            selected &= is_keyframe | ~outside
 
-        return shapes
+        if included_frames is not None:
+            # Only the keyframes are not checked yet
+            for i in np.flatnonzero(is_keyframe):
+                if int(frames[i]) not in included_frames:
+                    selected[i] = False
+
+        return InterpolatedShapes(keyframes,
+            frames=frames[selected],
+            sources=sources[selected],
+            keyframe=is_keyframe[selected],
+            outside=outside[selected],
+            rotations=np.concatenate(row_rotations)[selected],
+            point_blocks=point_blocks,
+            point_block_ids=np.concatenate(row_point_blocks)[selected],
+            point_rows=np.concatenate(row_point_rows)[selected],
+        )
 
     @staticmethod
     def _unite_objects(obj0, obj1):
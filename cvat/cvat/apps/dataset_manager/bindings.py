@@ -5,10 +5,12 @@
 
 from __future__ import annotations
 
+import heapq
 import os.path as osp
 import sys
 from collections import namedtuple
 from functools import reduce
+from itertools import groupby
 from operator import add
 from pathlib import Path
 from types import SimpleNamespace
@@ -81,6 +83,12 @@ class InstanceLabelData:
                 **attr_mapping['immutable'],
             }
 
+        # spec id -> name, for the exported attributes
+        self._attribute_names = {}
+        for attr_mapping in self._attribute_mapping_merged.values():
+            for spec_id, name in attr_mapping.items():
+                self._attribute_names.setdefault(spec_id, name)
+
     def _get_label_id(self, label_name, parent_id=None):
         for db_label in self._label_mapping.values():
             if label_name == db_label.name and parent_id == db_label.parent_id:
@@ -91,9 +99,7 @@ class InstanceLabelData:
         return self._label_mapping[label_id].name
 
     def _get_attribute_name(self, attribute_id):
-        for attribute_mapping in self._attribute_mapping_merged.values():
-            if attribute_id in attribute_mapping:
-                return attribute_mapping[attribute_id]
+        return self._attribute_names.get(attribute_id)
 
     def _get_attribute_id(self, label_id, attribute_name, attribute_type=None):
         if attribute_type:
@@ -167,6 +173,7 @@ class InstanceLabelData:
                 **self._attribute_mapping[label_id]['mutable'],
                 **self._attribute_mapping[label_id]['immutable'],
             }
+            self._attribute_names.setdefault(spec_id, attribute.name)
 
 
         return { 'spec_id': spec_id, 'value': value }
@@ -366,8 +373,11 @@ class CommonData(InstanceLabelData):
 
     def _export_track(self, track, idx):
         track['shapes'] = list(filter(lambda x: not self._is_frame_deleted(x['frame']), track['shapes']))
-        tracked_shapes = TrackManager.get_interpolated_shapes(
+        interpolated_shapes = TrackManager.get_interpolated_track(
             track, 0, self.stop, self._annotation_ir.dimension)
+        tracked_shapes = [interpolated_shapes[i]
+            for i, frame in enumerate(interpolated_shapes.frames.tolist())
+            if not self._is_frame_deleted(frame)]
         for tracked_shape in tracked_shapes:
             tracked_shape["attributes"] += track["attributes"]
             tracked_shape["track_id"] = track["track_id"] if self._use_server_track_ids else idx
@@ -380,8 +390,7 @@ class CommonData(InstanceLabelData):
             label=self._get_label_name(track["label_id"]),
             group=track["group"],
             source=track["source"],
-            shapes=[self._export_tracked_shape(shape)
-                for shape in tracked_shapes if not self._is_frame_deleted(shape["frame"])],
+            shapes=[self._export_tracked_shape(shape) for shape in tracked_shapes],
             elements=[self._export_track(element, i) for i, element in enumerate(track.get("elements", []))]
         )
 
@@ -395,65 +404,68 @@ class CommonData(InstanceLabelData):
         )
 
     def group_by_frame(self, include_empty: bool = False):
-        frames = {}
-        def get_frame(idx):
-            frame_info = self._frame_info[idx]
-            frame = self.abs_frame_id(idx)
-            if frame not in frames:
-                frames[frame] = CommonData.Frame(
-                    idx=idx,
-                    id=frame_info.get("id", 0),
-                    frame=frame,
-                    name=frame_info["path"],
-                    height=frame_info["height"],
-                    width=frame_info["width"],
-                    labeled_shapes=[],
-                    tags=[],
-                    shapes=[],
-                    labels={}
-                )
-            return frames[frame]
+        """
+        Yields the frames in the frame order. The annotations of a frame
+        are only exported when the frame is reached.
+        """
 
         included_frames = self.get_included_frames()
 
+        tags_by_frame = {}
+        for tag in self._annotation_ir.tags:
+            if tag['frame'] in included_frames:
+                tags_by_frame.setdefault(tag['frame'], []).append(tag)
+
+        frame_ids = set(tags_by_frame)
         if include_empty:
-            for idx in sorted(set(self._frame_info) & included_frames):
-                get_frame(idx)
+            frame_ids.update(set(self._frame_info) & included_frames)
+
+        labels = {
+            label.id: label
+            for label in map(self._export_label, self._label_mapping.values())
+        }
 
         anno_manager = AnnotationManager(self._annotation_ir)
-        for shape in sorted(
-            anno_manager.to_shapes(self.stop, self._annotation_ir.dimension,
+        for idx, frame_items in groupby(heapq.merge(
+            anno_manager.iter_shapes_by_frame(self.stop, self._annotation_ir.dimension,
                 # Skip outside, deleted and excluded frames
                 included_frames=included_frames,
                 include_outside=False,
                 use_server_track_ids=self._use_server_track_ids
             ),
-            key=lambda shape: shape.get("z_order", 0)
-        ):
-            shape_data = ''
-
-            if 'track_id' in shape:
-                if shape['outside']:
-                    continue
-                exported_shape = self._export_tracked_shape(shape)
-            else:
-                exported_shape = self._export_labeled_shape(shape)
-                shape_data = self._export_shape(shape)
-
-            get_frame(shape['frame']).labeled_shapes.append(exported_shape)
-
-            if shape_data:
-                get_frame(shape['frame']).shapes.append(shape_data)
-                for label in self._label_mapping.values():
-                    label = self._export_label(label)
-                    get_frame(shape['frame']).labels.update({label.id: label})
+            ((idx, []) for idx in sorted(frame_ids)),
+            key=lambda item: item[0]
+        ), key=lambda item: item[0]):
+            labeled_shapes = []
+            shapes = []
+            for shape in sorted(
+                (shape for _, frame_shapes in frame_items for shape in frame_shapes),
+                key=lambda shape: shape.get("z_order", 0)
+            ):
+                if 'track_id' in shape:
+                    if shape['outside']:
+                        continue
+                    labeled_shapes.append(self._export_tracked_shape(shape))
+                else:
+                    labeled_shapes.append(self._export_labeled_shape(shape))
+                    shapes.append(self._export_shape(shape))
 
-        for tag in self._annotation_ir.tags:
-            if tag['frame'] not in included_frames:
+            if not labeled_shapes and idx not in frame_ids:
                 continue
-            get_frame(tag['frame']).tags.append(self._export_tag(tag))
 
-        return iter(frames.values())
+            frame_info = self._frame_info[idx]
+            yield CommonData.Frame(
+                idx=idx,
+                id=frame_info.get("id", 0),
+                frame=self.abs_frame_id(idx),
+                name=frame_info["path"],
+                height=frame_info["height"],
+                width=frame_info["width"],
+                labeled_shapes=labeled_shapes,
+                tags=[self._export_tag(tag) for tag in tags_by_frame.get(idx, [])],
+                shapes=shapes,
+                labels=dict(labels) if shapes else {},
+            )
 
     @property
     def shapes(self):
@@ -1107,9 +1119,12 @@ class ProjectData(InstanceLabelData):
 
     def _export_track(self, track: dict, task_id: int, task_size: int, idx: int):
         track['shapes'] = list(filter(lambda x: (task_id, x['frame']) not in self._deleted_frames, track['shapes']))
-        tracked_shapes = TrackManager.get_interpolated_shapes(
+        interpolated_shapes = TrackManager.get_interpolated_track(
             track, 0, task_size, self._annotation_irs[task_id].dimension
         )
+        tracked_shapes = [interpolated_shapes[i]
+            for i, frame in enumerate(interpolated_shapes.frames.tolist())
+            if (task_id, frame) not in self._deleted_frames]
         for tracked_shape in tracked_shapes:
             tracked_shape["attributes"] += track["attributes"]
             tracked_shape["track_id"] = track["track_id"] if self._use_server_track_ids else idx
@@ -1121,8 +1136,7 @@ class ProjectData(InstanceLabelData):
             label=self._get_label_name(track["label_id"]),
             group=track["group"],
             source=track["source"],
-            shapes=[self._export_tracked_shape(shape, task_id) for shape in tracked_shapes
-                if (task_id, shape["frame"]) not in self._deleted_frames],
+            shapes=[self._export_tracked_shape(shape, task_id) for shape in tracked_shapes],
             task_id=task_id,
             elements=[self._export_track(element, task_id, task_size, i)
                 for i, element in enumerate(track.get("elements", []))]
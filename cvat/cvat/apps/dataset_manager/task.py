@@ -4,13 +4,14 @@
 # SPDX-License-Identifier: MIT
 
 import os
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict, deque
 from copy import deepcopy
 from enum import Enum
 from tempfile import TemporaryDirectory
 from datumaro.components.errors import DatasetError, DatasetImportError, DatasetNotFoundError
 
 from django.db import transaction
+from django.db.models import Q
 from django.db.models.query import Prefetch
 from rest_framework.exceptions import ValidationError
 
@@ -19,7 +20,7 @@ from cvat.apps.engine.plugins import plugin_decorator
 from cvat.apps.events.handlers import handle_annotations_change
 from cvat.apps.profiler import silk_profile
 
-from cvat.apps.dataset_manager.annotation import AnnotationIR, AnnotationManager
+from cvat.apps.dataset_manager.annotation import AnnotationIR, AnnotationManager, TrackManager
 from cvat.apps.dataset_manager.bindings import TaskData, JobData, CvatImportError
 from cvat.apps.dataset_manager.formats.registry import make_exporter, make_importer
 from cvat.apps.dataset_manager.util import add_prefetch_fields, bulk_create, get_cached
@@ -72,6 +73,147 @@ def _merge_table_rows(rows, keys_for_merge, field_id):
 
     return list(merged_rows.values())
 
+class _AnnotationUpdater:
+    """
+    Saves the annotations over the existing rows instead of recreating them.
+    A saved object takes the existing row with the same id or, if it has no id,
+    with the same natural key (e.g. the frame of a tracked shape). Only the changed
+    columns of the existing rows are updated, the objects without a row are created
+    and the existing rows which were not taken are deleted by delete_unused().
+
+    With replace=True, the data replaces all the job annotations, otherwise only
+    the objects with ids from the data are updated.
+    """
+
+    BULK_UPDATE_BATCH_SIZE = 1000
+
+    # the fields identifying the rows of the objects without id
+    _NATURAL_KEYS = {
+        models.LabeledImageAttributeVal: ('image_id', 'spec_id'),
+        models.LabeledShape: ('parent_id', 'label_id'),
+        models.LabeledShapeAttributeVal: ('shape_id', 'spec_id'),
+        models.LabeledTrack: ('parent_id', 'label_id'),
+        models.LabeledTrackAttributeVal: ('track_id', 'spec_id'),
+        models.TrackedShape: ('track_id', 'frame'),
+        models.TrackedShapeAttributeVal: ('shape_id', 'spec_id'),
+    }
+
+    def __init__(self, db_job, data, *, replace=False):
+        db_tags = models.LabeledImage.objects.filter(job=db_job)
+        db_shapes = models.LabeledShape.objects.filter(job=db_job)
+        db_tracks = models.LabeledTrack.objects.filter(job=db_job)
+        if not replace:
+            tag_ids = [tag["id"] for tag in data["tags"] if tag.get("id") is not None]
+            shape_ids = [shape["id"] for shape in data["shapes"] if shape.get("id") is not None]
+            track_ids = [track["id"] for track in data["tracks"] if track.get("id") is not None]
+
+            db_tags = db_tags.filter(id__in=tag_ids)
+            db_shapes = db_shapes.filter(Q(id__in=shape_ids) | Q(parent_id__in=shape_ids))
+            db_tracks = db_tracks.filter(Q(id__in=track_ids) | Q(parent_id__in=track_ids))
+
+        db_tags = list(db_tags)
+        db_shapes = list(db_shapes)
+        db_tracks = list(db_tracks)
+        db_tracked_shapes = list(models.TrackedShape.objects.filter(
+            track_id__in=[db_track.id for db_track in db_tracks]))
+
+        db_rows = {
+            models.LabeledImage: db_tags,
+            models.LabeledImageAttributeVal: models.LabeledImageAttributeVal.objects.filter(
+                image_id__in=[db_tag.id for db_tag in db_tags]),
+            models.LabeledShape: db_shapes,
+            models.LabeledShapeAttributeVal: models.LabeledShapeAttributeVal.objects.filter(
+                shape_id__in=[db_shape.id for db_shape in db_shapes]),
+            models.LabeledTrack: db_tracks,
+            models.LabeledTrackAttributeVal: models.LabeledTrackAttributeVal.objects.filter(
+                track_id__in=[db_track.id for db_track in db_tracks]),
+            models.TrackedShape: db_tracked_shapes,
+            models.TrackedShapeAttributeVal: models.TrackedShapeAttributeVal.objects.filter(
+                shape_id__in=[db_shape.id for db_shape in db_tracked_shapes]),
+        }
+        # rows which are not taken by the saved objects yet
+        self._rows = {
+            db_model: {db_row.id: db_row for db_row in rows}
+            for db_model, rows in db_rows.items()
+        }
+
+        self._rows_by_key = {}
+        for db_model, key_fields in self._NATURAL_KEYS.items():
+            rows_by_key = self._rows_by_key[db_model] = defaultdict(deque)
+            for db_row in self._rows[db_model].values():
+                rows_by_key[self._get_natural_key(db_row, key_fields)].append(db_row)
+
+        self.is_changed = False
+
+    @staticmethod
+    def _get_natural_key(obj, key_fields):
+        return tuple(getattr(obj, field) for field in key_fields)
+
+    def _take_row_by_id(self, db_model, obj):
+        return self._rows[db_model].pop(obj.id, None)
+
+    def _take_row_by_natural_key(self, db_model, obj):
+        key_fields = self._NATURAL_KEYS.get(db_model)
+        # the top-level objects without id are always new
+        if not key_fields or getattr(obj, 'parent_id', 0) is None:
+            return None
+
+        rows = self._rows[db_model]
+        rows_with_key = self._rows_by_key[db_model].get(self._get_natural_key(obj, key_fields))
+        # skip the rows taken by id
+        while rows_with_key and rows_with_key[0].id not in rows:
+            rows_with_key.popleft()
+        return rows.pop(rows_with_key.popleft().id) if rows_with_key else None
+
+    def save(self, db_model, objects, flt_param):
+        """ The same as bulk_create(), but updates the existing rows """
+        fields = [
+            field.attname for field in db_model._meta.concrete_fields if not field.primary_key
+        ]
+
+        db_rows = [
+            self._take_row_by_id(db_model, obj) if obj.id is not None else None
+            for obj in objects
+        ]
+        db_rows = [
+            db_row or (self._take_row_by_natural_key(db_model, obj) if obj.id is None else None)
+            for obj, db_row in zip(objects, db_rows)
+        ]
+
+        new_objects = []
+        changed_objects = defaultdict(list)
+        for obj, db_row in zip(objects, db_rows):
+            if db_row is None:
+                new_objects.append(obj)
+                continue
+
+            obj.id = db_row.id
+            changed_fields = tuple(
+                field for field in fields if getattr(obj, field) != getattr(db_row, field)
+            )
+            if changed_fields:
+                changed_objects[changed_fields].append(obj)
+
+        for changed_fields, objs in changed_objects.items():
+            db_model.objects.bulk_update(objs, changed_fields,
+                batch_size=self.BULK_UPDATE_BATCH_SIZE)
+
+        for obj, db_obj in zip(new_objects, bulk_create(
+            db_model=db_model, objects=new_objects, flt_param=flt_param
+        )):
+            obj.id = db_obj.id
+
+        self.is_changed |= bool(new_objects or changed_objects)
+        return objects
+
+    def delete_unused(self):
+        for db_model, rows in self._rows.items():
+            if rows:
+                # the dependent rows can be deleted already by cascade
+                db_model.objects.filter(id__in=list(rows)).delete()
+                self.is_changed = True
+            rows.clear()
+
 class JobAnnotation:
     @classmethod
     def add_prefetch_info(cls, queryset):
@@ -122,9 +264,13 @@ class JobAnnotation:
             for db_label in (db_segment.task.project.label_set.all()
             if db_segment.task.project_id else db_segment.task.label_set.all())}
 
-        self.db_attributes = {}
-        for db_label in self.db_labels.values():
-            self.db_attributes[db_label.id] = {
+        self.db_attributes = self._get_db_attributes(self.db_labels.values())
+
+    @staticmethod
+    def _get_db_attributes(db_labels):
+        db_attributes = {}
+        for db_label in db_labels:
+            db_attributes[db_label.id] = {
                 "mutable": OrderedDict(),
                 "immutable": OrderedDict(),
                 "all": OrderedDict(),
@@ -135,11 +281,13 @@ class JobAnnotation:
                     ('value', db_attr.default_value),
                 ])
                 if db_attr.mutable:
-                    self.db_attributes[db_label.id]["mutable"][db_attr.id] = default_value
+                    db_attributes[db_label.id]["mutable"][db_attr.id] = default_value
                 else:
-                    self.db_attributes[db_label.id]["immutable"][db_attr.id] = default_value
+                    db_attributes[db_label.id]["immutable"][db_attr.id] = default_value
 
-                self.db_attributes[db_label.id]["all"][db_attr.id] = default_value
+                db_attributes[db_label.id]["all"][db_attr.id] = default_value
+
+        return db_attributes
 
     def reset(self):
         self.ir_data.reset()
@@ -206,7 +354,7 @@ class JobAnnotation:
 
                     self._correct_frame_of_tracked_shapes(track)
 
-    def _save_tracks_to_db(self, tracks):
+    def _save_tracks_to_db(self, tracks, *, save=bulk_create):
 
         def create_tracks(tracks, parent_track=None):
             db_tracks = []
@@ -252,7 +400,7 @@ class JobAnnotation:
                 if elements or parent_track is None:
                     track["elements"] = elements
 
-            db_tracks = bulk_create(
+            db_tracks = save(
                 db_model=models.LabeledTrack,
                 objects=db_tracks,
                 flt_param={"job_id": self.db_job.id}
@@ -261,7 +409,7 @@ class JobAnnotation:
             for db_attr_val in db_track_attr_vals:
                 db_attr_val.track_id = db_tracks[db_attr_val.track_id].id
 
-            bulk_create(
+            save(
                 db_model=models.LabeledTrackAttributeVal,
                 objects=db_track_attr_vals,
                 flt_param={}
@@ -270,7 +418,7 @@ class JobAnnotation:
             for db_shape in db_shapes:
                 db_shape.track_id = db_tracks[db_shape.track_id].id
 
-            db_shapes = bulk_create(
+            db_shapes = save(
                 db_model=models.TrackedShape,
                 objects=db_shapes,
                 flt_param={"track__job_id": self.db_job.id}
@@ -279,7 +427,7 @@ class JobAnnotation:
             for db_attr_val in db_shape_attr_vals:
                 db_attr_val.shape_id = db_shapes[db_attr_val.shape_id].id
 
-            bulk_create(
+            save(
                 db_model=models.TrackedShapeAttributeVal,
                 objects=db_shape_attr_vals,
                 flt_param={}
@@ -297,7 +445,7 @@ class JobAnnotation:
 
         self.ir_data.tracks = tracks
 
-    def _save_shapes_to_db(self, shapes):
+    def _save_shapes_to_db(self, shapes, *, save=bulk_create):
         def create_shapes(shapes, parent_shape=None):
             db_shapes = []
             db_attr_vals = []
@@ -323,7 +471,7 @@ class JobAnnotation:
                 if shape_elements or parent_shape is None:
                     shape["elements"] = shape_elements
 
-            db_shapes = bulk_create(
+            db_shapes = save(
                 db_model=models.LabeledShape,
                 objects=db_shapes,
                 flt_param={"job_id": self.db_job.id}
@@ -332,7 +480,7 @@ class JobAnnotation:
             for db_attr_val in db_attr_vals:
                 db_attr_val.shape_id = db_shapes[db_attr_val.shape_id].id
 
-            bulk_create(
+            save(
                 db_model=models.LabeledShapeAttributeVal,
                 objects=db_attr_vals,
                 flt_param={}
@@ -346,7 +494,7 @@ class JobAnnotation:
 
         self.ir_data.shapes = shapes
 
-    def _save_tags_to_db(self, tags):
+    def _save_tags_to_db(self, tags, *, save=bulk_create):
         db_tags = []
         db_attr_vals = []
 
@@ -367,7 +515,7 @@ class JobAnnotation:
             db_tags.append(db_tag)
             tag["attributes"] = attributes
 
-        db_tags = bulk_create(
+        db_tags = save(
             db_model=models.LabeledImage,
             objects=db_tags,
             flt_param={"job_id": self.db_job.id}
@@ -376,7 +524,7 @@ class JobAnnotation:
         for db_attr_val in db_attr_vals:
             db_attr_val.image_id = db_tags[db_attr_val.tag_id].id
 
-        bulk_create(
+        save(
             db_model=models.LabeledImageAttributeVal,
             objects=db_attr_vals,
             flt_param={}
@@ -391,11 +539,11 @@ class JobAnnotation:
         self.db_job.segment.task.touch()
         self.db_job.touch()
 
-    def _save_to_db(self, data):
+    def _save_to_db(self, data, *, save=bulk_create):
         self.reset()
-        self._save_tags_to_db(data["tags"])
-        self._save_shapes_to_db(data["shapes"])
-        self._save_tracks_to_db(data["tracks"])
+        self._save_tags_to_db(data["tags"], save=save)
+        self._save_shapes_to_db(data["shapes"], save=save)
+        self._save_tracks_to_db(data["tracks"], save=save)
 
         return self.ir_data.tags or self.ir_data.shapes or self.ir_data.tracks
 
@@ -407,16 +555,38 @@ class JobAnnotation:
         self._create(data)
         handle_annotations_change(self.db_job, self.data, "create")
 
+    def _put(self, data):
+        self.init_from_db()
+        deleted_data = self.data
+
+        # the objects with ids keep their rows, the other rows are replaced
+        updater = _AnnotationUpdater(self.db_job, data, replace=True)
+        self._save_to_db(data, save=updater.save)
+        updater.delete_unused()
+
+        if updater.is_changed:
+            self._set_updated_date()
+
+        return deleted_data
+
     def put(self, data):
-        deleted_data = self._delete()
+        deleted_data = self._put(data)
         handle_annotations_change(self.db_job, deleted_data, "delete")
-        self._create(data)
         handle_annotations_change(self.db_job, self.data, "create")
 
 
+    def _update(self, data):
+        # the existing rows are updated in place, so their ids are kept
+        # and only the changed rows are written
+        updater = _AnnotationUpdater(self.db_job, data)
+        self._save_to_db(data, save=updater.save)
+        updater.delete_unused()
+
+        if updater.is_changed:
+            self._set_updated_date()
+
     def update(self, data):
-        self._delete(data)
-        self._create(data)
+        self._update(data)
         handle_annotations_change(self.db_job, self.data, "update")
 
     def _delete(self, data=None):
@@ -475,12 +645,15 @@ class JobAnnotation:
                     ('value', db_attr.value),
                 ]))
 
-    def _init_tags_from_db(self):
-        db_tags = self.db_job.labeledimage_set.prefetch_related(
+    @classmethod
+    def _get_tags_from_db(cls, db_tags, db_attributes):
+        """ Returns the tags of the queryset by job id """
+        db_tags = db_tags.prefetch_related(
             "label",
             "labeledimageattributeval_set"
         ).values(
             'id',
+            'job_id',
             'frame',
             'label_id',
             'group',
@@ -502,19 +675,31 @@ class JobAnnotation:
             field_id='id',
         )
 
+        tags = {}
         for db_tag in db_tags:
-            self._extend_attributes(db_tag.labeledimageattributeval_set,
-                self.db_attributes[db_tag.label_id]["all"].values())
+            cls._extend_attributes(db_tag.labeledimageattributeval_set,
+                db_attributes[db_tag.label_id]["all"].values())
+            tags.setdefault(db_tag.job_id, []).append(db_tag)
 
-        serializer = serializers.LabeledImageSerializerFromDB(db_tags, many=True)
-        self.ir_data.tags = serializer.data
+        return {
+            job_id: serializers.LabeledImageSerializerFromDB(job_tags, many=True).data
+            for job_id, job_tags in tags.items()
+        }
 
-    def _init_shapes_from_db(self):
-        db_shapes = self.db_job.labeledshape_set.prefetch_related(
+    def _init_tags_from_db(self):
+        self.ir_data.tags = self._get_tags_from_db(
+            self.db_job.labeledimage_set, self.db_attributes
+        ).get(self.db_job.id, [])
+
+    @classmethod
+    def _get_shapes_from_db(cls, db_shapes, db_attributes):
+        """ Returns the shapes of the queryset by job id """
+        db_shapes = db_shapes.prefetch_related(
             "label",
             "labeledshapeattributeval_set"
         ).values(
             'id',
+            'job_id',
             'label_id',
             'type',
             'frame',
@@ -546,8 +731,8 @@ class JobAnnotation:
         shapes = {}
         elements = {}
         for db_shape in db_shapes:
-            self._extend_attributes(db_shape.labeledshapeattributeval_set,
-                self.db_attributes[db_shape.label_id]["all"].values())
+            cls._extend_attributes(db_shape.labeledshapeattributeval_set,
+                db_attributes[db_shape.label_id]["all"].values())
 
             if db_shape.parent is None:
                 db_shape.elements = []
@@ -560,16 +745,30 @@ class JobAnnotation:
         for shape_id, shape_elements in elements.items():
             shapes[shape_id].elements = shape_elements
 
-        serializer = serializers.LabeledShapeSerializerFromDB(list(shapes.values()), many=True)
-        self.ir_data.shapes = serializer.data
+        job_shapes = {}
+        for db_shape in shapes.values():
+            job_shapes.setdefault(db_shape.job_id, []).append(db_shape)
 
-    def _init_tracks_from_db(self):
-        db_tracks = self.db_job.labeledtrack_set.prefetch_related(
+        return {
+            job_id: serializers.LabeledShapeSerializerFromDB(db_job_shapes, many=True).data
+            for job_id, db_job_shapes in job_shapes.items()
+        }
+
+    def _init_shapes_from_db(self):
+        self.ir_data.shapes = self._get_shapes_from_db(
+            self.db_job.labeledshape_set, self.db_attributes
+        ).get(self.db_job.id, [])
+
+    @classmethod
+    def _get_tracks_from_db(cls, db_tracks, db_attributes):
+        """ Returns the tracks of the queryset by job id """
+        db_tracks = db_tracks.prefetch_related(
             "label",
             "labeledtrackattributeval_set",
             "trackedshape_set__trackedshapeattributeval_set"
         ).values(
             "id",
+            "job_id",
             "frame",
             "label_id",
             "group",
@@ -630,17 +829,17 @@ class JobAnnotation:
             # A result table can consist many equal rows for track/shape attributes
             # We need filter unique attributes manually
             db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
-            self._extend_attributes(db_track.labeledtrackattributeval_set,
-                self.db_attributes[db_track.label_id]["immutable"].values())
+            cls._extend_attributes(db_track.labeledtrackattributeval_set,
+                db_attributes[db_track.label_id]["immutable"].values())
 
-            default_attribute_values = self.db_attributes[db_track.label_id]["mutable"].values()
+            default_attribute_values = db_attributes[db_track.label_id]["mutable"].values()
             for db_shape in db_track["trackedshape_set"]:
                 db_shape["trackedshapeattributeval_set"] = list(
                     set(db_shape["trackedshapeattributeval_set"])
                 )
                 # in case of trackedshapes need to interpolate attriute values and extend it
                 # by previous shape attribute values (not default values)
-                self._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
+                cls._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
                 default_attribute_values = db_shape["trackedshapeattributeval_set"]
 
             if db_track.parent is None:
@@ -654,12 +853,50 @@ class JobAnnotation:
         for track_id, track_elements in elements.items():
             tracks[track_id].elements = track_elements
 
-        serializer = serializers.LabeledTrackSerializerFromDB(list(tracks.values()), many=True)
-        self.ir_data.tracks = serializer.data
+        job_tracks = {}
+        for db_track in tracks.values():
+            job_tracks.setdefault(db_track.job_id, []).append(db_track)
+
+        return {
+            job_id: serializers.LabeledTrackSerializerFromDB(db_job_tracks, many=True).data
+            for job_id, db_job_tracks in job_tracks.items()
+        }
+
+    def _init_tracks_from_db(self):
+        self.ir_data.tracks = self._get_tracks_from_db(
+            self.db_job.labeledtrack_set, self.db_attributes
+        ).get(self.db_job.id, [])
 
     def _init_version_from_db(self):
         self.ir_data.version = 0 # FIXME: should be removed in the future
 
+    @classmethod
+    def get_many_from_db(cls, db_jobs, db_labels, dimension):
+        """
+        Reads the annotations of several jobs with the same labels at once
+        instead of making separate requests for each job. Returns them by job id.
+        """
+        db_attributes = cls._get_db_attributes(db_labels)
+
+        job_ids = [db_job.id for db_job in db_jobs]
+        tags = cls._get_tags_from_db(
+            models.LabeledImage.objects.filter(job_id__in=job_ids), db_attributes)
+        shapes = cls._get_shapes_from_db(
+            models.LabeledShape.objects.filter(job_id__in=job_ids), db_attributes)
+        tracks = cls._get_tracks_from_db(
+            models.LabeledTrack.objects.filter(job_id__in=job_ids), db_attributes)
+
+        jobs_data = {}
+        for job_id in job_ids:
+            job_data = AnnotationIR(dimension)
+            job_data.tags = tags.get(job_id, [])
+            job_data.shapes = shapes.get(job_id, [])
+            job_data.tracks = tracks.get(job_id, [])
+            job_data.version = 0 # FIXME: should be removed in the future
+            jobs_data[job_id] = job_data
+
+        return jobs_data
+
     def init_from_db(self):
         self._init_tags_from_db()
         self._init_shapes_from_db()
@@ -753,22 +990,44 @@ class TaskAnnotation:
             for db_job in self.db_jobs:
                 delete_job_data(db_job.id)
 
+    def _append_data(self, data, start_frame, prev_tracks):
+        # The segments don't overlap, so the objects are not merged, only the tracks
+        # of the previous segment are finished at the start of the next one
+        # like it is done in merge()
+        TrackManager(self.ir_data.tracks, self.db_task.dimension).finish_tracks(prev_tracks, start_frame)
+
+        self.ir_data.tags.extend(data.tags)
+        self.ir_data.shapes.extend(data.shapes)
+        self.ir_data.tracks.extend(data.tracks)
+
     def init_from_db(self):
         self.reset()
 
-        for db_job in self.db_jobs:
-            if db_job.type != models.JobType.ANNOTATION:
-                continue
-
-            annotation = JobAnnotation(db_job.id, is_prefetched=True)
-            annotation.init_from_db()
-            if annotation.ir_data.version > self.ir_data.version:
-                self.ir_data.version = annotation.ir_data.version
-            db_segment = db_job.segment
-            start_frame = db_segment.start_frame
-            overlap = self.db_task.overlap
-            dimension = self.db_task.dimension
-            self._merge_data(annotation.ir_data, start_frame, overlap, dimension)
+        db_jobs = [
+            db_job for db_job in self.db_jobs if db_job.type == models.JobType.ANNOTATION
+        ]
+        db_labels = (
+            self.db_task.project.label_set if self.db_task.project_id else self.db_task.label_set
+        ).prefetch_related('attributespec_set')
+        jobs_data = JobAnnotation.get_many_from_db(db_jobs, db_labels, self.db_task.dimension)
+
+        overlap = self.db_task.overlap
+        dimension = self.db_task.dimension
+        start_frames = [db_job.segment.start_frame for db_job in db_jobs]
+        # the segments are expected to follow each other, otherwise the general merge is used
+        can_append = not overlap and start_frames == sorted(start_frames)
+
+        prev_tracks = []
+        for db_job, start_frame in zip(db_jobs, start_frames):
+            job_data = jobs_data[db_job.id]
+            if job_data.version > self.ir_data.version:
+                self.ir_data.version = job_data.version
+
+            if can_append:
+                self._append_data(job_data, start_frame, prev_tracks)
+                prev_tracks = job_data.tracks
+            else:
+                self._merge_data(job_data, start_frame, overlap, dimension)
 
     def export(self, dst_file, exporter, host='', **options):
         task_data = TaskData(
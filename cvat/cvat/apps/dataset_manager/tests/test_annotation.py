@@ -2,7 +2,9 @@
 #
 # SPDX-License-Identifier: MIT
 
-from cvat.apps.dataset_manager.annotation import TrackManager
+from cvat.apps.dataset_manager.annotation import (
+    AnnotationIR, AnnotationManager, ShapeManager, TrackManager
+)
 
 from unittest import TestCase
 
@@ -324,3 +326,313 @@ class TrackManagerTest(TestCase):
 
         interpolated_shapes = TrackManager.get_interpolated_shapes(track, 0, 3, '2d')
         self.assertEqual(expected_shapes, interpolated_shapes)
+
+    def test_interpolated_track_arrays_match_shapes(self):
+        track = {
+            "frame": 0,
+            "label_id": 0,
+            "group": None,
+            "attributes": [],
+            "source": "manual",
+            "shapes": [
+                {
+                    "frame": 0,
+                    "points": [1.0, 2.0, 3.0, 4.0],
+                    "rotation": 0,
+                    "type": "rectangle",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": [{"spec_id": 1, "value": "a"}]
+                },
+                {
+                    "frame": 4,
+                    "attributes": [],
+                    "points": [5.0, 6.0, 7.0, 8.0],
+                    "rotation": 0,
+                    "type": "rectangle",
+                    "occluded": False,
+                    "outside": True
+                },
+            ]
+        }
+
+        interpolated = TrackManager.get_interpolated_track(track, 0, 6, '2d',
+            included_frames={0, 1, 3, 4, 5})
+        shapes = list(interpolated)
+
+        self.assertEqual([0, 1, 3, 4], interpolated.frames.tolist())
+        self.assertEqual([s["frame"] for s in shapes], interpolated.frames.tolist())
+        self.assertEqual([s["outside"] for s in shapes], interpolated.outside.tolist())
+        self.assertEqual([s["keyframe"] for s in shapes], interpolated.keyframe.tolist())
+        self.assertEqual([2.0, 3.0, 4.0, 5.0], shapes[1]["points"])
+        self.assertEqual([{"spec_id": 1, "value": "a"}], shapes[3]["attributes"])
+
+    @staticmethod
+    def _make_track(shape_type, keyframes, elements=()):
+        return {
+            "frame": keyframes[0][0],
+            "label_id": 0,
+            "group": None,
+            "attributes": [],
+            "source": "manual",
+            "shapes": [
+                {
+                    "frame": frame,
+                    "points": points,
+                    "rotation": rotation,
+                    "type": shape_type,
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": [],
+                }
+                for frame, points, rotation in keyframes
+            ],
+            "elements": list(elements),
+        }
+
+    @staticmethod
+    def _get_geometry(shapes):
+        return [
+            (shape["frame"], shape["keyframe"], shape["points"], shape["rotation"])
+            for shape in shapes
+        ]
+
+    def test_simple_interpolation(self):
+        cuboid_points0 = list(range(16))
+        cuboid_points1 = [v + 4.0 for v in range(16)]
+
+        for shape_type, keyframes, expected in [
+            (
+                "ellipse",
+                [(0, [0.0, 0.0, 4.0, 4.0], 0), (4, [4.0, 8.0, 8.0, 12.0], 40)],
+                [
+                    (0, True, [0.0, 0.0, 4.0, 4.0], 0),
+                    (1, False, [1.0, 2.0, 5.0, 6.0], 10.0),
+                    (2, False, [2.0, 4.0, 6.0, 8.0], 20.0),
+                    (3, False, [3.0, 6.0, 7.0, 10.0], 30.0),
+                    (4, True, [4.0, 8.0, 8.0, 12.0], 40),
+                    (5, False, [4.0, 8.0, 8.0, 12.0], 40),
+                ],
+            ),
+            (
+                "cuboid",
+                [(0, cuboid_points0, 0), (4, cuboid_points1, 0)],
+                [
+                    (0, True, cuboid_points0, 0),
+                    (1, False, [v + 1.0 for v in range(16)], 0.0),
+                    (2, False, [v + 2.0 for v in range(16)], 0.0),
+                    (3, False, [v + 3.0 for v in range(16)], 0.0),
+                    (4, True, cuboid_points1, 0),
+                    (5, False, cuboid_points1, 0),
+                ],
+            ),
+            (
+                # the rotation goes by the shorter arc through 0
+                "rectangle",
+                [(0, [0.0, 0.0, 4.0, 4.0], 350), (4, [0.0, 0.0, 4.0, 4.0], 30)],
+                [
+                    (0, True, [0.0, 0.0, 4.0, 4.0], 350),
+                    (1, False, [0.0, 0.0, 4.0, 4.0], 0.0),
+                    (2, False, [0.0, 0.0, 4.0, 4.0], 10.0),
+                    (3, False, [0.0, 0.0, 4.0, 4.0], 20.0),
+                    (4, True, [0.0, 0.0, 4.0, 4.0], 30),
+                    (5, False, [0.0, 0.0, 4.0, 4.0], 30),
+                ],
+            ),
+            (
+                # a single point is interpolated
+                "points",
+                [(0, [0.0, 0.0], 0), (4, [4.0, 8.0], 0)],
+                [
+                    (0, True, [0.0, 0.0], 0),
+                    (1, False, [1.0, 2.0], 0.0),
+                    (2, False, [2.0, 4.0], 0.0),
+                    (3, False, [3.0, 6.0], 0.0),
+                    (4, True, [4.0, 8.0], 0),
+                    (5, False, [4.0, 8.0], 0),
+                ],
+            ),
+            (
+                # several points are copied from the previous keyframe
+                "points",
+                [(0, [0.0, 0.0, 2.0, 2.0], 0), (2, [4.0, 8.0, 6.0, 10.0], 0)],
+                [
+                    (0, True, [0.0, 0.0, 2.0, 2.0], 0),
+                    (1, False, [0.0, 0.0, 2.0, 2.0], 0),
+                    (2, True, [4.0, 8.0, 6.0, 10.0], 0),
+                    (3, False, [4.0, 8.0, 6.0, 10.0], 0),
+                    (4, False, [4.0, 8.0, 6.0, 10.0], 0),
+                    (5, False, [4.0, 8.0, 6.0, 10.0], 0),
+                ],
+            ),
+        ]:
+            with self.subTest(shape_type=shape_type, keyframes=keyframes):
+                track = self._make_track(shape_type, keyframes)
+
+                shapes = TrackManager.get_interpolated_shapes(track, 0, 6, '2d')
+
+                self.assertEqual(expected, self._get_geometry(shapes))
+                self.assertTrue(all(s["type"] == shape_type for s in shapes))
+
+    def test_skeleton_elements_interpolation(self):
+        track = self._make_track("skeleton", [(0, [], 0), (4, [], 0)], elements=[
+            self._make_track("points", [(0, [0.0, 0.0], 0), (4, [4.0, 8.0], 0)]),
+            self._make_track("points", [(0, [1.0, 1.0], 0), (2, [3.0, 5.0], 0)]),
+        ])
+
+        shapes = TrackManager([track], '2d').to_shapes(6, included_frames=set(range(6)))
+
+        self.assertEqual(list(range(6)), [s["frame"] for s in shapes])
+        self.assertEqual([[]] * 6, [s["points"] for s in shapes])
+        self.assertEqual(
+            [
+                (0, True, [0.0, 0.0], 0),
+                (1, False, [1.0, 2.0], 0.0),
+                (2, False, [2.0, 4.0], 0.0),
+                (3, False, [3.0, 6.0], 0.0),
+                (4, True, [4.0, 8.0], 0),
+                (5, False, [4.0, 8.0], 0),
+            ],
+            self._get_geometry(s["elements"][0] for s in shapes)
+        )
+        self.assertEqual(
+            [
+                (0, True, [1.0, 1.0], 0),
+                (1, False, [2.0, 3.0], 0.0),
+                (2, True, [3.0, 5.0], 0),
+                (3, False, [3.0, 5.0], 0),
+                (4, False, [3.0, 5.0], 0),
+                (5, False, [3.0, 5.0], 0),
+            ],
+            self._get_geometry(s["elements"][1] for s in shapes)
+        )
+        self.assertTrue(all(
+            [e["track_id"] for e in s["elements"]] == [0, 1] for s in shapes
+        ))
+
+    def test_finish_tracks(self):
+        def make_track(keyframes, elements=()):
+            return {
+                "frame": keyframes[0][0],
+                "label_id": 0,
+                "group": None,
+                "attributes": [],
+                "source": "manual",
+                "shapes": [
+                    {
+                        "frame": frame,
+                        "points": [1.0, 2.0, 3.0, 4.0],
+                        "rotation": 0,
+                        "type": "rectangle",
+                        "occluded": False,
+                        "outside": outside,
+                        "attributes": [],
+                    }
+                    for frame, outside in keyframes
+                ],
+                "elements": list(elements),
+            }
+
+        tracks = [
+            make_track([(0, False), (2, False)], elements=[make_track([(0, False)])]),
+            make_track([(1, False), (3, True)]),
+        ]
+        TrackManager(tracks, '2d').finish_tracks(tracks, 5)
+
+        self.assertEqual([(0, False), (2, False), (5, True)],
+            [(shape["frame"], shape["outside"]) for shape in tracks[0]["shapes"]])
+        self.assertEqual([(0, False), (5, True)],
+            [(shape["frame"], shape["outside"]) for shape in tracks[0]["elements"][0]["shapes"]])
+        self.assertEqual([(1, False), (3, True)],
+            [(shape["frame"], shape["outside"]) for shape in tracks[1]["shapes"]])
+
+
+class ShapeManagerTest(TestCase):
+    def _make_shape(self, frame, label_id, shape_type, points):
+        return {
+            "frame": frame,
+            "label_id": label_id,
+            "type": shape_type,
+            "points": points,
+            "occluded": False,
+            "outside": False,
+            "attributes": []
+        }
+
+    def test_merge_matches_overlapping_shapes_of_same_label(self):
+        old_shapes = [
+            self._make_shape(5, 0, "rectangle", [0.0, 0.0, 10.0, 10.0]),
+            self._make_shape(5, 1, "rectangle", [20.0, 20.0, 30.0, 30.0]),
+            self._make_shape(5, 0, "polygon", [0.0, 0.0, 10.0, 0.0, 10.0, 10.0]),
+        ]
+        new_shapes = [
+            # the same box, but with another label
+            self._make_shape(5, 0, "rectangle", [20.0, 20.0, 30.0, 30.0]),
+            self._make_shape(5, 0, "rectangle", [1.0, 1.0, 10.0, 10.0]),
+            self._make_shape(5, 0, "polygon", [0.0, 0.0, 10.0, 0.0, 10.0, 9.0]),
+            self._make_shape(5, 0, "polygon", [50.0, 50.0, 60.0, 50.0, 60.0, 60.0]),
+        ]
+
+        manager = ShapeManager(list(old_shapes))
+        manager.merge(new_shapes, 5, 2, '2d')
+
+        self.assertEqual(old_shapes + [new_shapes[0], new_shapes[3]], manager.objects)
+
+    def test_similarity_matrix_matches_pairwise_similarity(self):
+        shapes = [
+            self._make_shape(0, 0, "rectangle", [0.0, 0.0, 10.0, 10.0]),
+            self._make_shape(0, 0, "rectangle", [15.0, 5.0, 5.0, 15.0]),
+            self._make_shape(0, 0, "rectangle", [0.0, 0.0, 0.0, 10.0]),
+            self._make_shape(0, 0, "polygon", [0.0, 0.0, 10.0, 0.0, 10.0, 10.0, 0.0, 10.0]),
+            self._make_shape(0, 0, "polygon", [0.0, 0.0, 10.0, 10.0, 10.0, 0.0, 0.0, 10.0]),
+            self._make_shape(0, 0, "polygon", [5.0, 5.0, 12.0, 5.0, 12.0, 12.0]),
+            self._make_shape(0, 1, "polygon", [5.0, 5.0, 12.0, 5.0, 12.0, 12.0]),
+            self._make_shape(0, 0, "points", [5.0, 5.0]),
+        ]
+
+        similarity = ShapeManager([])._calc_similarity_matrix(shapes, shapes, 0, 1, '2d')
+
+        for i, shape0 in enumerate(shapes):
+            for j, shape1 in enumerate(shapes):
+                self.assertAlmostEqual(similarity[i][j],
+                    ShapeManager._calc_objects_similarity(shape0, shape1, 0, 1, '2d'))
+
+
+class AnnotationManagerTest(TestCase):
+    def test_iter_shapes_by_frame_matches_to_shapes(self):
+        def make_shape(frame, shape_id, z_order, outside=False):
+            return {
+                "id": shape_id,
+                "frame": frame,
+                "points": [1.0, 2.0, 3.0, 4.0],
+                "rotation": 0,
+                "type": "rectangle",
+                "occluded": False,
+                "outside": outside,
+                "z_order": z_order,
+                "attributes": []
+            }
+
+        data = AnnotationIR('2d')
+        data.shapes = [make_shape(3, 1, 0), make_shape(0, 2, 1), make_shape(3, 3, 0)]
+        data.tracks = [
+            {
+                "id": track_id,
+                "frame": start,
+                "label_id": 0,
+                "group": None,
+                "source": "manual",
+                "attributes": [],
+                "shapes": [make_shape(start, None, 0), make_shape(start + 2, None, 0, outside=True)],
+                "elements": [],
+            }
+            for track_id, start in [(1, 2), (2, 0), (3, 1)]
+        ]
+
+        manager = AnnotationManager(data)
+        shapes = manager.to_shapes(5, '2d', included_frames={0, 1, 2, 3})
+        shapes_by_frame = list(manager.iter_shapes_by_frame(5, '2d', included_frames={0, 1, 2, 3}))
+
+        self.assertEqual([0, 1, 2, 3], [frame for frame, _ in shapes_by_frame])
+        for frame, frame_shapes in shapes_by_frame:
+            self.assertEqual([s for s in shapes if s["frame"] == frame], frame_shapes)
@@ -23,9 +23,10 @@ from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
 import cvat.apps.dataset_manager as dm
+from cvat.apps.dataset_manager.annotation import AnnotationIR, AnnotationManager
 from cvat.apps.dataset_manager.bindings import CvatTaskOrJobDataExtractor, TaskData
-from cvat.apps.dataset_manager.task import TaskAnnotation
-from cvat.apps.engine.models import Task
+from cvat.apps.dataset_manager.task import JobAnnotation, TaskAnnotation
+from cvat.apps.engine.models import Job, JobType, LabeledShape, Task, TrackedShape
 from cvat.apps.engine.tests.utils import get_paginated_collection
 
 projects_path = osp.join(osp.dirname(__file__), 'assets', 'projects.json')
@@ -1412,3 +1413,289 @@ class ProjectDumpUpload(_DbTestBase):
                                 f.write(content.getvalue())
                         self.assertEqual(response.status_code, edata['code'])
                         self.assertEqual(osp.exists(file_zip_name), edata['file_exists'])
+
+class AnnotationUpdateTest(_DbTestBase):
+    def _get_job_annotations(self, job_id):
+        response = self._get_request("/api/jobs/%s/annotations" % job_id, self.admin)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def _put_job_annotations(self, job_id, data):
+        response = self._put_api_v2_job_id_annotations(job_id, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return self._get_job_annotations(job_id)
+
+    def _patch_job_annotations(self, job_id, data, action):
+        with ForceLogin(self.admin, self.client):
+            response = self.client.patch("/api/jobs/%s/annotations?action=%s" % (job_id, action),
+                data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return self._get_job_annotations(job_id)
+
+    @staticmethod
+    def _get_ids(data):
+        ids = []
+        def collect_ids(obj):
+            if isinstance(obj, dict):
+                if obj.get("id") is not None:
+                    ids.append(obj["id"])
+                for value in obj.values():
+                    collect_ids(value)
+            elif isinstance(obj, list):
+                for value in obj:
+                    collect_ids(value)
+
+        collect_ids([data["tags"], data["shapes"], data["tracks"]])
+        return sorted(ids)
+
+    @classmethod
+    def _strip_ids(cls, obj):
+        if isinstance(obj, dict):
+            return {k: cls._strip_ids(v) for k, v in obj.items() if k not in ["id", "version"]}
+        elif isinstance(obj, list):
+            return [cls._strip_ids(v) for v in obj]
+        return obj
+
+    @classmethod
+    def _normalize(cls, obj):
+        # the ids and the order of the recreated objects differ
+        if isinstance(obj, dict):
+            return {k: cls._normalize(v) for k, v in obj.items() if k not in ["id", "version"]}
+        elif isinstance(obj, list) and all(isinstance(v, dict) for v in obj):
+            return sorted((cls._normalize(v) for v in obj),
+                key=lambda v: json.dumps(v, sort_keys=True))
+        return obj
+
+    def _create_main_task(self):
+        task = self._create_task(tasks["main"], self._generate_task_images(3))
+        job_id = self._get_jobs(task["id"])[0]["id"]
+
+        label = task["labels"][0]
+        spec_ids = {attr["name"]: attr["id"] for attr in label["attributes"]}
+        text_id = spec_ids["text_name"]
+        checkbox_id = spec_ids["check_name"]
+
+        def make_shape(frame, points, **kwargs):
+            return {
+                "type": "rectangle", "occluded": False, "z_order": 0,
+                "points": points, "frame": frame, **kwargs,
+            }
+
+        data = {
+            "version": 0,
+            "tags": [{
+                "frame": 0, "label_id": label["id"], "group": 0, "source": "manual",
+                "attributes": [{"spec_id": text_id, "value": "tag"}],
+            }],
+            "shapes": [make_shape(0, [1.0, 2.0, 10.0, 20.0],
+                label_id=label["id"], group=0, source="manual",
+                attributes=[{"spec_id": text_id, "value": "shape"}],
+            )],
+            "tracks": [{
+                "frame": 0, "label_id": label["id"], "group": 0, "source": "manual",
+                "attributes": [{"spec_id": text_id, "value": "track"}],
+                "shapes": [
+                    make_shape(frame, [frame + 1.0, 2.0, frame + 10.0, 20.0], outside=False,
+                        attributes=[{"spec_id": checkbox_id, "value": "false"}])
+                    for frame in [0, 2]
+                ],
+            }],
+        }
+
+        return job_id, data, spec_ids
+
+    @staticmethod
+    def _change_main_annotations(data, spec_ids):
+        def set_attribute(obj, spec_id, value):
+            for attr in obj["attributes"]:
+                if attr["spec_id"] == spec_id:
+                    attr["value"] = value
+
+        set_attribute(data["tags"][0], spec_ids["text_name"], "changed tag")
+
+        shape = data["shapes"][0]
+        shape["points"] = [5.0, 6.0, 15.0, 26.0]
+        shape["occluded"] = True
+        set_attribute(shape, spec_ids["text_name"], "changed shape")
+
+        track = data["tracks"][0]
+        set_attribute(track, spec_ids["text_name"], "changed track")
+        track["shapes"][-1]["points"] = [4.0, 5.0, 14.0, 25.0]
+        set_attribute(track["shapes"][-1], spec_ids["check_name"], "true")
+
+        return data
+
+    def test_api_v2_update_annotations_keeps_ids(self):
+        job_id, data, spec_ids = self._create_main_task()
+        initial = self._put_job_annotations(job_id, data)
+        initial_ids = self._get_ids(initial)
+        self.assertEqual(len(initial_ids), 5)
+
+        expected = self._change_main_annotations(copy.deepcopy(initial), spec_ids)
+        updated = self._patch_job_annotations(job_id, expected, "update")
+
+        self.assertEqual(self._get_ids(updated), initial_ids)
+        self.assertEqual(self._normalize(updated), self._normalize(expected))
+
+        expected["shapes"][0]["points"] = [7.0, 8.0, 17.0, 28.0]
+        expected["tracks"][0]["shapes"][0]["outside"] = True
+        replaced = self._put_job_annotations(job_id, expected)
+
+        self.assertEqual(self._get_ids(replaced), initial_ids)
+        self.assertEqual(self._normalize(replaced), self._normalize(expected))
+
+    def test_api_v2_update_annotations_deletes_removed_objects(self):
+        task = self._create_task(tasks["COCO Keypoints 1.0"], self._generate_task_images(3))
+        job_id = self._get_jobs(task["id"])[0]["id"]
+        label = task["labels"][0]
+
+        def make_skeleton(frame, **kwargs):
+            return {
+                "type": "skeleton", "occluded": False, "z_order": 0,
+                "points": [], "frame": frame, "attributes": [], **kwargs,
+            }
+
+        def make_point(frame, x, **kwargs):
+            return {
+                "type": "points", "occluded": False, "z_order": 0,
+                "points": [x, x + frame], "frame": frame, "attributes": [], **kwargs,
+            }
+
+        data = {
+            "version": 0,
+            "tags": [],
+            "shapes": [make_skeleton(0, label_id=label["id"], group=0, source="manual",
+                elements=[
+                    make_point(0, 10.0 * i, label_id=sublabel["id"], group=0, source="manual")
+                    for i, sublabel in enumerate(label["sublabels"])
+                ],
+            )],
+            "tracks": [{
+                "frame": 0, "label_id": label["id"], "group": 0, "source": "manual",
+                "attributes": [],
+                "shapes": [make_skeleton(frame, outside=False) for frame in [0, 1, 2]],
+                "elements": [{
+                    "frame": 0, "label_id": sublabel["id"], "group": 0, "source": "manual",
+                    "attributes": [],
+                    "shapes": [make_point(frame, 10.0 * i, outside=False) for frame in [0, 1, 2]],
+                } for i, sublabel in enumerate(label["sublabels"])],
+            }],
+        }
+        initial = self._put_job_annotations(job_id, data)
+
+        expected = copy.deepcopy(initial)
+        skeleton = expected["shapes"][0]
+        removed_element = skeleton["elements"].pop()
+        track = expected["tracks"][0]
+        removed_tracked_shapes = [track["shapes"].pop(1)]
+        for element in track["elements"]:
+            removed_tracked_shapes.append(element["shapes"].pop(1))
+
+        updated = self._patch_job_annotations(job_id, expected, "update")
+
+        self.assertEqual(self._normalize(updated), self._normalize(expected))
+        self.assertEqual(self._get_ids(updated), self._get_ids(expected))
+        self.assertEqual(LabeledShape.objects.filter(parent_id=skeleton["id"]).count(), 2)
+        self.assertFalse(LabeledShape.objects.filter(id=removed_element["id"]).exists())
+        self.assertFalse(TrackedShape.objects.filter(
+            id__in=[shape["id"] for shape in removed_tracked_shapes]).exists())
+
+    def test_api_v2_update_annotations_matches_recreation(self):
+        job_id, data, spec_ids = self._create_main_task()
+
+        # a new tracked shape, which is created
+        new_tracked_shape = copy.deepcopy(data["tracks"][0]["shapes"][0])
+        new_tracked_shape.update(frame=1, points=[3.0, 3.0, 13.0, 23.0])
+
+        def change(annotations):
+            annotations = self._change_main_annotations(annotations, spec_ids)
+            annotations["tracks"][0]["shapes"].insert(1, copy.deepcopy(new_tracked_shape))
+            return annotations
+
+        updated = self._patch_job_annotations(job_id,
+            change(self._put_job_annotations(job_id, data)), "update")
+
+        # the previous implementation of the update
+        changed = change(self._put_job_annotations(job_id, data))
+        self._patch_job_annotations(job_id, changed, "delete")
+        recreated = self._patch_job_annotations(job_id, self._strip_ids(changed), "create")
+
+        self.assertEqual(self._normalize(updated), self._normalize(recreated))
+
+class TaskAnnotationReadTest(_DbTestBase):
+    @staticmethod
+    def _make_annotations(label_id, frame_count):
+        def make_shape(frame, **kwargs):
+            return {
+                "type": "rectangle", "occluded": False, "z_order": 0,
+                "points": [frame, frame, frame + 10.0, frame + 20.0], "frame": frame,
+                "attributes": [], **kwargs,
+            }
+
+        def make_track(keyframes):
+            return {
+                "frame": keyframes[0][0], "label_id": label_id, "group": 0, "source": "manual",
+                "attributes": [],
+                "shapes": [make_shape(frame, outside=outside) for frame, outside in keyframes],
+            }
+
+        last_frame = frame_count - 1
+        return {
+            "version": 0,
+            "tags": [
+                {"frame": frame, "label_id": label_id, "group": 0, "source": "manual",
+                    "attributes": []}
+                for frame in [0, frame_count // 2, last_frame]
+            ],
+            "shapes": [
+                make_shape(frame, label_id=label_id, group=0, source="manual")
+                for frame in range(frame_count)
+            ],
+            "tracks": [
+                # tracks through all the segments, finished and not finished at the end
+                make_track([(0, False), (frame_count // 2, False), (last_frame, True)]),
+                make_track([(1, False), (last_frame - 1, False)]),
+                # tracks inside a segment and on the segment boundaries
+                make_track([(3, False), (6, True)]),
+                make_track([(4, False), (5, False), (8, True), (9, False)]),
+                make_track([(last_frame, False)]),
+            ],
+        }
+
+    def _get_task_annotations_by_job(self, task_id):
+        # the annotations as they were read before, job by job
+        db_task = Task.objects.get(pk=task_id)
+        ir_data = AnnotationIR(db_task.dimension)
+        annotation_manager = AnnotationManager(ir_data)
+        for db_job in Job.objects.select_related('segment').filter(
+            segment__task_id=task_id, type=JobType.ANNOTATION.value,
+        ).order_by('id'):
+            job_annotation = JobAnnotation(db_job.id)
+            job_annotation.init_from_db()
+            annotation_manager.merge(job_annotation.ir_data, db_job.segment.start_frame,
+                db_task.overlap, db_task.dimension)
+
+        return ir_data.data
+
+    def _test_task_annotations_match_job_annotations(self, task_name, frame_count, job_count):
+        task = self._create_task(tasks[task_name], self._generate_task_images(frame_count))
+        self.assertEqual(len(self._get_jobs(task["id"])), job_count)
+
+        data = self._make_annotations(task["labels"][0]["id"], frame_count)
+        response = self._put_api_v2_task_id_annotations(task["id"], data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        task_annotation = TaskAnnotation(task["id"])
+        task_annotation.init_from_db()
+
+        self.assertEqual(
+            json.loads(json.dumps(task_annotation.data, default=str)),
+            json.loads(json.dumps(self._get_task_annotations_by_job(task["id"]), default=str)),
+        )
+
+    def test_task_annotations_without_overlap_match_job_annotations(self):
+        self._test_task_annotations_match_job_annotations("many jobs", 12, 3)
+
+    def test_task_annotations_with_overlap_match_job_annotations(self):
+        self._test_task_annotations_match_job_annotations(
+            "change overlap and segment size", 12, 3)
@@ -10,15 +10,22 @@ from datetime import datetime, timezone
 from io import BytesIO
 import shutil
 import tempfile
+import threading
+import time
 import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
 
 import cv2
+import django_rq
 import PIL.Image
 import pickle # nosec
 from django.conf import settings
 from django.core.cache import caches
+from redis.exceptions import LockError, RedisError
 from rest_framework.exceptions import NotFound, ValidationError
 
 from cvat.apps.engine.cloud_provider import (Credentials,
@@ -30,24 +37,249 @@ from cvat.apps.engine.media_extractors import (ImageDatasetManifestReader,
                                                Mpeg4CompressedChunkWriter,
                                                VideoDatasetManifestReader,
                                                ZipChunkWriter,
-                                               ZipCompressedChunkWriter)
+                                               ZipCompressedChunkWriter,
+                                               ZipReader)
 from cvat.apps.engine.mime_types import mimetypes
-from cvat.apps.engine.models import (DataChoice, DimensionType, Job, Image,
-                                     StorageChoice, CloudStorage)
-from cvat.apps.engine.utils import md5_hash, preload_images
+from cvat.apps.engine.models import (Data, DataChoice, DimensionType, Job, Image,
+                                     StorageChoice, StorageMethodChoice, CloudStorage)
+from cvat.apps.engine.utils import get_cpu_number, md5_hash, preload_image, preload_images
 from utils.dataset_manifest import ImageManifestManager
 
 slogger = ServerLogManager(__name__)
 
+def _get_redis_client(cache, key: str, *, write: bool):
+    # The client is only available with the Redis backend
+    get_client = getattr(getattr(cache, '_cache', None), 'get_client', None)
+    if get_client is None:
+        return None
+
+    return get_client(key, write=write)
+
+class MediaCacheStats:
+    """
+    Counters of the media cache, used to tune the local cache size, the lock timeouts
+    and chunk prewarming. The counters of each process are added periodically
+    to the counters shared by all the server and worker processes in the media cache.
+    Without the Redis backend, only the counters of the current process are available.
+    """
+
+    FLUSH_INTERVAL = 10 # seconds
+    _KEY = 'media_cache_stats'
+
+    _lock = threading.Lock()
+    _counters: Dict[str, float] = {}
+    _last_flush = time.monotonic()
+
+    @classmethod
+    def increment(cls, name: str, value: float = 1):
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + value
+            flush = cls.FLUSH_INTERVAL <= time.monotonic() - cls._last_flush
+
+        if flush:
+            cls.flush()
+
+    @classmethod
+    def _get_client(cls, *, write: bool):
+        cache = caches['media']
+        key = cache.make_key(cls._KEY)
+        return _get_redis_client(cache, key, write=write), key
+
+    @classmethod
+    def flush(cls):
+        """
+        Adds the counters of this process to the shared counters.
+        Short-lived processes, like RQ work horses, must call it before exiting.
+        """
+        client, key = cls._get_client(write=True)
+        if client is None:
+            return
+
+        with cls._lock:
+            counters, cls._counters = cls._counters, {}
+            cls._last_flush = time.monotonic()
+
+        if not counters:
+            return
+
+        try:
+            with client.pipeline(transaction=False) as pipe:
+                for name, value in counters.items():
+                    if isinstance(value, int):
+                        pipe.hincrby(key, name, value)
+                    else:
+                        pipe.hincrbyfloat(key, name, value)
+                pipe.execute()
+        except RedisError:
+            slogger.glob.warning('Unable to save the media cache stats', exc_info=True)
+
+    @classmethod
+    def get(cls) -> Dict[str, float]:
+        """
+        Returns the shared counters and the hit rates derived from them
+        """
+        cls.flush()
+
+        client, key = cls._get_client(write=False)
+        if client is None:
+            with cls._lock:
+                stats = dict(cls._counters)
+        else:
+            stats = {
+                name.decode(): float(value)
+                for name, value in client.hgetall(key).items()
+            }
+
+        hits = stats.get('hits', 0) + stats.get('local_hits', 0)
+        if requests := hits + stats.get('misses', 0):
+            stats['hit_rate'] = hits / requests
+        if prewarm_builds := stats.get('prewarm_builds', 0):
+            stats['prewarm_hit_rate'] = stats.get('prewarm_hits', 0) / prewarm_builds
+
+        return stats
+
+    @classmethod
+    def reset(cls):
+        client, key = cls._get_client(write=True)
+        if client is not None:
+            client.delete(key)
+
+        with cls._lock:
+            cls._counters.clear()
+            cls._last_flush = time.monotonic()
+
+class _LocalCache:
+    """
+    A size-bounded in-process LRU cache of serialized cache items.
+    The stored data is immutable, each reader gets its own buffer.
+    Items expire after ttl seconds, so that they do not outlive the shared cache entries.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._size = 0
+        self._items: OrderedDict[str, Tuple[bytes, Any, bool, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, Any]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[3] <= time.monotonic():
+                del self._items[key]
+                self._size -= len(item[0])
+                return None
+            self._items.move_to_end(key)
+
+        data, mime_type, is_buffer, _ = item
+        return (io.BytesIO(data) if is_buffer else data), mime_type
+
+    def set(self, key: str, data, mime_type):
+        is_buffer = isinstance(data, io.BytesIO)
+        data = data.getvalue() if is_buffer else bytes(data)
+        if len(data) > self._max_size:
+            return
+
+        with self._lock:
+            old_item = self._items.pop(key, None)
+            if old_item is not None:
+                self._size -= len(old_item[0])
+
+            self._items[key] = (data, mime_type, is_buffer, time.monotonic() + self._ttl)
+            self._size += len(data)
+            while self._size > self._max_size:
+                _, (evicted_data, *_) = self._items.popitem(last=False)
+                self._size -= len(evicted_data)
+                MediaCacheStats.increment('local_evictions')
+
+_local_cache: Optional[_LocalCache] = None
+_local_cache_init_lock = threading.Lock()
+
+def _get_local_cache() -> Optional[_LocalCache]:
+    global _local_cache # pylint: disable=global-statement
+
+    if not settings.MEDIA_CACHE_LOCAL_SIZE:
+        return None
+
+    if _local_cache is None:
+        with _local_cache_init_lock:
+            if _local_cache is None:
+                ttl = settings.MEDIA_CACHE_LOCAL_TTL
+                media_timeout = caches['media'].default_timeout
+                if media_timeout is not None:
+                    ttl = min(ttl, media_timeout)
+                _local_cache = _LocalCache(settings.MEDIA_CACHE_LOCAL_SIZE, ttl)
+
+    return _local_cache
+
 class MediaCache:
     def __init__(self, dimension=DimensionType.DIM_2D):
         self._dimension = dimension
         self._cache = caches['media']
+        self._local_cache = _get_local_cache()
+
+    @staticmethod
+    def get_stats() -> Dict[str, float]:
+        return MediaCacheStats.get()
+
+    def _get_cached_item(self, key):
+        try:
+            item = self._cache.get(key)
+        except pickle.UnpicklingError:
+            slogger.glob.error(f'Unable to get item from cache: key {key}', exc_info=True)
+            return None
+
+        if not item:
+            return None
+
+        # compare checksum
+        item_data = item[0].getbuffer() if isinstance(item[0], io.BytesIO) else item[0]
+        item_checksum = item[2] if len(item) >= 3 else None
+        if item_checksum != zlib.crc32(item_data):
+            slogger.glob.info(f'Recreating cache item {key} due to checksum mismatch')
+            return None
+
+        return item
+
+    def _get_lock(self, key):
+        # Only one process prepares a missing item, the others wait for it.
+        # The lock is only available with the Redis backend.
+        lock_key = self._cache.make_key(f'{key}_lock')
+        client = _get_redis_client(self._cache, lock_key, write=True)
+        if client is None:
+            return nullcontext(True)
+
+        lock = client.lock(lock_key,
+            timeout=settings.MEDIA_CACHE_LOCK_TIMEOUT,
+            blocking_timeout=settings.MEDIA_CACHE_LOCK_WAIT_TIMEOUT,
+        )
+        return self._acquire_lock(lock)
+
+    @staticmethod
+    @contextmanager
+    def _acquire_lock(lock):
+        start = time.monotonic()
+        acquired = lock.acquire()
+        MediaCacheStats.increment('lock_wait_time', time.monotonic() - start)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except LockError:
+                    # the lock has expired while the item was being prepared
+                    slogger.glob.warning('Unable to release media cache lock', exc_info=True)
 
     def _get_or_set_cache_item(self, key, create_function):
         def create_item():
             slogger.glob.info(f'Starting to prepare chunk: key {key}')
+            start = time.monotonic()
             item = create_function()
+            MediaCacheStats.increment('builds')
+            MediaCacheStats.increment('build_time', time.monotonic() - start)
             slogger.glob.info(f'Ending to prepare chunk: key {key}')
 
             if item[0]:
@@ -56,34 +288,123 @@ class MediaCache:
 
             return item
 
+        if self._local_cache is not None:
+            item = self._local_cache.get(key)
+            if item is not None:
+                MediaCacheStats.increment('local_hits')
+                return item
+
         slogger.glob.info(f'Starting to get chunk from cache: key {key}')
-        try:
-            item = self._cache.get(key)
-        except pickle.UnpicklingError:
-            slogger.glob.error(f'Unable to get item from cache: key {key}', exc_info=True)
-            item = None
+        item = self._get_cached_item(key)
         slogger.glob.info(f'Ending to get chunk from cache: key {key}, is_cached {bool(item)}')
 
-        if not item:
-            item = create_item()
+        if item:
+            MediaCacheStats.increment('hits')
+            # only the first request of a prewarmed item counts as a prewarm hit,
+            # add() succeeds only for one of the concurrent requests
+            if len(item) > 3 and item[3] and \
+                    self._cache.add(self._make_prewarm_hit_key(key), True):
+                MediaCacheStats.increment('prewarm_hits')
+                # clear the flag, so that the next hits skip the check
+                self._cache.set(key, item[:3])
         else:
-            # compare checksum
-            item_data = item[0].getbuffer() if isinstance(item[0], io.BytesIO) else item[0]
-            item_checksum = item[2] if len(item) == 3 else None
-            if item_checksum != zlib.crc32(item_data):
-                slogger.glob.info(f'Recreating cache item {key} due to checksum mismatch')
-                item = create_item()
+            MediaCacheStats.increment('misses')
+            with self._get_lock(key) as acquired:
+                if not acquired:
+                    MediaCacheStats.increment('lock_timeouts')
+                    slogger.glob.warning(
+                        f'Timed out waiting for the cache item preparation: key {key}')
+
+                # the item could have been prepared while waiting for the lock
+                item = self._get_cached_item(key)
+                if item:
+                    MediaCacheStats.increment('coalesced')
+                else:
+                    item = create_item()
+
+        if self._local_cache is not None and item[0]:
+            self._local_cache.set(key, item[0], item[1])
 
         return item[0], item[1]
 
+    @staticmethod
+    def _make_prewarm_hit_key(key):
+        return f'{key}_prewarm_hit'
+
+    @staticmethod
+    def _make_task_chunk_key(db_data, chunk_number, quality):
+        return f'{db_data.id}_{chunk_number}_{quality}'
+
     def get_task_chunk_data_with_mime(self, chunk_number, quality, db_data):
         item = self._get_or_set_cache_item(
-            key=f'{db_data.id}_{chunk_number}_{quality}',
+            key=self._make_task_chunk_key(db_data, chunk_number, quality),
             create_function=lambda: self._prepare_task_chunk(db_data, quality, chunk_number),
         )
 
         return item
 
+    def has_space_for_prewarm(self) -> bool:
+        client = _get_redis_client(self._cache, None, write=False)
+        if client is None:
+            return True
+
+        info = client.info()
+        if info.get('maxmemory'):
+            usage = info['used_memory'] / info['maxmemory']
+        elif info.get('disk_capacity'):
+            # Kvrocks
+            usage = info['used_disk_size'] / info['disk_capacity']
+        else:
+            return True
+
+        return usage < settings.MEDIA_CACHE_PREWARM_MAX_USAGE
+
+    def has_task_chunk(self, chunk_number, quality, db_data) -> bool:
+        return self._cache.has_key(self._make_task_chunk_key(db_data, chunk_number, quality))
+
+    def prewarm_task_chunk(self, chunk_number, quality, db_data) -> bool:
+        """
+        Prepares a task chunk if it is not cached yet.
+        Returns True if the chunk has been prepared.
+        """
+        if self.has_task_chunk(chunk_number, quality, db_data):
+            return False
+
+        key = self._make_task_chunk_key(db_data, chunk_number, quality)
+
+        with self._get_lock(key) as acquired:
+            # the chunk could have been requested meanwhile
+            if not acquired or self._cache.has_key(key):
+                return False
+
+            start = time.monotonic()
+            buff, mime_type = self._prepare_task_chunk(db_data, quality, chunk_number)
+            MediaCacheStats.increment('prewarm_builds')
+            MediaCacheStats.increment('prewarm_build_time', time.monotonic() - start)
+
+            # the last item marks chunks prepared in advance, to measure the prewarm hit rate
+            self._cache.delete(self._make_prewarm_hit_key(key))
+            self._cache.set(key, (buff, mime_type, zlib.crc32(buff.getbuffer()), True))
+
+        return True
+
+    @staticmethod
+    def _make_task_frame_key(db_data, frame_number, quality):
+        return f'data_{db_data.id}_{frame_number}_{quality}_frame'
+
+    def get_task_frame_data_with_mime(self, frame_number, quality, db_data):
+        """
+        Returns a single frame of an image chunk. The frames are cached separately,
+        so only the requested frame is transferred from the cache. The frames are
+        stored in addition to their chunk, see the MEDIA_CACHE_SINGLE_FRAMES setting.
+        """
+        item = self._get_or_set_cache_item(
+            key=self._make_task_frame_key(db_data, frame_number, quality),
+            create_function=lambda: self._prepare_task_frame(db_data, quality, frame_number),
+        )
+
+        return item
+
     def get_selective_job_chunk_data_with_mime(self, chunk_number, quality, job):
         item = self._get_or_set_cache_item(
             key=f'job_{job.id}_{chunk_number}_{quality}',
@@ -133,11 +454,62 @@ class MediaCache:
             FrameProvider  # TODO: remove circular dependency
         return FrameProvider
 
-    from contextlib import contextmanager
+    @staticmethod
+    def _download_cloud_images(
+        cloud_storage_instance, cloud_storage_id: int,
+        files: Sequence[Tuple[str, Optional[str]]], *,
+        tmp_dir: Optional[str] = None, decode: bool = True,
+    ) -> Iterator[Tuple[Any, str, None]]:
+        """
+        Downloads the files in a thread pool and returns them in order as soon as
+        each of them is ready, so that the chunk encoding starts with the first downloaded file.
+        The images are decoded and checked against the manifest checksums in the pool threads.
+        The files are kept in memory unless tmp_dir is specified.
+        """
+
+        def _download(file_name: str, checksum: Optional[str]):
+            buff = cloud_storage_instance.download_fileobj(file_name)
+            path = file_name
+            if tmp_dir:
+                path = os.path.join(tmp_dir, file_name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(buff.getbuffer())
+
+            if not decode:
+                return path, path, None
+
+            image = PIL.Image.open(buff)
+            image.load()
+            if checksum and not md5_hash(image) == checksum:
+                slogger.cloud_storage[cloud_storage_id].warning(
+                    'Hash sums of files {} do not match'.format(file_name))
+            return image, path, None
+
+        threads_number = min(get_cpu_number(), 4)
+        # limit the number of downloaded images waiting for the encoding
+        max_pending = 2 * threads_number
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=threads_number) as executor:
+            try:
+                for file_name, checksum in files:
+                    pending.append(executor.submit(_download, file_name, checksum))
+                    if len(pending) >= max_pending:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
 
     @staticmethod
     @contextmanager
-    def _get_images(db_data, chunk_number, dimension):
+    def _get_images(db_data, chunk_number, dimension, *, stream: bool = False):
+        """
+        With stream=True, the images can be returned lazily and without files on disk,
+        which is only supported by the writers that don't store the original files.
+        """
         images = []
         tmp_dir = None
         upload_dir = {
@@ -176,29 +548,24 @@ class MediaCache:
                     }
                     cloud_storage_instance = get_cloud_storage_instance(cloud_provider=db_cloud_storage.provider_type, **details)
 
-                    tmp_dir = tempfile.mkdtemp(prefix='cvat')
-                    files_to_download = []
-                    checksums = []
-                    for item in reader:
-                        file_name = f"{item['name']}{item['extension']}"
-                        fs_filename = os.path.join(tmp_dir, file_name)
-
-                        files_to_download.append(file_name)
-                        checksums.append(item.get('checksum', None))
-                        images.append((fs_filename, fs_filename, None))
-
-                    cloud_storage_instance.bulk_download_to_dir(files=files_to_download, upload_dir=tmp_dir)
-                    images = preload_images(images)
-
-                    for checksum, (_, fs_filename, _) in zip(checksums, images):
-                        if checksum and not md5_hash(fs_filename) == checksum:
-                            slogger.cloud_storage[db_cloud_storage.id].warning('Hash sums of files {} do not match'.format(file_name))
+                    # The files are only needed on disk by the writers that store them as is
+                    if not stream or dimension != DimensionType.DIM_2D:
+                        tmp_dir = tempfile.mkdtemp(prefix='cvat')
+
+                    images = MediaCache._download_cloud_images(
+                        cloud_storage_instance, db_cloud_storage.id,
+                        [(f"{item['name']}{item['extension']}", item.get('checksum', None))
+                            for item in reader],
+                        tmp_dir=tmp_dir, decode=dimension == DimensionType.DIM_2D,
+                    )
+                    if not stream:
+                        images = list(images)
                 else:
                     for item in reader:
                         source_path = os.path.join(upload_dir, f"{item['name']}{item['extension']}")
                         images.append((source_path, source_path, None))
                     if dimension == DimensionType.DIM_2D:
-                        images = preload_images(images)
+                        images = map(preload_image, images) if stream else preload_images(images)
 
             yield images
         finally:
@@ -222,12 +589,42 @@ class MediaCache:
         writer = writer_classes[quality](image_quality, **kwargs)
 
         buff = BytesIO()
-        with self._get_images(db_data, chunk_number, self._dimension) as images:
+        with self._get_images(db_data, chunk_number, self._dimension,
+            stream=writer_classes[quality] == ZipCompressedChunkWriter
+        ) as images:
             writer.save_as_chunk(images, buff)
         buff.seek(0)
 
         return buff, mime_type
 
+    def _prepare_task_frame(self, db_data, quality, frame_number):
+        # Split the whole chunk into frames at once, the neighbour frames
+        # are likely to be requested soon
+        chunk_number = frame_number // db_data.chunk_size
+        chunk_start = chunk_number * db_data.chunk_size
+        chunk, _ = self.get_task_chunk_data_with_mime(chunk_number, quality, db_data)
+
+        reader = ZipReader([chunk])
+        requested_frame = None
+        frames = {}
+        for frame_offset in range(len(reader)):
+            frame_bytes = reader.get_image(frame_offset)
+            mime_type = mimetypes.guess_type(reader.get_path(frame_offset))[0]
+
+            if chunk_start + frame_offset == frame_number:
+                requested_frame = (frame_bytes, mime_type)
+            else:
+                key = self._make_task_frame_key(db_data, chunk_start + frame_offset, quality)
+                frames[key] = (frame_bytes, mime_type, zlib.crc32(frame_bytes.getbuffer()))
+
+        if frames:
+            self._cache.set_many(frames)
+
+        if requested_frame is None:
+            raise Exception(f'Chunk {chunk_number} of data #{db_data.id} has no frame {frame_number}')
+
+        return requested_frame
+
     def prepare_selective_job_chunk(self, db_job: Job, quality, chunk_number: int):
         db_data = db_job.segment.task.data
 
@@ -308,8 +705,8 @@ class MediaCache:
                 os.path.join(db_storage.get_storage_dirname(), manifest_model.filename),
                 db_storage.get_storage_dirname()
             )
-            # need to update index
-            manifest.set_index()
+            # the index is rebuilt if the manifest has been updated
+            manifest.init_index()
             if not len(manifest):
                 continue
             preview_info = manifest[0]
@@ -347,3 +744,66 @@ class MediaCache:
         mime_type = 'application/zip'
         zip_buffer.seek(0)
         return zip_buffer, mime_type
+
+def _prewarm_task_chunks(data_id, chunk_numbers, quality, dimension):
+    try:
+        db_data = Data.objects.get(pk=data_id)
+    except Data.DoesNotExist:
+        return
+
+    cache = MediaCache(dimension)
+    try:
+        if not cache.has_space_for_prewarm():
+            MediaCacheStats.increment('prewarm_skipped_no_space')
+            slogger.glob.info(f'Skipping chunk prewarm for data #{data_id}: the media cache is full')
+            return
+
+        prepared = 0
+        for chunk_number in chunk_numbers:
+            prepared += cache.prewarm_task_chunk(chunk_number, quality, db_data)
+    finally:
+        # the work horse exits without flushing the counters
+        MediaCacheStats.flush()
+
+    slogger.glob.info(
+        f'Prewarmed chunks of data #{data_id}: prepared {prepared}, '
+        f'already cached {len(chunk_numbers) - prepared}, stats {MediaCacheStats.get()}'
+    )
+
+def prewarm_task_chunks(db_data, dimension, first_chunk, last_chunk, quality=None):
+    """
+    Schedules preparation of the task chunks in the [first_chunk, last_chunk] range,
+    limited by the configured number of chunks for the task.
+    Redis and RQ errors are raised, the callers log them as prewarming is best-effort
+    """
+    if not (settings.USE_CACHE and db_data.storage_method == StorageMethodChoice.CACHE):
+        return
+
+    chunks_count = db_data.prewarm_chunks
+    if chunks_count is None:
+        chunks_count = settings.MEDIA_CACHE_PREWARM_CHUNKS
+
+    if quality is None:
+        quality = MediaCache._get_frame_provider_class().Quality.COMPRESSED
+
+    # the worker skips the chunks that are already cached, so that the request
+    # path only pays for the enqueue
+    chunk_numbers = list(range(first_chunk, min(last_chunk, first_chunk + chunks_count - 1) + 1))
+    if not chunk_numbers:
+        return
+
+    queue = django_rq.get_queue(settings.CVAT_QUEUES.CHUNKS.value)
+    rq_id = f'prewarm:data.id{db_data.id}.chunk{chunk_numbers[0]}.{quality.name.lower()}'
+    rq_job = queue.fetch_job(rq_id)
+    if rq_job and (rq_job.is_queued or rq_job.is_started):
+        return
+
+    queue.enqueue_call(
+        func=_prewarm_task_chunks,
+        args=(db_data.id, chunk_numbers, quality, dimension),
+        job_id=rq_id,
+        # outdated requests are not worth preparing
+        ttl=settings.MEDIA_CACHE_PREWARM_QUEUE_TTL,
+        result_ttl=0,
+        failure_ttl=settings.MEDIA_CACHE_PREWARM_QUEUE_TTL,
+    )
@@ -3,13 +3,16 @@
 #
 # SPDX-License-Identifier: MIT
 
+import bisect
 import math
+from collections import OrderedDict
 from enum import Enum
 from io import BytesIO
 import os
 
 import cv2
 import numpy as np
+from django.conf import settings
 from PIL import Image, ImageOps
 
 from cvat.apps.engine.cache import MediaCache
@@ -52,6 +55,112 @@ class RandomAccessIterator:
         self.iterator = None
         self.pos = -1
 
+class ImageListRandomAccessIterator(RandomAccessIterator):
+    """
+    Random access to the items of an image reader, e.g. a zip chunk:
+    every item is read directly, regardless of the previous position
+    """
+
+    def __getitem__(self, idx):
+        assert 0 <= idx
+        v = self.iterable[idx]
+        self.pos = idx
+        return v
+
+class VideoRandomAccessIterator(RandomAccessIterator):
+    """
+    Random access to the frames of a video chunk. Decoding starts from the nearest
+    key frame before the requested one, instead of the beginning of the video,
+    and the last decoded frames are kept for repeated and backward access.
+
+    Unlike the base class, this iterator retains items: each cached frame is
+    a decoded av.VideoFrame, which takes about 3 MB for a 1080p YUV420 video,
+    so the default cache adds up to ~25 MB per open chunk. Pass
+    decoded_frames_cache_size=0 to disable the cache.
+    """
+
+    DECODED_FRAMES_CACHE_SIZE = 8
+
+    def __init__(self, iterable: VideoReader, *,
+        decoded_frames_cache_size: int = DECODED_FRAMES_CACHE_SIZE
+    ):
+        super().__init__(iterable)
+        self.decoded_frames_cache_size = decoded_frames_cache_size
+        self._decoded_frames = OrderedDict()
+        self._key_frames = None
+        self._decoder_pos = -1 # the index of the last frame returned by self.iterator
+
+    def _load_key_frames(self):
+        if self._key_frames is None:
+            key_frames = self.iterable.get_key_frames()
+            if not key_frames or not key_frames[1]:
+                self._key_frames = False
+            else:
+                frame_pts, key_frame_pts = key_frames
+                frame_ids = {pts: idx for idx, pts in enumerate(frame_pts)}
+                self._key_frames = (
+                    frame_ids, [frame_ids[pts] for pts in key_frame_pts], key_frame_pts
+                )
+        return self._key_frames
+
+    def _cache_frame(self, idx, v):
+        if self.decoded_frames_cache_size <= 0:
+            return
+
+        self._decoded_frames[idx] = v
+        self._decoded_frames.move_to_end(idx)
+        while len(self._decoded_frames) > self.decoded_frames_cache_size:
+            self._decoded_frames.popitem(last=False)
+
+    def _decode(self, idx):
+        key_frames = self._load_key_frames()
+        if key_frames:
+            frame_ids, key_frame_ids, key_frame_pts = key_frames
+            key_frame_pos = max(0, bisect.bisect_right(key_frame_ids, idx) - 1)
+            key_frame_id = key_frame_ids[key_frame_pos]
+        else:
+            frame_ids = {}
+            key_frame_id = 0
+
+        if self.iterator is None or idx <= self._decoder_pos or \
+                self._decoder_pos < key_frame_id - 1:
+            # the requested frame is behind or in another GOP, seek to its key frame
+            self.close()
+            if key_frames:
+                self.iterator = self.iterable.iterate_from_key_frame(
+                    key_frame_pts[key_frame_pos])
+            else:
+                self.iterator = iter(self.iterable)
+            self._decoder_pos = key_frame_id - 1
+
+        v = None
+        while self._decoder_pos < idx:
+            v = next(self.iterator)
+            self._decoder_pos = frame_ids.get(v[2], self._decoder_pos + 1)
+            self._cache_frame(self._decoder_pos, v)
+        return v
+
+    def __getitem__(self, idx):
+        assert 0 <= idx
+        v = self._decoded_frames.get(idx)
+        if v is not None:
+            self._decoded_frames.move_to_end(idx)
+        else:
+            v = self._decode(idx)
+        self.pos = idx
+        return v
+
+    def close(self):
+        super().close()
+        self._decoder_pos = -1
+
+def make_random_access_iterator(reader) -> RandomAccessIterator:
+    if isinstance(reader, ZipReader):
+        return ImageListRandomAccessIterator(reader)
+    elif isinstance(reader, VideoReader):
+        return VideoRandomAccessIterator(reader)
+    return RandomAccessIterator(reader)
+
 class FrameProvider:
     VIDEO_FRAME_EXT = '.PNG'
     VIDEO_FRAME_MIME = 'image/png'
@@ -77,7 +186,7 @@ class FrameProvider:
                 self.unload()
 
                 self.chunk_id = chunk_id
-                self.chunk_reader = RandomAccessIterator(
+                self.chunk_reader = make_random_access_iterator(
                     self.reader_class([self.get_chunk_path(chunk_id)]))
             return self.chunk_reader
 
@@ -96,7 +205,7 @@ class FrameProvider:
         def load(self, chunk_id):
             if self.chunk_id != chunk_id:
                 self.chunk_id = chunk_id
-                self.chunk_reader = RandomAccessIterator(
+                self.chunk_reader = make_random_access_iterator(
                     self.reader_class([self.get_chunk_path(chunk_id, self.quality, self.db_data)[0]]))
             return self.chunk_reader
 
@@ -104,6 +213,7 @@ class FrameProvider:
         self._db_data = db_data
         self._dimension = dimension
         self._loaders = {}
+        self._media_cache = None
 
         reader_class = {
             DataChoice.IMAGESET: ZipReader,
@@ -112,6 +222,7 @@ class FrameProvider:
 
         if db_data.storage_method == StorageMethodChoice.CACHE:
             cache = MediaCache(dimension=dimension)
+            self._media_cache = cache
 
             self._loaders[self.Quality.COMPRESSED] = self.BuffChunkLoader(
                 reader_class[db_data.compressed_chunk_type],
@@ -209,8 +320,16 @@ class FrameProvider:
 
     def get_frame(self, frame_number, quality=Quality.ORIGINAL,
             out_type=Type.BUFFER):
-        _, chunk_number, frame_offset = self._validate_frame_number(frame_number)
+        frame_number, chunk_number, frame_offset = self._validate_frame_number(frame_number)
         loader = self._loaders[quality]
+
+        if settings.MEDIA_CACHE_SINGLE_FRAMES and \
+                self._media_cache is not None and loader.reader_class is ZipReader:
+            # avoid transferring the whole chunk from the cache for a single frame
+            frame, mime_type = self._media_cache.get_task_frame_data_with_mime(
+                frame_number, quality, self._db_data)
+            return (self._convert_frame(frame, loader.reader_class, out_type), mime_type)
+
         chunk_reader = loader.load(chunk_number)
         frame, frame_name, _ = chunk_reader[frame_offset]
 
@@ -2,17 +2,24 @@
 #
 # SPDX-License-Identifier: MIT
 
+import bisect
 import os
 import tempfile
 import shutil
 import zipfile
 import io
 import itertools
+import multiprocessing
 import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from enum import IntEnum
 from abc import ABC, abstractmethod
-from contextlib import closing
-from typing import Iterable
+from contextlib import closing, contextmanager, suppress
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterable, Iterator, Optional
 
 import av
 import numpy as np
@@ -20,6 +27,7 @@ from natsort import os_sorted
 from pyunpack import Archive
 from PIL import Image, ImageFile, ImageOps
 from random import shuffle
+from django.conf import settings
 from cvat.apps.engine.utils import rotate_image
 from cvat.apps.engine.models import DimensionType, SortingMethod
 
@@ -179,6 +187,11 @@ class ImageListReader(IMediaReader):
     def __contains__(self, media_file):
         return media_file in self._source_path
 
+    def __getitem__(self, idx):
+        # the same item as the idx-th item of iteration
+        i = self.frame_range[idx]
+        return (self.get_image(i), self.get_path(i), i)
+
     def filter(self, callback):
         source_path = list(filter(callback, self._source_path))
         ImageListReader.__init__(
@@ -417,6 +430,20 @@ class VideoReader(IMediaReader):
 
         return False
 
+    @staticmethod
+    def _rotate_frame(image, stream):
+        if stream.metadata.get('rotate'):
+            pts = image.pts
+            image = av.VideoFrame().from_ndarray(
+                rotate_image(
+                    image.to_ndarray(format='bgr24'),
+                    360 - int(stream.metadata.get('rotate'))
+                ),
+                format ='bgr24'
+            )
+            image.pts = pts
+        return image
+
     def __iter__(self):
         with self._get_av_container() as container:
             stream = container.streams.video[0]
@@ -426,18 +453,45 @@ class VideoReader(IMediaReader):
                 for image in packet.decode():
                     frame_num += 1
                     if self._has_frame(frame_num - 1):
-                        if packet.stream.metadata.get('rotate'):
-                            pts = image.pts
-                            image = av.VideoFrame().from_ndarray(
-                                rotate_image(
-                                    image.to_ndarray(format='bgr24'),
-                                    360 - int(stream.metadata.get('rotate'))
-                                ),
-                                format ='bgr24'
-                            )
-                            image.pts = pts
+                        image = self._rotate_frame(image, stream)
                         yield (image, self._source_path[0], image.pts)
 
+    def get_key_frames(self):
+        """
+        Reads the packets of the video without decoding them.
+        Returns the sorted pts of all the frames and the pts of the key frames,
+        or None if some packets have no pts.
+        """
+        frame_pts = []
+        key_frame_pts = []
+        with self._get_av_container() as container:
+            stream = container.streams.video[0]
+            for packet in container.demux(stream):
+                if packet.size == 0:
+                    continue # a flushing packet
+                if packet.pts is None:
+                    return None
+                frame_pts.append(packet.pts)
+                if packet.is_keyframe:
+                    key_frame_pts.append(packet.pts)
+        return sorted(frame_pts), sorted(key_frame_pts)
+
+    def iterate_from_key_frame(self, key_frame_pts):
+        """
+        Decodes the video starting from the key frame with the given pts,
+        frames are returned in the same format as in iteration
+        """
+        with self._get_av_container() as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            container.seek(offset=key_frame_pts, stream=stream, backward=True, any_frame=False)
+            for packet in container.demux(stream):
+                for image in packet.decode():
+                    if image.pts is None or image.pts < key_frame_pts:
+                        continue
+                    image = self._rotate_frame(image, stream)
+                    yield (image, self._source_path[0], image.pts)
+
     def get_progress(self, pos):
         duration = self._get_duration()
         return pos / duration if duration else None
@@ -523,8 +577,201 @@ class ImageDatasetManifestReader(FragmentMediaReader):
         self._manifest.init_index()
 
     def __iter__(self):
-        for idx in self._frame_range:
-            yield self._manifest[idx]
+        if self._frame_range:
+            # read all the chunk items at once
+            yield from self._manifest[self._frame_range[0]:self._frame_range[-1] + 1:self._step]
+
+class _VideoDecodingSession:
+    """
+    An opened video with the key frames from its manifest. Consecutive reads continue
+    decoding from the current position instead of seeking to the nearest key frame,
+    and the last decoded frames can be kept to be read again.
+    """
+
+    def __init__(self, source_path, manifest):
+        self._key_frame_numbers = []
+        self._key_frame_timestamps = []
+        for _, item in manifest:
+            self._key_frame_numbers.append(item['number'])
+            self._key_frame_timestamps.append(item['pts'])
+
+        self._container = av.open(source_path, mode='r')
+        try:
+            self._video_stream = next(
+                stream for stream in self._container.streams if stream.type == 'video'
+            )
+            self._video_stream.thread_type = 'AUTO'
+        except BaseException:
+            self._container.close()
+            raise
+        self._rotation = int(self._video_stream.metadata.get('rotate', 0))
+
+        self._frames = None # (frame number, frame) from the current position
+        self._next_frame_number = None
+        # consecutive decoded frames, up to the current position
+        self._decoded_frames = deque(maxlen=settings.CVAT_VIDEO_DECODED_FRAMES_BUFFER_SIZE)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        self._container.close()
+
+    def _get_nearest_left_key_frame(self, frame_number: int) -> tuple[int, int]:
+        idx = max(bisect.bisect_right(self._key_frame_numbers, frame_number) - 1, 0)
+        return self._key_frame_numbers[idx], self._key_frame_timestamps[idx]
+
+    def _decode_from(self, frame_number: int, timestamp: int):
+        self._container.seek(offset=timestamp, stream=self._video_stream)
+        for packet in self._container.demux(self._video_stream):
+            for frame in packet.decode():
+                if self._rotation:
+                    frame = av.VideoFrame().from_ndarray(
+                        rotate_image(frame.to_ndarray(format='bgr24'), 360 - self._rotation),
+                        format ='bgr24'
+                    )
+                yield frame_number, frame
+                frame_number += 1
+
+    def _get_decoded_frame(self, frame_number: int) -> Optional[av.VideoFrame]:
+        if self._decoded_frames:
+            idx = frame_number - self._decoded_frames[0][0]
+            if 0 <= idx < len(self._decoded_frames):
+                return self._decoded_frames[idx][1]
+        return None
+
+    def read(self, frame_numbers: Iterable[int]) -> Iterator[av.VideoFrame]:
+        """
+        Yields the frames with the specified numbers, which must be increasing.
+        Stops at the end of the video.
+        """
+        for frame_number in frame_numbers:
+            frame = self._get_decoded_frame(frame_number)
+            if frame is not None:
+                yield frame
+                continue
+
+            key_frame_number, key_frame_timestamp = self._get_nearest_left_key_frame(frame_number)
+            if self._next_frame_number is None or \
+                    not key_frame_number <= self._next_frame_number <= frame_number:
+                # seeking is required or it is faster than decoding up to the frame
+                self._frames = self._decode_from(key_frame_number, key_frame_timestamp)
+                self._next_frame_number = key_frame_number
+                self._decoded_frames.clear()
+
+            for decoded_frame_number, frame in self._frames:
+                self._next_frame_number = decoded_frame_number + 1
+                self._decoded_frames.append((decoded_frame_number, frame))
+                if decoded_frame_number == frame_number:
+                    break
+            else:
+                self._frames = self._next_frame_number = None
+                return
+
+            yield frame
+
+class _VideoDecodingSessions:
+    """
+    Process-wide pool of the idle decoding sessions, a session is used by one reader at a time.
+    Idle sessions are closed by a background timer after MAX_IDLE_TIME,
+    even if no other chunks are read by the process.
+    """
+
+    MAX_SESSIONS = 4
+    MAX_IDLE_TIME = 60 # seconds
+
+    _lock = threading.Lock()
+    _sessions: OrderedDict[tuple, _VideoDecodingSession] = OrderedDict()
+    _reaper: Optional[threading.Timer] = None
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # the sessions and the timer thread of the parent process can't be used in a child
+        cls._lock = threading.Lock()
+        cls._sessions = OrderedDict()
+        cls._reaper = None
+
+    @staticmethod
+    def _make_key(source_path: str, manifest_path: str) -> tuple:
+        # a changed video or manifest requires a new session
+        return (
+            source_path, os.stat(source_path).st_mtime_ns,
+            manifest_path, os.stat(manifest_path).st_mtime_ns,
+        )
+
+    @classmethod
+    def _remove_expired(cls) -> list[_VideoDecodingSession]:
+        expired = []
+        now = time.monotonic()
+        while cls._sessions:
+            key, session = next(iter(cls._sessions.items()))
+            if len(cls._sessions) <= cls.MAX_SESSIONS and \
+                    now - session.last_used < cls.MAX_IDLE_TIME:
+                break
+            del cls._sessions[key]
+            expired.append(session)
+        return expired
+
+    @classmethod
+    def _schedule_reaping(cls):
+        # must be called with the lock held
+        if cls._reaper is not None or not cls._sessions:
+            return
+
+        # the first session is the least recently used one
+        oldest_session = next(iter(cls._sessions.values()))
+        delay = max(0, oldest_session.last_used + cls.MAX_IDLE_TIME - time.monotonic())
+        cls._reaper = threading.Timer(delay, cls._reap)
+        cls._reaper.daemon = True
+        cls._reaper.start()
+
+    @classmethod
+    def _reap(cls):
+        with cls._lock:
+            cls._reaper = None
+            expired = cls._remove_expired()
+            cls._schedule_reaping()
+
+        for expired_session in expired:
+            expired_session.close()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+            if cls._reaper is not None:
+                cls._reaper.cancel()
+                cls._reaper = None
+
+        for session in sessions:
+            session.close()
+
+    @classmethod
+    def acquire(cls, source_path: str, manifest) -> tuple[tuple, _VideoDecodingSession]:
+        key = cls._make_key(source_path, manifest.manifest.path)
+        with cls._lock:
+            session = cls._sessions.pop(key, None)
+            expired = cls._remove_expired()
+
+        for expired_session in expired:
+            expired_session.close()
+
+        if session is None:
+            session = _VideoDecodingSession(source_path, manifest)
+        return key, session
+
+    @classmethod
+    def release(cls, key: tuple, session: _VideoDecodingSession):
+        session.last_used = time.monotonic()
+        with cls._lock:
+            duplicate = cls._sessions.pop(key, None)
+            cls._sessions[key] = session
+            expired = cls._remove_expired()
+            cls._schedule_reaping()
+
+        for expired_session in filter(None, [duplicate, *expired]):
+            expired_session.close()
+
+os.register_at_fork(after_in_child=_VideoDecodingSessions._reset_after_fork)
 
 class VideoDatasetManifestReader(FragmentMediaReader):
     def __init__(self, manifest_path, **kwargs):
@@ -533,60 +780,183 @@ class VideoDatasetManifestReader(FragmentMediaReader):
         self._manifest = VideoManifestManager(manifest_path)
         self._manifest.init_index()
 
-    def _get_nearest_left_key_frame(self):
-        if self._start_chunk_frame_number >= \
-                self._manifest[len(self._manifest) - 1].get('number'):
-            left_border = len(self._manifest) - 1
-        else:
-            left_border = 0
-            delta = len(self._manifest)
-            while delta:
-                step = delta // 2
-                cur_position = left_border + step
-                if self._manifest[cur_position].get('number') < self._start_chunk_frame_number:
-                    cur_position += 1
-                    left_border = cur_position
-                    delta -= step + 1
-                else:
-                    delta = step
-            if self._manifest[cur_position].get('number') > self._start_chunk_frame_number:
-                left_border -= 1
-        frame_number = self._manifest[left_border].get('number')
-        timestamp = self._manifest[left_border].get('pts')
-        return frame_number, timestamp
-
     def __iter__(self):
-        start_decode_frame_number, start_decode_timestamp = self._get_nearest_left_key_frame()
-        with closing(av.open(self.source_path, mode='r')) as container:
-            video_stream = next(stream for stream in container.streams if stream.type == 'video')
-            video_stream.thread_type = 'AUTO'
-
-            container.seek(offset=start_decode_timestamp, stream=video_stream)
+        # the video is kept opened for the next chunks
+        key, session = _VideoDecodingSessions.acquire(self.source_path, self._manifest)
+        try:
+            with closing(session.read(self._frame_range)) as frames:
+                yield from frames
+        except GeneratorExit:
+            # the reading was stopped by the caller, the session can be reused
+            _VideoDecodingSessions.release(key, session)
+            raise
+        except BaseException:
+            session.close()
+            raise
+        else:
+            _VideoDecodingSessions.release(key, session)
+
+# The same transformations as in ImageOps.exif_transpose
+_ORIENTATION_TRANSPOSE = {
+    ORIENTATION.MIRROR_HORIZONTAL: Image.Transpose.FLIP_LEFT_RIGHT,
+    ORIENTATION.NORMAL_180_ROTATED: Image.Transpose.ROTATE_180,
+    ORIENTATION.MIRROR_VERTICAL: Image.Transpose.FLIP_TOP_BOTTOM,
+    ORIENTATION.MIRROR_HORIZONTAL_270_ROTATED: Image.Transpose.TRANSPOSE,
+    ORIENTATION.NORMAL_90_ROTATED: Image.Transpose.ROTATE_270,
+    ORIENTATION.MIRROR_HORIZONTAL_90_ROTATED: Image.Transpose.TRANSVERSE,
+    ORIENTATION.NORMAL_270_ROTATED: Image.Transpose.ROTATE_90,
+}
 
-            frame_number = start_decode_frame_number - 1
-            for packet in container.demux(video_stream):
-                for frame in packet.decode():
-                    frame_number += 1
-                    if frame_number in self._frame_range:
-                        if video_stream.metadata.get('rotate'):
-                            frame = av.VideoFrame().from_ndarray(
-                                rotate_image(
-                                    frame.to_ndarray(format='bgr24'),
-                                    360 - int(container.streams.video[0].metadata.get('rotate'))
-                                ),
-                                format ='bgr24'
-                            )
-                        yield frame
-                    elif frame_number < self._frame_range[-1]:
-                        continue
-                    else:
-                        return
+# Image modes that can be restored from raw pixel data without extra information (e.g. a palette)
+_SHARED_MEMORY_IMAGE_MODES = {'1', 'L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr', 'I', 'I;16', 'F'}
+
+@contextmanager
+def chunk_encoding_pool() -> Iterator[Optional[ProcessPoolExecutor]]:
+    """
+    Creates a process pool for chunk image compression, if it is enabled.
+    The pool is shut down on exit, so the pool workers don't outlive the caller,
+    e.g. an RQ work horse, which exits without running the atexit handlers.
+
+    Enter the context before starting any threads: the workers are forked
+    right away, and forking a process with running threads can leave
+    the locks held by these threads locked in the workers.
+    """
+    if settings.CVAT_CHUNK_ENCODING_WORKERS <= 0:
+        yield None
+        return
+
+    # the workers must share the resource tracker of this process,
+    # otherwise their trackers report the shared memory blocks unlinked here as leaked
+    resource_tracker.ensure_running()
+
+    # fork: the workers don't need to set up Django
+    pool = ProcessPoolExecutor(
+        max_workers=settings.CVAT_CHUNK_ENCODING_WORKERS,
+        mp_context=multiprocessing.get_context('fork'),
+    )
+    try:
+        # with the fork context, all the workers are started on the first submit
+        pool.submit(int).result()
+        yield pool
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def _compress_shared_image(shm_name: str, mode: str, size: tuple[int, int],
+        orientation: int, quality: int) -> tuple[int, int, io.BytesIO]:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # the block is removed by the parent process
+        image = Image.frombytes(mode, size, shm.buf)
+    finally:
+        shm.close()
+
+    # Transpose.FLIP_LEFT_RIGHT is 0
+    if (transpose := _ORIENTATION_TRANSPOSE.get(orientation)) is not None:
+        image = image.transpose(transpose)
+
+    return IChunkWriter._compress_image(image, quality)
+
+def _compress_encoded_image(image_bytes: bytes, quality: int) -> tuple[int, int, io.BytesIO]:
+    return IChunkWriter._compress_image(io.BytesIO(image_bytes), quality)
+
+def _has_shared_memory_space(size: int) -> bool:
+    # writing into a shared memory block beyond the free space of /dev/shm crashes the process
+    try:
+        stat = os.statvfs('/dev/shm')
+    except OSError:
+        return False
+    return size < stat.f_bavail * stat.f_frsize
 
 class IChunkWriter(ABC):
-    def __init__(self, quality, dimension=DimensionType.DIM_2D):
+    def __init__(self, quality, dimension=DimensionType.DIM_2D, *,
+            encoding_pool: Optional[ProcessPoolExecutor] = None):
         self._image_quality = quality
         self._dimension = dimension
 
+        # the pool from chunk_encoding_pool(), the images are compressed in place if it is None
+        self.encoding_pool = encoding_pool
+
+    @staticmethod
+    def _submit_compression(
+        pool: ProcessPoolExecutor,
+        source_image: av.VideoFrame | io.IOBase | Image.Image,
+        quality: int,
+    ) -> tuple[Future, Optional[shared_memory.SharedMemory]]:
+        if isinstance(source_image, io.IOBase):
+            if source_image.seekable():
+                source_image.seek(0) # as in Image.open()
+            return pool.submit(_compress_encoded_image, source_image.read(), quality), None
+
+        if isinstance(source_image, av.VideoFrame):
+            source_image = source_image.to_image()
+            orientation = ORIENTATION.NORMAL_HORIZONTAL
+        else:
+            orientation = source_image.getexif().get(
+                ORIENTATION_EXIF_TAG, ORIENTATION.NORMAL_HORIZONTAL)
+
+        image_bytes = source_image.tobytes() \
+            if source_image.mode in _SHARED_MEMORY_IMAGE_MODES else b''
+        if not image_bytes or not _has_shared_memory_space(len(image_bytes)):
+            # send the image through the pool pipe
+            return pool.submit(IChunkWriter._compress_image, source_image, quality), None
+
+        shm = shared_memory.SharedMemory(create=True, size=len(image_bytes))
+        try:
+            shm.buf[:len(image_bytes)] = image_bytes
+            del image_bytes
+            future = pool.submit(_compress_shared_image,
+                shm.name, source_image.mode, source_image.size, orientation, quality)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        return future, shm
+
+    def _compress_images(
+        self, images: Iterable[av.VideoFrame | io.IOBase | Image.Image], quality: int
+    ) -> Iterator[tuple[int, int, io.BytesIO]]:
+        """
+        Compresses the images in the chunk encoding process pool, if the writer has one.
+        The results are returned in the order of the images.
+        """
+        pool = self.encoding_pool
+        if pool is None:
+            for image in images:
+                yield self._compress_image(image, quality)
+            return
+
+        # limit the number of images kept in memory
+        max_pending = 2 * settings.CVAT_CHUNK_ENCODING_WORKERS
+        pending = deque()
+
+        def _get_result():
+            future, shm = pending.popleft()
+            try:
+                return future.result()
+            finally:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+
+        try:
+            for image in images:
+                pending.append(self._submit_compression(pool, image, quality))
+                if len(pending) >= max_pending:
+                    yield _get_result()
+
+            while pending:
+                yield _get_result()
+        finally:
+            while pending:
+                future, shm = pending.popleft()
+                future.cancel()
+                if shm is not None:
+                    # wait for the worker to finish with the shared memory block
+                    with suppress(Exception):
+                        future.result()
+                    shm.close()
+                    shm.unlink()
+
     @staticmethod
     def _compress_image(source_image: av.VideoFrame | io.IOBase | Image.Image, quality: int) -> tuple[int, int, io.BytesIO]:
         image = None
@@ -703,23 +1073,34 @@ class ZipCompressedChunkWriter(ZipChunkWriter):
     ):
         image_sizes = []
         with zipfile.ZipFile(chunk_path, 'x', compresslevel=zip_compress_level) as zip_chunk:
-            for idx, (image, path, _) in enumerate(images):
-                if self._dimension == DimensionType.DIM_2D:
-                    if compress_frames:
-                        w, h, image_buf = self._compress_image(image, self._image_quality)
-                    else:
-                        assert isinstance(image, io.IOBase)
-                        image_buf = io.BytesIO(image.read())
-                        with Image.open(image_buf) as img:
-                            w, h = img.size
-                    extension = self.IMAGE_EXT
-                else:
-                    image_buf, extension, w, h = self._write_pcd_file(path)
+            for idx, (image_buf, extension, w, h) in enumerate(
+                self._get_frames(images, compress_frames=compress_frames)
+            ):
                 image_sizes.append((w, h))
                 arcname = '{:06d}.{}'.format(idx, extension)
                 zip_chunk.writestr(arcname, image_buf.getvalue())
         return image_sizes
 
+    def _get_frames(
+        self, images: Iterable[tuple[Image.Image|io.IOBase|str, str, str]], *, compress_frames: bool
+    ) -> Iterator[tuple[io.BytesIO, str, int, int]]:
+        if self._dimension == DimensionType.DIM_2D and compress_frames:
+            for w, h, image_buf in self._compress_images(
+                (image for image, _, _ in images), self._image_quality
+            ):
+                yield image_buf, self.IMAGE_EXT, w, h
+            return
+
+        for image, path, _ in images:
+            if self._dimension == DimensionType.DIM_2D:
+                assert isinstance(image, io.IOBase)
+                image_buf = io.BytesIO(image.read())
+                with Image.open(image_buf) as img:
+                    w, h = img.size
+                yield image_buf, self.IMAGE_EXT, w, h
+            else:
+                yield self._write_pcd_file(path)
+
 class Mpeg4ChunkWriter(IChunkWriter):
     FORMAT = 'mp4'
 
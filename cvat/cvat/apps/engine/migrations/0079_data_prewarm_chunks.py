@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2024-03-15 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("engine", "0078_alter_cloudstorage_credentials"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="data",
+            name="prewarm_chunks",
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
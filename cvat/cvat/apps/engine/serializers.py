@@ -902,6 +902,11 @@ class DataSerializer(serializers.ModelSerializer):
             Enable or disable task data chunk caching for the task.
             Read more: https://opencv.github.io/cvat/docs/manual/advanced/data_on_fly/
         """))
+    prewarm_chunks = serializers.IntegerField(min_value=0, allow_null=True, required=False,
+        help_text=textwrap.dedent("""\
+            The number of chunks prepared in advance in the cache, when the task uses
+            data chunk caching. If not set, the server default is used, 0 disables it.
+        """))
     copy_data = serializers.BooleanField(default=False, help_text=textwrap.dedent("""\
             Copy data from the server file share to CVAT during the task creation.
             This will create a copy of the data, making the server independent from
@@ -946,7 +951,7 @@ class DataSerializer(serializers.ModelSerializer):
             'compressed_chunk_type', 'original_chunk_type',
             'client_files', 'server_files', 'remote_files',
             'use_zip_chunks', 'server_files_exclude',
-            'cloud_storage_id', 'use_cache', 'copy_data', 'storage_method',
+            'cloud_storage_id', 'use_cache', 'prewarm_chunks', 'copy_data', 'storage_method',
             'storage', 'sorting_method', 'filename_pattern',
             'job_file_mapping', 'upload_file_order',
         )
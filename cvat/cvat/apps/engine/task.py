@@ -24,10 +24,12 @@ from datetime import datetime, timezone
 from pathlib import Path
 
 from cvat.apps.engine import models
+from cvat.apps.engine.cache import prewarm_task_chunks
 from cvat.apps.engine.log import ServerLogManager
 from cvat.apps.engine.media_extractors import (MEDIA_TYPES, ImageListReader, Mpeg4ChunkWriter, Mpeg4CompressedChunkWriter,
-    ValidateDimension, ZipChunkWriter, ZipCompressedChunkWriter, get_mime, sort)
-from cvat.apps.engine.utils import av_scan_paths,get_rq_job_meta, define_dependent_job, get_rq_lock_by_user, preload_images
+    ValidateDimension, ZipChunkWriter, ZipCompressedChunkWriter, chunk_encoding_pool, get_mime, sort)
+from cvat.apps.engine.utils import (av_scan_paths,get_rq_job_meta, define_dependent_job, get_rq_lock_by_user,
+    PreloadedImagesIterator, tee_preload_images)
 from cvat.utils.http import make_requests_session, PROXIES_FOR_UNTRUSTED_URLS
 from utils.dataset_manifest import ImageManifestManager, VideoManifestManager, is_manifest
 from utils.dataset_manifest.core import VideoManifestValidator, is_dataset_manifest
@@ -555,7 +557,7 @@ def _create_thread(
                 os.path.join(db_data.cloud_storage.get_storage_dirname(), manifest_file),
                 db_data.cloud_storage.get_storage_dirname()
             )
-            cloud_storage_manifest.set_index()
+            cloud_storage_manifest.init_index()
             cloud_storage_manifest_prefix = os.path.dirname(manifest_file)
 
         if manifest_file and not data['server_files'] and not data['filename_pattern']: # only manifest file was specified in server files by the user
@@ -1011,8 +1013,22 @@ def _create_thread(
                     chunk_paths = [(extractor.get_path(i), i) for i in chunk_frames]
                     img_sizes = []
 
-                    for chunk_path, frame_id in chunk_paths:
-                        properties = manifest[manifest_index(frame_id)]
+                    # evenly spaced manifest items of a chunk are read at once
+                    chunk_indices = [manifest_index(frame_id) for _, frame_id in chunk_paths]
+                    step = chunk_indices[1] - chunk_indices[0] if len(chunk_indices) > 1 else 1
+                    if 0 < step and chunk_indices == list(
+                        range(chunk_indices[0], chunk_indices[-1] + 1, step)
+                    ):
+                        chunk_properties = manifest[chunk_indices[0]:chunk_indices[-1] + 1:step]
+                    else:
+                        chunk_properties = [manifest[i] for i in chunk_indices if i < len(manifest)]
+                    if len(chunk_properties) != len(chunk_paths):
+                        raise ValidationError(
+                            "The manifest file does not describe all the task images: "
+                            f"{len(manifest)} items found, frame {chunk_paths[-1][1]} is requested"
+                        )
+
+                    for (chunk_path, frame_id), properties in zip(chunk_paths, chunk_properties):
 
                         # check mapping
                         if not chunk_path.endswith(f"{properties['name']}{properties['extension']}"):
@@ -1048,6 +1064,7 @@ def _create_thread(
                 chunk_idx: int,
                 chunk_data: Iterable[tuple[str, str, str]]) -> list[tuple[str, int, tuple[int, int]]]:
             nonlocal db_data, db_task, extractor, original_chunk_writer, compressed_chunk_writer
+            original_images = compressed_images = chunk_data
             if (db_task.dimension == models.DimensionType.DIM_2D and
                 isinstance(extractor, (
                     MEDIA_TYPES['image']['extractor'],
@@ -1055,19 +1072,33 @@ def _create_thread(
                     MEDIA_TYPES['pdf']['extractor'],
                     MEDIA_TYPES['archive']['extractor'],
                 ))):
-                chunk_data = preload_images(chunk_data)
+                # the writers share the decoded images instead of keeping the whole chunk
+                original_images, compressed_images = tee_preload_images(
+                    chunk_data, 2, max_bytes=settings.CVAT_CHUNK_DECODED_IMAGES_LIMIT)
 
-            fs_original = executor.submit(
-                original_chunk_writer.save_as_chunk,
-                images=chunk_data,
-                chunk_path=db_data.get_original_chunk_path(chunk_idx)
-            )
-            fs_compressed = executor.submit(
-                compressed_chunk_writer.save_as_chunk,
-                images=chunk_data,
+            def save_as_chunk(writer, images, chunk_path):
+                try:
+                    return writer.save_as_chunk(images=images, chunk_path=chunk_path)
+                finally:
+                    if isinstance(images, PreloadedImagesIterator):
+                        # don't block the other writer if this one has failed
+                        images.close()
+
+            # The writers must run at the same time: with shared images, a writer
+            # waits for the other one to receive them. The original chunk is written
+            # in this thread, so the writers don't wait for free executor threads.
+            fs_compressed = executor.submit(save_as_chunk,
+                compressed_chunk_writer, compressed_images,
                 chunk_path=db_data.get_compressed_chunk_path(chunk_idx),
             )
-            fs_original.result()
+            try:
+                save_as_chunk(original_chunk_writer, original_images,
+                    chunk_path=db_data.get_original_chunk_path(chunk_idx)
+                )
+            except BaseException:
+                # the failed writer has released the shared images, wait for the other one
+                concurrent.futures.wait([fs_compressed])
+                raise
             image_sizes = fs_compressed.result()
 
             # (path, frame, size)
@@ -1093,7 +1124,12 @@ def _create_thread(
             update_progress(progress)
 
         futures = queue.Queue(maxsize=settings.CVAT_CONCURRENT_CHUNK_PROCESSING)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2*settings.CVAT_CONCURRENT_CHUNK_PROCESSING) as executor:
+        # the encoding pool must be started before the chunk threads
+        with (
+            chunk_encoding_pool() as encoding_pool,
+            concurrent.futures.ThreadPoolExecutor(max_workers=2*settings.CVAT_CONCURRENT_CHUNK_PROCESSING) as executor,
+        ):
+            compressed_chunk_writer.encoding_pool = encoding_pool
             for chunk_idx, chunk_data in generator:
                 db_data.size += len(chunk_data)
                 if futures.full():
@@ -1129,3 +1165,13 @@ def _create_thread(
 
     slogger.glob.info("Found frames {} for Data #{}".format(db_data.size, db_data.id))
     _save_task_to_db(db_task, job_file_mapping=job_file_mapping)
+
+    # prepare the first chunks of each job before the jobs are opened
+    try:
+        for db_segment in db_task.segment_set.all():
+            prewarm_task_chunks(db_data, db_task.dimension,
+                db_segment.start_frame // db_data.chunk_size,
+                db_segment.stop_frame // db_data.chunk_size)
+    except Exception as ex:
+        # the task is already created, prewarming is best-effort
+        slogger.glob.warning(f'Failed to schedule chunk prewarm for data #{db_data.id}: {ex}')
@@ -0,0 +1,439 @@
+# Copyright (C) 2024 CVAT.ai Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from fakeredis import FakeStrictRedis
+from PIL import Image
+
+from cvat.apps.engine.cache import (MediaCache, MediaCacheStats, _LocalCache,
+    _prewarm_task_chunks, prewarm_task_chunks)
+from cvat.apps.engine.frame_provider import FrameProvider
+from cvat.apps.engine.models import (DataChoice, DimensionType, StorageChoice,
+    StorageMethodChoice)
+from cvat.apps.engine.utils import md5_hash
+
+from .utils import generate_image_file
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'media': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'media',
+    },
+}
+
+@override_settings(CACHES=LOCMEM_CACHES, MEDIA_CACHE_LOCAL_SIZE=0)
+class MediaCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['media'].clear()
+        MediaCacheStats.reset()
+
+    def test_concurrent_misses_build_item_once(self):
+        # emulates the Redis lock, which is not available with the local memory backend
+        lock = threading.Lock()
+        cache = MediaCache()
+        builds = []
+
+        def create_item():
+            builds.append(threading.get_ident())
+            time.sleep(0.2)
+            return io.BytesIO(b'chunk data'), 'application/zip'
+
+        requests = 4
+        barrier = threading.Barrier(requests)
+        def get_item(_):
+            barrier.wait()
+            return cache._get_or_set_cache_item('item', create_item)
+
+        with (
+            mock.patch.object(MediaCache, '_get_lock',
+                lambda _self, _key: MediaCache._acquire_lock(lock)),
+            ThreadPoolExecutor(max_workers=requests) as executor,
+        ):
+            items = list(executor.map(get_item, range(requests)))
+
+        self.assertEqual(len(builds), 1)
+        for data, mime_type in items:
+            self.assertEqual(data.getvalue(), b'chunk data')
+            self.assertEqual(mime_type, 'application/zip')
+
+        stats = MediaCacheStats.get()
+        self.assertEqual(stats['builds'], 1)
+        self.assertEqual(stats.get('hits', 0) + stats['misses'], requests)
+        self.assertEqual(stats.get('coalesced', 0), stats['misses'] - 1)
+
+    def test_stats_are_shared_between_processes(self):
+        redis = FakeStrictRedis()
+        with mock.patch.object(MediaCacheStats, '_get_client',
+            lambda write: (redis, 'media_cache_stats')
+        ):
+            MediaCacheStats.increment('hits', 2)
+            MediaCacheStats.increment('build_time', 0.5)
+            MediaCacheStats.flush()
+
+            # the counters of another process
+            MediaCacheStats.increment('hits')
+            MediaCacheStats.increment('misses')
+            MediaCacheStats.increment('build_time', 0.25)
+
+            self.assertEqual(MediaCacheStats.get(), {
+                'hits': 3, 'misses': 1, 'build_time': 0.75, 'hit_rate': 0.75,
+            })
+            self.assertEqual(redis.hget('media_cache_stats', 'hits'), b'3')
+
+            MediaCacheStats.reset()
+            self.assertEqual(MediaCacheStats.get(), {})
+
+class LocalCacheTest(SimpleTestCase):
+    def test_items_expire(self):
+        local_cache = _LocalCache(max_size=100, ttl=60)
+        local_cache.set('key', io.BytesIO(b'data'), 'application/zip')
+
+        with mock.patch('cvat.apps.engine.cache.time.monotonic', return_value=time.monotonic() + 30):
+            data, mime_type = local_cache.get('key')
+        self.assertEqual((data.getvalue(), mime_type), (b'data', 'application/zip'))
+
+        with mock.patch('cvat.apps.engine.cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(local_cache.get('key'))
+
+@override_settings(CACHES=LOCMEM_CACHES, MEDIA_CACHE_LOCAL_SIZE=0,
+    USE_CACHE=True, MEDIA_CACHE_PREWARM_CHUNKS=2)
+class ChunkPrewarmTest(SimpleTestCase):
+    QUALITY = FrameProvider.Quality.COMPRESSED
+
+    def setUp(self):
+        caches['media'].clear()
+        MediaCacheStats.reset()
+        self.db_data = SimpleNamespace(id=1,
+            storage_method=StorageMethodChoice.CACHE, prewarm_chunks=None)
+
+        self.queue = mock.Mock()
+        self.queue.fetch_job.return_value = None
+        queue_patcher = mock.patch('cvat.apps.engine.cache.django_rq.get_queue',
+            return_value=self.queue)
+        queue_patcher.start()
+        self.addCleanup(queue_patcher.stop)
+
+        self.built_chunks = []
+        def prepare_task_chunk(_self, _db_data, _quality, chunk_number):
+            self.built_chunks.append(chunk_number)
+            return io.BytesIO(f'chunk {chunk_number}'.encode()), 'application/zip'
+        prepare_patcher = mock.patch.object(MediaCache, '_prepare_task_chunk', prepare_task_chunk)
+        prepare_patcher.start()
+        self.addCleanup(prepare_patcher.stop)
+
+    def _prewarm(self, first_chunk=1, last_chunk=10):
+        prewarm_task_chunks(self.db_data, DimensionType.DIM_2D, first_chunk, last_chunk,
+            quality=self.QUALITY)
+
+    def _get_enqueued_chunks(self):
+        self.queue.enqueue_call.assert_called_once()
+        return self.queue.enqueue_call.call_args.kwargs['args'][1]
+
+    def test_enqueues_next_chunks(self):
+        self._prewarm(first_chunk=3, last_chunk=10)
+
+        self.assertEqual(self._get_enqueued_chunks(), [3, 4])
+        self.assertEqual(self.queue.enqueue_call.call_args.kwargs['job_id'],
+            'prewarm:data.id1.chunk3.compressed')
+
+    def test_enqueues_only_existing_chunks(self):
+        self._prewarm(first_chunk=3, last_chunk=3)
+
+        self.assertEqual(self._get_enqueued_chunks(), [3])
+
+    def test_does_not_enqueue_if_disabled(self):
+        for db_data_options, settings_options in [
+            ({'prewarm_chunks': 0}, {}),
+            ({}, {'MEDIA_CACHE_PREWARM_CHUNKS': 0}),
+            ({}, {'USE_CACHE': False}),
+            ({'storage_method': StorageMethodChoice.FILE_SYSTEM}, {}),
+        ]:
+            with self.subTest(db_data=db_data_options, settings=settings_options):
+                self.queue.reset_mock()
+                self.db_data = SimpleNamespace(**{
+                    'id': 1, 'storage_method': StorageMethodChoice.CACHE, 'prewarm_chunks': None,
+                    **db_data_options,
+                })
+
+                with self.settings(**settings_options):
+                    self._prewarm()
+
+                self.queue.enqueue_call.assert_not_called()
+
+    def test_does_not_check_cached_chunks_on_request(self):
+        # the worker skips them, see test_worker_builds_missing_chunks
+        with mock.patch.object(MediaCache, 'has_task_chunk') as has_task_chunk:
+            self._prewarm(first_chunk=1)
+
+        has_task_chunk.assert_not_called()
+        self.assertEqual(self._get_enqueued_chunks(), [1, 2])
+
+    def test_does_not_enqueue_same_request_twice(self):
+        self.queue.fetch_job.return_value = mock.Mock(is_queued=True, is_started=False)
+
+        self._prewarm()
+
+        self.queue.fetch_job.assert_called_once_with('prewarm:data.id1.chunk1.compressed')
+        self.queue.enqueue_call.assert_not_called()
+
+    def test_worker_builds_missing_chunks(self):
+        cache = MediaCache()
+        cache.get_task_chunk_data_with_mime(1, self.QUALITY, self.db_data)
+        self.built_chunks.clear()
+
+        with mock.patch('cvat.apps.engine.cache.Data.objects.get', return_value=self.db_data):
+            _prewarm_task_chunks(self.db_data.id, [1, 2, 3], self.QUALITY, DimensionType.DIM_2D)
+
+        self.assertEqual(self.built_chunks, [2, 3])
+        self.assertTrue(all(
+            cache.has_task_chunk(chunk_number, self.QUALITY, self.db_data)
+            for chunk_number in [1, 2, 3]
+        ))
+
+        # the prewarmed chunks are not built again when requested
+        data, _ = cache.get_task_chunk_data_with_mime(2, self.QUALITY, self.db_data)
+        self.assertEqual(data.getvalue(), b'chunk 2')
+        self.assertEqual(self.built_chunks, [2, 3])
+
+        stats = MediaCacheStats.get()
+        self.assertEqual(stats['prewarm_builds'], 2)
+        self.assertEqual(stats['prewarm_hits'], 1)
+        self.assertEqual(stats['prewarm_hit_rate'], 0.5)
+
+        # only the first request of a prewarmed chunk is a prewarm hit,
+        # the next ones do not check it again
+        with mock.patch.object(caches['media'], 'add', wraps=caches['media'].add) as add:
+            for _ in range(3):
+                cache.get_task_chunk_data_with_mime(2, self.QUALITY, self.db_data)
+        add.assert_not_called()
+
+        stats = MediaCacheStats.get()
+        self.assertEqual(stats['hits'], 4)
+        self.assertEqual(stats['prewarm_hits'], 1)
+        self.assertEqual(stats['prewarm_hit_rate'], 0.5)
+
+        # a prewarmed chunk can be hit again after it is prepared in advance again
+        caches['media'].delete(MediaCache._make_task_chunk_key(self.db_data, 2, self.QUALITY))
+        with mock.patch('cvat.apps.engine.cache.Data.objects.get', return_value=self.db_data):
+            _prewarm_task_chunks(self.db_data.id, [2], self.QUALITY, DimensionType.DIM_2D)
+        cache.get_task_chunk_data_with_mime(2, self.QUALITY, self.db_data)
+        cache.get_task_chunk_data_with_mime(2, self.QUALITY, self.db_data)
+
+        stats = MediaCacheStats.get()
+        self.assertEqual(stats['prewarm_builds'], 3)
+        self.assertEqual(stats['prewarm_hits'], 2)
+
+@override_settings(CACHES=LOCMEM_CACHES, MEDIA_CACHE_LOCAL_SIZE=0)
+class FrameCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['media'].clear()
+        self.db_data = SimpleNamespace(id=1, storage_method=StorageMethodChoice.CACHE,
+            compressed_chunk_type=DataChoice.IMAGESET, original_chunk_type=DataChoice.IMAGESET,
+            chunk_size=4, size=10, start_frame=0, stop_frame=9)
+
+        self.built_chunks = []
+        def prepare_task_chunk(_self, db_data, quality, chunk_number):
+            self.built_chunks.append((chunk_number, quality))
+
+            buff = io.BytesIO()
+            with zipfile.ZipFile(buff, 'x') as chunk:
+                first_frame = chunk_number * db_data.chunk_size
+                for frame in range(first_frame, min(first_frame + db_data.chunk_size, db_data.size)):
+                    image = generate_image_file(f'{frame:06d}.jpeg', size=(frame + 1, quality.value + 1))
+                    chunk.writestr(image.name, image.getvalue())
+            buff.seek(0)
+            return buff, 'application/zip'
+        prepare_patcher = mock.patch.object(MediaCache, '_prepare_task_chunk', prepare_task_chunk)
+        prepare_patcher.start()
+        self.addCleanup(prepare_patcher.stop)
+
+    def _get_frames(self, quality):
+        frame_provider = FrameProvider(self.db_data)
+        return [
+            (data.getvalue(), mime_type)
+            for data, mime_type in frame_provider.get_frames(0, self.db_data.size, quality=quality)
+        ]
+
+    def test_single_frames_match_chunk_frames(self):
+        for quality in FrameProvider.Quality:
+            with self.subTest(quality=quality):
+                with self.settings(MEDIA_CACHE_SINGLE_FRAMES=False):
+                    expected = self._get_frames(quality)
+
+                with self.settings(MEDIA_CACHE_SINGLE_FRAMES=True):
+                    self.built_chunks.clear()
+                    frames = self._get_frames(quality)
+
+                self.assertEqual(frames, expected)
+                self.assertEqual({mime_type for _, mime_type in frames}, {'image/jpeg'})
+
+                # the chunks are taken from the cache, not built again
+                self.assertEqual(self.built_chunks, [])
+                self.assertTrue(all(
+                    caches['media'].get(
+                        MediaCache._make_task_frame_key(self.db_data, frame, quality))
+                    for frame in range(self.db_data.size)
+                ))
+
+    def test_missing_frame_is_an_error(self):
+        quality = FrameProvider.Quality.COMPRESSED
+        cache = MediaCache()
+        # the last chunk is built with 3 frames instead of 4
+        self.db_data.size = 11
+
+        with self.assertRaisesRegex(Exception, 'has no frame 11'):
+            cache.get_task_frame_data_with_mime(11, quality, self.db_data)
+        self.assertIsNone(caches['media'].get(
+            MediaCache._make_task_frame_key(self.db_data, 11, quality)))
+
+        # the other frames of the chunk are still available
+        frame, mime_type = cache.get_task_frame_data_with_mime(10, quality, self.db_data)
+        self.assertEqual(mime_type, 'image/jpeg')
+        self.assertTrue(frame.getvalue())
+
+class CloudImagesDownloadTest(SimpleTestCase):
+    IMAGE_COUNT = 10
+    # 2 download threads, up to 4 downloaded images wait for the encoding
+    MAX_PENDING = 4
+
+    def setUp(self):
+        self.files = {}
+        for idx in range(self.IMAGE_COUNT):
+            image = generate_image_file(f'images/image_{idx}.jpeg', size=(idx + 1, 10))
+            self.files[image.name] = image.getvalue()
+
+        # the first files are downloaded last
+        self.download_delays = {
+            name: 0.01 * (self.IMAGE_COUNT - idx) for idx, name in enumerate(self.files)
+        }
+        self.cloud_storage = mock.Mock()
+        self.cloud_storage.download_fileobj.side_effect = self._download
+
+        cpu_patcher = mock.patch('cvat.apps.engine.cache.get_cpu_number', return_value=2)
+        cpu_patcher.start()
+        self.addCleanup(cpu_patcher.stop)
+
+    def _download(self, file_name):
+        time.sleep(self.download_delays[file_name])
+        return io.BytesIO(self.files[file_name])
+
+    def _download_images(self, checksums=None, **kwargs):
+        checksums = checksums or {}
+        return MediaCache._download_cloud_images(self.cloud_storage, 1,
+            [(name, checksums.get(name)) for name in self.files], **kwargs)
+
+    def _get_downloaded_files(self):
+        return [call.args[0] for call in self.cloud_storage.download_fileobj.call_args_list]
+
+    def test_images_are_returned_in_order(self):
+        images = list(self._download_images())
+
+        self.assertEqual([path for _, path, _ in images], list(self.files))
+        self.assertEqual([image.size for image, _, _ in images],
+            [(idx + 1, 10) for idx in range(self.IMAGE_COUNT)])
+
+    def test_pending_downloads_are_limited(self):
+        for returned_images, _ in enumerate(self._download_images(), start=1):
+            time.sleep(0.02)
+            self.assertLessEqual(len(self._get_downloaded_files()),
+                returned_images + self.MAX_PENDING)
+
+        self.assertEqual(self._get_downloaded_files(), list(self.files))
+
+    def test_closing_cancels_pending_downloads(self):
+        # the download threads are busy when the first image is returned
+        self.download_delays = {name: 0.1 for name in self.files}
+        self.download_delays[next(iter(self.files))] = 0
+
+        images = self._download_images()
+        next(images)
+        images.close()
+
+        # the started downloads are finished, the others are cancelled
+        downloaded_files = self._get_downloaded_files()
+        self.assertLess(len(downloaded_files), self.MAX_PENDING)
+
+        time.sleep(0.2)
+        self.assertEqual(self._get_downloaded_files(), downloaded_files)
+
+    def test_checksum_mismatch_is_only_logged(self):
+        names = list(self.files)
+        checksums = {
+            names[0]: md5_hash(Image.open(io.BytesIO(self.files[names[0]]))),
+            names[1]: 'invalid checksum',
+        }
+
+        with mock.patch('cvat.apps.engine.cache.slogger') as slogger:
+            images = list(self._download_images(checksums))
+
+        self.assertEqual(len(images), self.IMAGE_COUNT)
+        warning = slogger.cloud_storage[1].warning
+        warning.assert_called_once()
+        self.assertIn(names[1], warning.call_args.args[0])
+
+    def test_files_are_saved_only_for_writers_that_need_them(self):
+        manifest_items = [
+            {'name': os.path.splitext(name)[0], 'extension': '.jpeg'} for name in self.files
+        ]
+        db_data = SimpleNamespace(storage=StorageChoice.CLOUD_STORAGE,
+            get_upload_dirname=lambda: '', get_manifest_path=lambda: '',
+            chunk_size=self.IMAGE_COUNT, start_frame=0, stop_frame=self.IMAGE_COUNT - 1,
+            get_frame_step=lambda: 1,
+            cloud_storage=SimpleNamespace(id=1, credentials_type=None, credentials='',
+                resource='bucket', provider_type=None, get_specific_attributes=lambda: {}))
+
+        make_tmp_dir = tempfile.mkdtemp
+        tmp_dirs = []
+        def mkdtemp(**kwargs):
+            tmp_dirs.append(make_tmp_dir(**kwargs))
+            return tmp_dirs[-1]
+
+        for stream, dimension, expect_files in [
+            (True, DimensionType.DIM_2D, False),
+            (False, DimensionType.DIM_2D, True),
+            (True, DimensionType.DIM_3D, True),
+        ]:
+            with (
+                self.subTest(stream=stream, dimension=dimension),
+                mock.patch('cvat.apps.engine.cache.ImageDatasetManifestReader',
+                    return_value=manifest_items),
+                mock.patch('cvat.apps.engine.cache.Credentials'),
+                mock.patch('cvat.apps.engine.cache.get_cloud_storage_instance',
+                    return_value=self.cloud_storage),
+                mock.patch('cvat.apps.engine.cache.tempfile.mkdtemp', side_effect=mkdtemp),
+            ):
+                tmp_dirs.clear()
+                with MediaCache._get_images(db_data, 0, dimension, stream=stream) as images:
+                    images = list(images)
+                    paths = [path for _, path, _ in images]
+                    files_exist = [os.path.isfile(path) for path in paths]
+
+                if expect_files:
+                    self.assertEqual(len(tmp_dirs), 1)
+                    self.assertEqual(paths,
+                        [os.path.join(tmp_dirs[0], name) for name in self.files])
+                    self.assertTrue(all(files_exist))
+                    self.assertFalse(os.path.exists(tmp_dirs[0]))
+                else:
+                    self.assertEqual(tmp_dirs, [])
+                    self.assertEqual(paths, list(self.files))
+
+                self.assertEqual(
+                    [isinstance(image, str) for image, _, _ in images],
+                    [dimension == DimensionType.DIM_3D] * self.IMAGE_COUNT)
@@ -0,0 +1,126 @@
+# Copyright (C) 2024 CVAT.ai Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import zipfile
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase
+
+from cvat.apps.engine.frame_provider import (ImageListRandomAccessIterator,
+    VideoRandomAccessIterator, make_random_access_iterator)
+from cvat.apps.engine.media_extractors import VideoReader, ZipReader
+
+from .utils import generate_image_file, generate_video_file
+
+# backward, repeated, in-GOP and cross-GOP access
+ACCESS_ORDER = [30, 0, 20, 19, 5, 5, 4, 49, 12, 13, 37, 36, 1]
+
+class _RandomAccessIteratorTestBase:
+    FRAME_COUNT = 0
+
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+        self.path = self._create_media(self.tmp_dir)
+        self.expected = [self._get_frame_data(v) for v in self._make_reader()]
+        self.assertEqual(len(self.expected), self.FRAME_COUNT)
+
+    def _create_media(self, tmp_dir):
+        raise NotImplementedError
+
+    def _make_reader(self):
+        raise NotImplementedError
+
+    def _get_frame_data(self, item):
+        raise NotImplementedError
+
+    def _make_iterator(self):
+        return make_random_access_iterator(self._make_reader())
+
+    def _assert_frame(self, item, idx):
+        self.assertEqual(self._get_frame_data(item), self.expected[idx], msg=f'frame {idx}')
+
+    def test_can_iterate_sequentially(self):
+        it = self._make_iterator()
+        for idx in range(self.FRAME_COUNT):
+            self._assert_frame(next(it), idx)
+        it.close()
+
+    def test_can_seek(self):
+        it = self._make_iterator()
+        for idx in ACCESS_ORDER:
+            self._assert_frame(it[idx], idx)
+            self.assertEqual(it.pos, idx)
+        it.close()
+
+    def test_next_continues_from_the_last_accessed_frame(self):
+        it = self._make_iterator()
+        for idx in ACCESS_ORDER:
+            it[idx]
+            if idx + 1 < self.FRAME_COUNT:
+                self._assert_frame(next(it), idx + 1)
+        it.close()
+
+class ImageListRandomAccessIteratorTest(_RandomAccessIteratorTestBase, SimpleTestCase):
+    FRAME_COUNT = 50
+
+    def _create_media(self, tmp_dir):
+        path = os.path.join(tmp_dir, 'chunk.zip')
+        with zipfile.ZipFile(path, 'x') as zip_chunk:
+            for idx in range(self.FRAME_COUNT):
+                image = generate_image_file(f'{idx:06d}.jpeg', size=(idx + 1, 10))
+                zip_chunk.writestr(image.name, image.getvalue())
+        return path
+
+    def _make_reader(self):
+        return ZipReader([self.path])
+
+    def _get_frame_data(self, item):
+        image, path, _ = item
+        data = image.getvalue()
+        image.seek(0)
+        return data, path
+
+    def test_iterator_type(self):
+        self.assertIsInstance(self._make_iterator(), ImageListRandomAccessIterator)
+
+class VideoRandomAccessIteratorTest(_RandomAccessIteratorTestBase, SimpleTestCase):
+    FRAME_COUNT = 50
+
+    def _create_media(self, tmp_dir):
+        # mpeg4 puts a key frame every 12 frames by default
+        _, video = generate_video_file('chunk.mp4', width=64, height=64, duration=2)
+        path = os.path.join(tmp_dir, video.name)
+        with open(path, 'wb') as f:
+            f.write(video.getvalue())
+        return path
+
+    def _make_reader(self):
+        return VideoReader([self.path])
+
+    def _get_frame_data(self, item):
+        return item[0].to_ndarray(format='rgb24').tobytes()
+
+    def test_iterator_type(self):
+        it = self._make_iterator()
+        self.assertIsInstance(it, VideoRandomAccessIterator)
+        self.assertGreater(len(it._load_key_frames()[1]), 1)
+
+    def test_can_seek_without_frame_cache(self):
+        it = VideoRandomAccessIterator(self._make_reader(), decoded_frames_cache_size=0)
+        for idx in ACCESS_ORDER:
+            self._assert_frame(it[idx], idx)
+            self.assertEqual(len(it._decoded_frames), 0)
+        self._assert_frame(next(it), ACCESS_ORDER[-1] + 1)
+        it.close()
+
+    def test_frame_cache_is_bounded(self):
+        it = VideoRandomAccessIterator(self._make_reader(), decoded_frames_cache_size=3)
+        for idx in ACCESS_ORDER:
+            self._assert_frame(it[idx], idx)
+            self.assertLessEqual(len(it._decoded_frames), 3)
+        it.close()
@@ -0,0 +1,237 @@
+# Copyright (C) 2024 CVAT.ai Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from utils.dataset_manifest import ImageManifestManager
+from utils.dataset_manifest.core import _Index
+from utils.dataset_manifest.errors import InvalidManifestError
+
+from .utils import generate_image_file
+
+class _ManifestTestBase(SimpleTestCase):
+    IMAGE_COUNT = 10
+
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.data_dir = os.path.join(tmp_dir.name, 'data')
+        self.manifest_dir = os.path.join(tmp_dir.name, 'manifest')
+        os.makedirs(self.data_dir)
+        os.makedirs(self.manifest_dir)
+
+        self.manifest_path = os.path.join(self.manifest_dir, 'manifest.jsonl')
+        self.index_path = os.path.join(self.manifest_dir, _Index.FILE_NAME)
+        self.legacy_index_path = os.path.join(self.manifest_dir, _Index.LEGACY_FILE_NAME)
+
+        self._create_manifest(self.IMAGE_COUNT)
+
+    def _create_manifest(self, image_count):
+        image_paths = []
+        for idx in range(image_count):
+            image = generate_image_file(f'image_{idx:03d}.jpg', size=(idx + 1, 10))
+            path = os.path.join(self.data_dir, image.name)
+            with open(path, 'wb') as f:
+                f.write(image.getvalue())
+            image_paths.append(path)
+
+        manifest = ImageManifestManager(self.manifest_path)
+        manifest.link(sources=image_paths, data_dir=self.data_dir)
+        manifest.create()
+        manifest.close()
+
+    def _open_manifest(self, **kwargs):
+        manifest = ImageManifestManager(self.manifest_path, **kwargs)
+        manifest.init_index()
+        self.addCleanup(manifest.close)
+        return manifest
+
+    @staticmethod
+    def _get_names(items):
+        return [item['name'] for item in items]
+
+    @staticmethod
+    def _make_names(indices):
+        return [f'image_{idx:03d}' for idx in indices]
+
+    def _read_index_header(self):
+        with open(self.index_path, 'rb') as index_file:
+            return _Index._HEADER.unpack(index_file.read(_Index._HEADER.size))
+
+class ManifestIndexTest(_ManifestTestBase):
+    def test_index_is_created_with_manifest(self):
+        self.assertTrue(os.path.exists(self.index_path))
+        self.assertFalse(os.path.exists(self.legacy_index_path))
+
+        magic, manifest_size, manifest_mtime = self._read_index_header()
+        manifest_stat = os.stat(self.manifest_path)
+        self.assertEqual(magic, _Index._MAGIC)
+        self.assertEqual((manifest_size, manifest_mtime),
+            (manifest_stat.st_size, manifest_stat.st_mtime_ns))
+        self.assertEqual(os.path.getsize(self.index_path),
+            _Index._HEADER.size + 8 * self.IMAGE_COUNT)
+
+        manifest = self._open_manifest()
+        self.assertEqual(len(manifest), self.IMAGE_COUNT)
+        self.assertEqual(self._get_names(item for _, item in manifest),
+            self._make_names(range(self.IMAGE_COUNT)))
+
+    def test_legacy_index_is_upgraded(self):
+        for create_index in [True, False]:
+            with self.subTest(create_index=create_index):
+                os.remove(self.index_path)
+                with open(self.legacy_index_path, 'w') as legacy_index:
+                    json.dump({str(i): 0 for i in range(self.IMAGE_COUNT)}, legacy_index)
+
+                manifest = self._open_manifest(create_index=create_index)
+
+                self.assertTrue(os.path.exists(self.index_path))
+                self.assertFalse(os.path.exists(self.legacy_index_path))
+                self.assertEqual(self._get_names(manifest[:]),
+                    self._make_names(range(self.IMAGE_COUNT)))
+
+    def test_index_is_kept_in_memory_if_it_cannot_be_saved(self):
+        os.remove(self.index_path)
+        with open(self.legacy_index_path, 'w') as legacy_index:
+            json.dump({}, legacy_index)
+
+        with mock.patch.object(_Index, 'dump', side_effect=PermissionError):
+            manifest = self._open_manifest(create_index=False)
+
+            self.assertEqual(self._get_names(manifest[:]),
+                self._make_names(range(self.IMAGE_COUNT)))
+            self.assertFalse(os.path.exists(self.index_path))
+            self.assertTrue(os.path.exists(self.legacy_index_path))
+
+            # the index is required to be saved, if it is created by the manager
+            with self.assertRaises(PermissionError):
+                self._open_manifest(create_index=True)
+
+    def test_index_without_file_is_not_saved_if_not_requested(self):
+        os.remove(self.index_path)
+
+        manifest = self._open_manifest(create_index=False)
+
+        self.assertEqual(len(manifest), self.IMAGE_COUNT)
+        self.assertFalse(os.path.exists(self.index_path))
+
+    def test_can_detect_invalid_index_file(self):
+        with open(self.index_path, 'r+b') as index_file:
+            index_file.write(b'CVATIDX0')
+
+        with self.assertRaises(InvalidManifestError):
+            self._open_manifest()
+
+    def test_stale_index_is_rebuilt(self):
+        manifest = self._open_manifest()
+        self.assertEqual(len(manifest), self.IMAGE_COUNT)
+
+        # the manifest is recreated with other content
+        self._create_manifest(self.IMAGE_COUNT + 5)
+        os.remove(self.index_path)
+        stale_index = _Index(self.manifest_dir)
+        stale_index.create(self.manifest_path, skip=2)
+        stale_index._index = stale_index._index[:3]
+        stale_index._manifest_stat = (1, 1)
+        stale_index.dump()
+
+        new_manifest = self._open_manifest()
+        self.assertEqual(len(new_manifest), self.IMAGE_COUNT + 5)
+        self.assertEqual(self._read_index_header()[1], os.path.getsize(self.manifest_path))
+
+        # the opened manager rebuilds the index on iteration
+        self.assertEqual(self._get_names(item for _, item in manifest),
+            self._make_names(range(self.IMAGE_COUNT + 5)))
+
+    def test_index_is_rebuilt_after_manifest_modification(self):
+        manifest = self._open_manifest()
+
+        with open(self.manifest_path, 'a') as manifest_file:
+            manifest_file.write(json.dumps({'name': 'extra', 'extension': '.jpg'}) + '\n')
+
+        self.assertEqual(len(list(manifest)), self.IMAGE_COUNT + 1)
+        self.assertEqual(len(self._open_manifest()), self.IMAGE_COUNT + 1)
+
+        magic, manifest_size, _ = self._read_index_header()
+        self.assertEqual(magic, _Index._MAGIC)
+        self.assertEqual(manifest_size, os.path.getsize(self.manifest_path))
+
+    def test_item_access_does_not_check_manifest(self):
+        manifest = self._open_manifest()
+
+        with mock.patch.object(_Index, 'is_valid', wraps=manifest.index.is_valid) as is_valid:
+            names = [manifest[i]['name'] for i in range(self.IMAGE_COUNT)]
+            self.assertEqual(is_valid.call_count, 0)
+
+            self.assertEqual(self._get_names(item for _, item in manifest), names)
+            self.assertEqual(self._get_names(manifest[:]), names)
+            self.assertEqual(is_valid.call_count, 2)
+
+    def test_index_is_valid_after_partial_update(self):
+        manifest = self._open_manifest()
+
+        with open(self.manifest_path, 'a') as manifest_file:
+            manifest_file.write(json.dumps({'name': 'extra', 'extension': '.jpg'}) + '\n')
+        manifest.index.partial_update(self.manifest_path, self.IMAGE_COUNT - 1)
+        manifest.index.dump()
+
+        self.assertTrue(manifest.index.is_valid(self.manifest_path))
+        self.assertEqual(self._read_index_header()[1], os.path.getsize(self.manifest_path))
+        self.assertEqual(len(self._open_manifest()), self.IMAGE_COUNT + 1)
+
+class ManifestSliceTest(_ManifestTestBase):
+    # stepped, reversed, empty and out-of-range slices
+    SLICES = [
+        slice(None), slice(2, 8), slice(1, 9, 3), slice(None, None, 4), slice(-3, None),
+        slice(3, 100, 2), slice(None, None, -1), slice(8, 2, -2), slice(5, 5), slice(7, 3),
+        slice(100, None),
+    ]
+
+    def _assert_slices(self, manifest, names):
+        for item in self.SLICES:
+            with self.subTest(slice=item):
+                self.assertEqual(self._get_names(manifest[item]), names[item])
+
+        self.assertEqual([manifest[i]['name'] for i in range(len(names))], names)
+        self.assertEqual(self._get_names(item for _, item in manifest), names)
+
+    def test_can_read_slices(self):
+        manifest = self._open_manifest()
+
+        self._assert_slices(manifest, self._make_names(range(self.IMAGE_COUNT)))
+        with self.assertRaises(IndexError):
+            manifest[self.IMAGE_COUNT] # pylint: disable=pointless-statement
+
+    def test_can_read_slices_with_blank_lines_between_items(self):
+        with open(self.manifest_path) as manifest_file:
+            lines = manifest_file.readlines()
+        with open(self.manifest_path, 'w') as manifest_file:
+            manifest_file.writelines(lines[:2])
+            for line in lines[2:]:
+                manifest_file.write(line + '\n')
+
+        manifest = self._open_manifest()
+
+        self.assertEqual(len(manifest), self.IMAGE_COUNT)
+        self._assert_slices(manifest, self._make_names(range(self.IMAGE_COUNT)))
+
+    def test_can_read_replaced_manifest(self):
+        manifest = self._open_manifest()
+        self.assertEqual(manifest[0]['name'], self._make_names([0])[0])
+
+        # the manifest is replaced, while its previous file is open
+        with open(self.manifest_path) as manifest_file:
+            lines = manifest_file.readlines()
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            # the header, then the items in reverse order without the first one
+            manifest_file.writelines(lines[:2] + lines[2:][:0:-1])
+        os.replace(tmp_path, self.manifest_path)
+
+        self._assert_slices(manifest, self._make_names(range(self.IMAGE_COUNT - 1, 0, -1)))
@@ -0,0 +1,178 @@
+# Copyright (C) 2024 CVAT.ai Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import os
+import time
+from multiprocessing import shared_memory
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image
+
+from cvat.apps.engine import media_extractors
+from cvat.apps.engine.media_extractors import (IChunkWriter, VideoDatasetManifestReader,
+    ZipCompressedChunkWriter, _VideoDecodingSessions, chunk_encoding_pool)
+from utils.dataset_manifest import VideoManifestManager
+
+from .utils import generate_video_file
+
+class VideoDecodingSessionTest(SimpleTestCase):
+    FRAME_COUNT = 100
+    CHUNK_SIZE = 10
+
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+
+        # mpeg4 puts a key frame every 12 frames by default
+        _, video = generate_video_file('video.mp4', width=64, height=64, duration=4)
+        self.video_path = os.path.join(tmp_dir.name, video.name)
+        with open(self.video_path, 'wb') as f:
+            f.write(video.getvalue())
+
+        self.manifest_path = os.path.join(tmp_dir.name, 'manifest.jsonl')
+        manifest = VideoManifestManager(self.manifest_path)
+        manifest.link(media_file=video.name, upload_dir=tmp_dir.name, chunk_size=self.CHUNK_SIZE)
+        manifest.create()
+
+        _VideoDecodingSessions.clear()
+        self.addCleanup(_VideoDecodingSessions.clear)
+
+    def _read_chunk(self, chunk_number, *, step=1):
+        reader = VideoDatasetManifestReader(manifest_path=self.manifest_path,
+            source_path=self.video_path, chunk_number=chunk_number,
+            chunk_size=self.CHUNK_SIZE, start=0, stop=self.FRAME_COUNT - 1, step=step)
+        return [frame.to_ndarray(format='rgb24').tobytes() for frame in reader]
+
+    def _read_chunk_with_new_session(self, chunk_number, *, step=1):
+        _VideoDecodingSessions.clear()
+        return self._read_chunk(chunk_number, step=step)
+
+    def test_reused_session_reads_same_frames_as_new_session(self):
+        # sequential, repeated, in-GOP, backward and sparse reads
+        reads = [(0, 1), (1, 1), (2, 1), (2, 1), (5, 1), (3, 1), (0, 1), (1, 3), (2, 3), (0, 2)]
+
+        for buffer_size in [0, 15]:
+            with self.subTest(buffer_size=buffer_size), \
+                    self.settings(CVAT_VIDEO_DECODED_FRAMES_BUFFER_SIZE=buffer_size):
+                expected = [
+                    self._read_chunk_with_new_session(chunk_number, step=step)
+                    for chunk_number, step in reads
+                ]
+
+                _VideoDecodingSessions.clear()
+                for (chunk_number, step), expected_frames in zip(reads, expected):
+                    frames = self._read_chunk(chunk_number, step=step)
+                    self.assertEqual(len(frames), len(expected_frames))
+                    self.assertTrue(frames == expected_frames,
+                        msg=f'chunk {chunk_number}, step {step}')
+                    self.assertEqual(len(_VideoDecodingSessions._sessions), 1)
+
+    def test_can_reuse_session_after_incomplete_read(self):
+        expected = self._read_chunk_with_new_session(1)
+
+        reader = VideoDatasetManifestReader(manifest_path=self.manifest_path,
+            source_path=self.video_path, chunk_number=0,
+            chunk_size=self.CHUNK_SIZE, start=0, stop=self.FRAME_COUNT - 1)
+        frames = iter(reader)
+        next(frames)
+        frames.close()
+
+        self.assertTrue(self._read_chunk(1) == expected)
+
+    def test_idle_sessions_are_closed_without_other_reads(self):
+        with mock.patch.object(_VideoDecodingSessions, 'MAX_IDLE_TIME', 0.1):
+            self._read_chunk(0)
+            self.assertEqual(len(_VideoDecodingSessions._sessions), 1)
+
+            time.sleep(0.5)
+            self.assertEqual(len(_VideoDecodingSessions._sessions), 0)
+            self.assertIsNone(_VideoDecodingSessions._reaper)
+
+@skipUnless(os.path.isdir('/dev/shm'), 'requires /dev/shm')
+class ChunkEncodingPoolTest(SimpleTestCase):
+    QUALITY = 50
+    ORIENTATIONS = [1, 2, 3, 6, 8]
+
+    def setUp(self):
+        override = self.settings(CVAT_CHUNK_ENCODING_WORKERS=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.shm_blocks = self._get_shm_blocks()
+
+    @staticmethod
+    def _get_shm_blocks():
+        return {name for name in os.listdir('/dev/shm') if name.startswith('psm_')}
+
+    @staticmethod
+    def _encode_image(orientation=1, size=(32, 24)):
+        # a non-symmetric image, so that the transformations are visible
+        pixels = np.arange(size[0] * size[1] * 3, dtype=np.uint8).reshape(size[1], size[0], 3)
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format='JPEG', exif=exif)
+        buf.seek(0)
+        return buf
+
+    def _make_images(self):
+        images = [Image.open(self._encode_image(orientation)) for orientation in self.ORIENTATIONS]
+        images.append(Image.open(self._encode_image()).convert('P'))
+        images.append(self._encode_image(orientation=6))
+        return images
+
+    @staticmethod
+    def _decode(results):
+        decoded = []
+        for w, h, buf in results:
+            with Image.open(buf) as image:
+                decoded.append((w, h, image.size, image.tobytes()))
+        return decoded
+
+    def test_pool_results_match_in_process_compression(self):
+        expected = self._decode(
+            IChunkWriter._compress_image(image, self.QUALITY) for image in self._make_images())
+
+        with chunk_encoding_pool() as pool, \
+                mock.patch.object(media_extractors.shared_memory, 'SharedMemory',
+                    wraps=shared_memory.SharedMemory) as shm_spy:
+            self.assertIsNotNone(pool)
+            writer = ZipCompressedChunkWriter(self.QUALITY, encoding_pool=pool)
+            results = self._decode(writer._compress_images(self._make_images(), self.QUALITY))
+
+        self.assertEqual(shm_spy.call_count, len(self.ORIENTATIONS))
+        self.assertEqual([r[:3] for r in results], [r[:3] for r in expected])
+        self.assertTrue(results == expected)
+        self.assertEqual(self._get_shm_blocks(), self.shm_blocks)
+
+    def test_shared_memory_is_released_after_failed_chunk(self):
+        def _generate_images():
+            yield from self._make_images()
+            raise RuntimeError('failed to read the image')
+
+        for images in [
+            _generate_images(),
+            # the worker fails to decode the image
+            self._make_images() + [io.BytesIO(b'not an image')] + self._make_images(),
+        ]:
+            with chunk_encoding_pool() as pool:
+                writer = ZipCompressedChunkWriter(self.QUALITY, encoding_pool=pool)
+                with self.assertRaises(Exception):
+                    list(writer._compress_images(images, self.QUALITY))
+
+            self.assertEqual(self._get_shm_blocks(), self.shm_blocks)
+
+    def test_shared_memory_is_released_after_abandoned_chunk(self):
+        with chunk_encoding_pool() as pool:
+            writer = ZipCompressedChunkWriter(self.QUALITY, encoding_pool=pool)
+            results = writer._compress_images(self._make_images() * 3, self.QUALITY)
+            next(results)
+            results.close()
+
+            self.assertEqual(self._get_shm_blocks(), self.shm_blocks)
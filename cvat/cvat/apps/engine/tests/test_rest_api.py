@@ -28,6 +28,7 @@ from pdf2image import convert_from_bytes
 from django.conf import settings
 from django.contrib.auth.models import Group, User
 from django.http import HttpResponse
+from django.test import override_settings
 from PIL import Image
 from pycocotools import coco as coco_loader
 from rest_framework import status
@@ -4583,6 +4584,36 @@ class TaskDataAPITestCase(ApiTestBase):
     def test_api_v2_tasks_id_data_user(self):
         self._test_api_v2_tasks_id_data_create(self.user)
 
+    @override_settings(CVAT_CONCURRENT_CHUNK_PROCESSING=1, CVAT_CHUNK_DECODED_IMAGES_LIMIT=1)
+    def test_api_v2_tasks_id_data_create_with_small_decoded_images_limit(self):
+        # Each image exceeds the limit, so the chunk writers sharing the decoded images
+        # can only make progress together, with the minimal number of chunk threads
+        task_spec = {
+            "name": "decoded images limit",
+            "overlap": 0,
+            "segment_size": 0,
+            "labels": [
+                {"name": "car"},
+            ]
+        }
+
+        task_data = {
+            "server_files[0]": "test_1.jpg",
+            "server_files[1]": "test_2.jpg",
+            "server_files[2]": "test_3.jpg",
+            "image_quality": 75,
+            "chunk_size": 2,
+        }
+        image_sizes = [
+            self._share_image_sizes[task_data["server_files[0]"]],
+            self._share_image_sizes[task_data["server_files[1]"]],
+            self._share_image_sizes[task_data["server_files[2]"]],
+        ]
+
+        self._test_api_v2_tasks_id_data_spec(self.admin, task_spec, task_data,
+            self.ChunkType.IMAGESET, self.ChunkType.IMAGESET, image_sizes,
+            expected_uploaded_data_location=StorageChoice.SHARE)
+
     def test_api_v2_tasks_id_data_no_auth(self):
         data = {
             "name": "my task #3",
@@ -0,0 +1,123 @@
+# Copyright (C) 2024 CVAT.ai Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import threading
+import time
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from cvat.apps.engine.utils import tee_preload_images
+
+IMAGE_SIZE = (10, 10)
+IMAGE_BYTES = IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3
+
+class TeePreloadImagesTest(SimpleTestCase):
+    def setUp(self):
+        self.read_images = []
+
+    def _generate_images(self, count, *, error_at=None):
+        for idx in range(count):
+            if idx == error_at:
+                raise RuntimeError('failed to read the image')
+
+            image = io.BytesIO()
+            Image.new('RGB', IMAGE_SIZE, color=(idx, 0, 0)).save(image, 'PNG')
+            image.seek(0)
+            self.read_images.append(idx)
+            yield image, f'image_{idx}.png', idx
+
+    @staticmethod
+    def _consume(images, results, *, delay=0):
+        try:
+            for image, path, frame in images:
+                results.append((image.getpixel((0, 0))[0], path, frame))
+                time.sleep(delay)
+        except Exception as ex:
+            results.append(ex)
+        finally:
+            images.close()
+
+    def _consume_in_threads(self, iterators, delays):
+        results = [[] for _ in iterators]
+        threads = [
+            threading.Thread(target=self._consume, args=(images, consumer_results),
+                kwargs={'delay': delay}, daemon=True)
+            for images, consumer_results, delay in zip(iterators, results, delays)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive(), 'the consumer has hung')
+        return results
+
+    def test_consumers_receive_images_in_order(self):
+        count = 20
+        iterators = tee_preload_images(self._generate_images(count), 2,
+            max_bytes=3 * IMAGE_BYTES)
+
+        results = self._consume_in_threads(iterators, delays=[0, 0.005])
+
+        expected = [(idx, f'image_{idx}.png', idx) for idx in range(count)]
+        self.assertEqual(results, [expected, expected])
+        self.assertEqual(self.read_images, list(range(count)))
+
+    def test_decoded_images_are_limited(self):
+        count = 10
+        fast_images, slow_images = tee_preload_images(self._generate_images(count), 2,
+            max_bytes=2 * IMAGE_BYTES)
+
+        fast_results = []
+        fast_consumer = threading.Thread(target=self._consume, args=(fast_images, fast_results),
+            daemon=True)
+        fast_consumer.start()
+        fast_consumer.join(timeout=0.5)
+
+        # the fast consumer waits for the other one to receive the buffered images
+        self.assertTrue(fast_consumer.is_alive())
+        self.assertEqual(len(self.read_images), 2)
+        self.assertEqual(len(fast_results), 2)
+
+        slow_results = []
+        self._consume(slow_images, slow_results)
+        fast_consumer.join(timeout=10)
+        self.assertFalse(fast_consumer.is_alive())
+
+        self.assertEqual(fast_results, slow_results)
+        self.assertEqual(len(slow_results), count)
+        self.assertEqual(fast_images._images._buffer_size, 0)
+
+    def test_image_exceeding_limit_is_decoded(self):
+        iterators = tee_preload_images(self._generate_images(3), 2, max_bytes=1)
+
+        results = self._consume_in_threads(iterators, delays=[0, 0])
+
+        self.assertEqual([len(r) for r in results], [3, 3])
+
+    def test_source_error_is_raised_in_all_consumers(self):
+        for delays in [(0, 0), (0, 0.01), (0.01, 0)]:
+            with self.subTest(delays=delays):
+                self.read_images.clear()
+                iterators = tee_preload_images(self._generate_images(10, error_at=3), 2,
+                    max_bytes=2 * IMAGE_BYTES)
+
+                results = self._consume_in_threads(iterators, delays=delays)
+
+                for consumer_results in results:
+                    self.assertEqual([item[0] for item in consumer_results[:-1]], [0, 1, 2])
+                    self.assertIsInstance(consumer_results[-1], RuntimeError)
+
+    def test_closed_consumer_does_not_block_others(self):
+        count = 10
+        closed_images, images = tee_preload_images(self._generate_images(count), 2,
+            max_bytes=IMAGE_BYTES)
+
+        next(closed_images)
+        closed_images.close()
+
+        results = []
+        self._consume(images, results)
+        self.assertEqual([item[0] for item in results], list(range(count)))
@@ -4,13 +4,15 @@
 
 import ast
 import cv2 as cv
-from collections import namedtuple
+from collections import deque, namedtuple
 import hashlib
 import importlib
+import itertools
 import sys
+import threading
 import traceback
 from contextlib import suppress, nullcontext
-from typing import Any, Dict, Optional, Callable, Union, Iterable
+from typing import Any, Dict, Optional, Callable, Union, Iterable, Iterator
 import subprocess
 import os
 import urllib.parse
@@ -410,6 +412,132 @@ def preload_image(image: tuple[str, str, str])-> tuple[Image.Image, str, str]:
 def preload_images(images: Iterable[tuple[str, str, str]]) -> list[tuple[Image.Image, str, str]]:
     return list(map(preload_image, images))
 
+class _SharedPreloadedImages:
+    """
+    Decodes the images once for several consumers reading them in parallel threads.
+    A decoded image is released as soon as all the consumers have received it,
+    the decoding waits while the decoded images take more than max_bytes.
+    """
+
+    def __init__(self, images: Iterable[tuple[str, str, str]], consumers: int, max_bytes: int):
+        self._source = iter(images)
+        self._consumers = consumers
+        self._max_bytes = max_bytes
+        self._condition = threading.Condition()
+
+        # [item, number of consumers yet to receive it, size]
+        self._buffer = deque()
+        self._buffer_offset = 0 # index of the first buffered image
+        self._buffer_size = 0
+        self._is_decoding = False
+        self._is_exhausted = False
+        self._error = None
+
+    def _release_received(self):
+        while self._buffer and self._buffer[0][1] <= 0:
+            self._buffer_size -= self._buffer.popleft()[2]
+            self._buffer_offset += 1
+        self._condition.notify_all()
+
+    def _can_decode(self) -> bool:
+        # a single image can exceed the limit
+        return not self._is_decoding and (not self._buffer or self._buffer_size < self._max_bytes)
+
+    def get(self, index: int) -> tuple[Image.Image, str, str]:
+        with self._condition:
+            while True:
+                if index < self._buffer_offset + len(self._buffer):
+                    entry = self._buffer[index - self._buffer_offset]
+                    entry[1] -= 1
+                    self._release_received()
+                    return entry[0]
+
+                # the images decoded before the error are still received by all the consumers
+                if self._error is not None:
+                    raise self._error
+
+                if self._is_exhausted:
+                    raise StopIteration
+
+                if self._can_decode():
+                    self._is_decoding = True
+                    break
+
+                self._condition.wait()
+
+        # decode outside of the lock, the other consumers can read the buffered images meanwhile
+        try:
+            item = next(self._source, None)
+            if item is not None:
+                item = preload_image(item)
+        except Exception as ex:
+            with self._condition:
+                self._is_decoding = False
+                self._error = ex
+                self._condition.notify_all()
+            raise
+
+        with self._condition:
+            self._is_decoding = False
+            if item is None:
+                self._is_exhausted = True
+                self._condition.notify_all()
+                raise StopIteration
+
+            image = item[0]
+            size = image.width * image.height * len(image.getbands())
+            self._buffer.append([item, self._consumers - 1, size])
+            self._buffer_size += size
+            self._release_received()
+            return item
+
+    def detach(self, index: int):
+        with self._condition:
+            for entry in itertools.islice(self._buffer, max(index - self._buffer_offset, 0), None):
+                entry[1] -= 1
+            self._consumers -= 1
+            self._release_received()
+
+class PreloadedImagesIterator(Iterator[tuple[Image.Image, str, str]]):
+    """
+    One of the iterators returned by tee_preload_images(). It must be closed
+    if it is not exhausted, otherwise the other iterators can wait for it forever.
+    """
+
+    def __init__(self, images: _SharedPreloadedImages):
+        self._images = images
+        self._index = 0
+        self._is_closed = False
+
+    def __next__(self) -> tuple[Image.Image, str, str]:
+        if self._is_closed:
+            raise StopIteration
+
+        try:
+            item = self._images.get(self._index)
+        except StopIteration:
+            self.close()
+            raise
+
+        self._index += 1
+        return item
+
+    def close(self):
+        if not self._is_closed:
+            self._is_closed = True
+            self._images.detach(self._index)
+
+def tee_preload_images(
+    images: Iterable[tuple[str, str, str]], n: int = 2, *, max_bytes: int
+) -> tuple[PreloadedImagesIterator, ...]:
+    """
+    Returns n iterators over the lazily preloaded images, like itertools.tee().
+    The decoded images are shared by the iterators and at most max_bytes
+    of them are kept until all the iterators have received them.
+    """
+    shared_images = _SharedPreloadedImages(images, consumers=n, max_bytes=max_bytes)
+    return tuple(PreloadedImagesIterator(shared_images) for _ in range(n))
+
 def build_backup_file_name(
     *,
     class_name: str,
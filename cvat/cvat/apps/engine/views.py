@@ -85,7 +85,7 @@ from cvat.apps.iam.permissions import (CloudStoragePermission,
     CommentPermission, IssuePermission, JobPermission, LabelPermission, ProjectPermission,
     TaskPermission, UserPermission, PolicyEnforcer, IsAuthenticatedOrReadPublicResource)
 from cvat.apps.iam.filters import ORGANIZATION_OPEN_API_PARAMETERS
-from cvat.apps.engine.cache import MediaCache
+from cvat.apps.engine.cache import MediaCache, prewarm_task_chunks
 from cvat.apps.engine.view_utils import tus_chunk_action
 
 slogger = ServerLogManager(__name__)
@@ -656,6 +656,13 @@ class DataChunkGetter:
                 # TODO: av.FFmpegError processing
                 if settings.USE_CACHE and db_data.storage_method == StorageMethodChoice.CACHE:
                     buff, mime_type = frame_provider.get_chunk(self.number, self.quality)
+                    # the next chunks are likely to be requested soon
+                    try:
+                        prewarm_task_chunks(db_data, self.dimension,
+                            self.number + 1, stop_chunk, quality=self.quality)
+                    except Exception as ex:
+                        slogger.glob.warning(
+                            f'Failed to schedule chunk prewarm for data #{db_data.id}: {ex}')
                     return HttpResponse(buff.getvalue(), content_type=mime_type)
 
                 # Follow symbol links if the chunk is a link on a real image otherwise
@@ -2523,8 +2530,8 @@ class CloudStorageViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
                         datetime.fromtimestamp(os.path.getmtime(full_manifest_path), tz=timezone.utc) < storage.get_file_last_modified(manifest_path):
                     storage.download_file(manifest_path, full_manifest_path)
                 manifest = ImageManifestManager(full_manifest_path, db_storage.get_storage_dirname())
-                # need to update index
-                manifest.set_index()
+                # the index is rebuilt if the manifest has been updated
+                manifest.init_index()
                 try:
                     start_index = int(next_token or '0')
                 except ValueError:
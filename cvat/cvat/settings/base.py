@@ -279,6 +279,7 @@ class CVAT_QUEUES(Enum):
     QUALITY_REPORTS = 'quality_reports'
     ANALYTICS_REPORTS = 'analytics_reports'
     CLEANING = 'cleaning'
+    CHUNKS = 'chunks'
 
 redis_inmem_host = os.getenv('CVAT_REDIS_INMEM_HOST', 'localhost')
 redis_inmem_port = os.getenv('CVAT_REDIS_INMEM_PORT', 6379)
@@ -324,6 +325,10 @@ RQ_QUEUES = {
         **shared_queue_settings,
         'DEFAULT_TIMEOUT': '1h',
     },
+    CVAT_QUEUES.CHUNKS.value: {
+        **shared_queue_settings,
+        'DEFAULT_TIMEOUT': '1h',
+    },
 }
 
 NUCLIO = {
@@ -541,6 +546,33 @@ CACHES = {
 
 USE_CACHE = True
 
+# Cache single frames of image chunks separately, so a frame request reads only the frame.
+# The frames are also kept inside their chunks, so this doubles the cache usage for image tasks
+MEDIA_CACHE_SINGLE_FRAMES = to_bool(os.getenv('CVAT_MEDIA_CACHE_SINGLE_FRAMES', False))
+
+# Time (in seconds) a process can hold the lock for preparing a media cache item
+MEDIA_CACHE_LOCK_TIMEOUT = int(os.getenv('CVAT_MEDIA_CACHE_LOCK_TIMEOUT', 10 * 60))
+
+# Time (in seconds) to wait for another process preparing the same media cache item
+MEDIA_CACHE_LOCK_WAIT_TIMEOUT = int(os.getenv('CVAT_MEDIA_CACHE_LOCK_WAIT_TIMEOUT', 60))
+
+# Size (in bytes) of the in-process cache in front of the media cache, 0 disables it
+MEDIA_CACHE_LOCAL_SIZE = int(os.getenv('CVAT_MEDIA_CACHE_LOCAL_SIZE', 0))
+
+# Time (in seconds) an item is kept in the in-process cache, at most the media cache timeout.
+# Some items, e.g. cloud storage previews, can change while they are cached.
+MEDIA_CACHE_LOCAL_TTL = int(os.getenv('CVAT_MEDIA_CACHE_LOCAL_TTL', 10 * 60))
+
+# Default number of chunks prepared in advance at the beginning of each job after task creation
+# and after each requested chunk, 0 disables prewarming. Can be overridden for each task.
+MEDIA_CACHE_PREWARM_CHUNKS = int(os.getenv('CVAT_MEDIA_CACHE_PREWARM_CHUNKS', 2))
+
+# Chunks are not prewarmed when the used part of the media cache storage is greater than this value
+MEDIA_CACHE_PREWARM_MAX_USAGE = float(os.getenv('CVAT_MEDIA_CACHE_PREWARM_MAX_USAGE', 0.8))
+
+# Time (in seconds) a prewarm request can wait in the queue
+MEDIA_CACHE_PREWARM_QUEUE_TTL = int(os.getenv('CVAT_MEDIA_CACHE_PREWARM_QUEUE_TTL', 10 * 60))
+
 CORS_ALLOW_HEADERS = list(default_headers) + [
     # tus upload protocol headers
     'upload-offset',
@@ -710,5 +742,16 @@ ONE_RUNNING_JOB_IN_QUEUE_PER_USER = to_bool(os.getenv('ONE_RUNNING_JOB_IN_QUEUE_
 # How many chunks can be prepared simultaneously during task creation in case the cache is not used
 CVAT_CONCURRENT_CHUNK_PROCESSING = int(os.getenv('CVAT_CONCURRENT_CHUNK_PROCESSING', 1))
 
+# How many processes compress chunk images during task creation,
+# 0 means the images are compressed in the calling thread
+CVAT_CHUNK_ENCODING_WORKERS = int(os.getenv('CVAT_CHUNK_ENCODING_WORKERS', 0))
+
+# How much memory (in bytes) the decoded images of a chunk can take while the chunk is written
+CVAT_CHUNK_DECODED_IMAGES_LIMIT = int(os.getenv('CVAT_CHUNK_DECODED_IMAGES_LIMIT', 512 * 1024 * 1024))
+
+# How many last decoded video frames are kept to prepare chunks with the same frames again
+# (e.g. in the other quality), 0 disables it
+CVAT_VIDEO_DECODED_FRAMES_BUFFER_SIZE = int(os.getenv('CVAT_VIDEO_DECODED_FRAMES_BUFFER_SIZE', 0))
+
 from cvat.rq_patching import update_started_job_registry_cleanup
 update_started_job_registry_cleanup()
@@ -92,3 +92,6 @@ class PatchedDiscoverRunner(DiscoverRunner):
 # No need to profile unit tests
 INSTALLED_APPS.remove('silk')
 MIDDLEWARE.remove('silk.middleware.SilkyMiddleware')
+
+# Chunks are prepared synchronously in unit tests, only when requested
+MEDIA_CACHE_PREWARM_CHUNKS = 0
@@ -3,14 +3,17 @@
 #
 # SPDX-License-Identifier: MIT
 
+from array import array
 from enum import Enum
 from io import StringIO
 import av
 import json
+import mmap
 import os
+import struct
 
 from abc import ABC, abstractmethod, abstractproperty, abstractstaticmethod
-from contextlib import closing
+from contextlib import closing, suppress
 from PIL import Image
 from json.decoder import JSONDecodeError
 from io import BytesIO
@@ -258,55 +261,100 @@ class _Manifest:
 # Needed for faster iteration over the manifest file, will be generated to work inside CVAT
 # and will not be generated when manually creating a manifest
 class _Index:
-    FILE_NAME = 'index.json'
+    # A flat array of uint64 line offsets after a fixed-size header,
+    # the file is memory-mapped, so loading does not depend on the manifest size
+    FILE_NAME = 'index.bin'
+    # A JSON object of line offsets, used before. Replaced with the new index on first use.
+    LEGACY_FILE_NAME = 'index.json'
+
+    _MAGIC = b'CVATIDX1'
+    # magic, manifest size, manifest modification time (ns)
+    _HEADER = struct.Struct('<8sQq')
 
     def __init__(self, path):
         assert path and os.path.isdir(path), 'No index directory path'
         self._path = os.path.join(path, self.FILE_NAME)
-        self._index = {}
+        self._legacy_path = os.path.join(path, self.LEGACY_FILE_NAME)
+        self._index = array('Q')
+        self._manifest_stat = (0, 0)
 
     @property
     def path(self):
         return self._path
 
+    @property
+    def exists(self):
+        return os.path.exists(self._path)
+
+    @property
+    def legacy_exists(self):
+        return os.path.exists(self._legacy_path)
+
+    def is_valid(self, manifest):
+        """ Checks that the index has been built for the current manifest file """
+        manifest_stat = os.stat(manifest)
+        return self._manifest_stat == (manifest_stat.st_size, manifest_stat.st_mtime_ns)
+
     def dump(self):
-        with open(self._path, 'w') as index_file:
-            json.dump(self._index, index_file,  separators=(',', ':'))
+        tmp_path = f'{self._path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as index_file:
+            index_file.write(self._HEADER.pack(self._MAGIC, *self._manifest_stat))
+            index_file.write(self._index)
+        os.replace(tmp_path, self._path)
+
+        with suppress(FileNotFoundError):
+            os.remove(self._legacy_path)
 
     def load(self):
-        with open(self._path, 'r') as index_file:
-            self._index = json.load(index_file,
-                object_hook=lambda d: {int(k): v for k, v in d.items()})
+        with open(self._path, 'rb') as index_file:
+            buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, manifest_size, manifest_mtime = self._HEADER.unpack_from(buffer)
+        if magic != self._MAGIC:
+            raise InvalidManifestError(f"Invalid manifest index file '{self._path}'")
+
+        self._manifest_stat = (manifest_size, manifest_mtime)
+        self._index = memoryview(buffer)[self._HEADER.size:].cast('Q')
 
     def remove(self):
-        os.remove(self._path)
+        for path in (self._path, self._legacy_path):
+            if os.path.exists(path):
+                os.remove(path)
 
     def create(self, manifest, *, skip):
         assert os.path.exists(manifest), 'A manifest file not exists, index cannot be created'
-        with open(manifest, 'r+') as manifest_file:
+        index = array('Q')
+        with open(manifest, 'rb') as manifest_file:
+            manifest_stat = os.fstat(manifest_file.fileno())
             while skip:
                 manifest_file.readline()
                 skip -= 1
-            image_number = 0
             position = manifest_file.tell()
-            line = manifest_file.readline()
-            while line:
+            for line in manifest_file:
                 if line.strip():
-                    self._index[image_number] = position
-                    image_number += 1
-                    position = manifest_file.tell()
-                line = manifest_file.readline()
+                    index.append(position)
+                position += len(line)
+        self._index = index
+        self._manifest_stat = (manifest_stat.st_size, manifest_stat.st_mtime_ns)
 
     def partial_update(self, manifest, number):
         assert os.path.exists(manifest), 'A manifest file not exists, index cannot be updated'
+        if not isinstance(self._index, array):
+            self._index = array('Q', self._index)
         with open(manifest, 'r+') as manifest_file:
             manifest_file.seek(self._index[number])
             line = manifest_file.readline()
             while line:
                 if line.strip():
-                    self._index[number] = manifest_file.tell()
+                    if number < len(self._index):
+                        self._index[number] = manifest_file.tell()
+                    else:
+                        self._index.append(manifest_file.tell())
                     number += 1
                 line = manifest_file.readline()
+            manifest_stat = os.fstat(manifest_file.fileno())
+        # the index is valid for the updated manifest, and is dumped with its stat
+        self._manifest_stat = (manifest_stat.st_size, manifest_stat.st_mtime_ns)
 
     def __getitem__(self, number):
         if not 0 <= number < len(self):
@@ -331,44 +379,84 @@ class _ManifestManager(ABC):
                     f"'{item}' is required, but not found"
                 )
 
+    # The number of lines read at once during iteration
+    _ITER_BATCH_SIZE = 1024
+
     def __init__(self, path, create_index, upload_dir=None):
         self._manifest = _Manifest(path, upload_dir)
         self._index = _Index(os.path.dirname(self._manifest.path))
         self._reader = None
         self._create_index = create_index
+        self._manifest_fd = None
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """ Closes the manifest file, it is reopened on the next access """
+        if getattr(self, '_manifest_fd', None) is not None:
+            os.close(self._manifest_fd)
+            self._manifest_fd = None
 
     @property
     def reader(self):
         return self._reader
 
+    def _get_manifest_fd(self):
+        if self._manifest_fd is None:
+            self._manifest_fd = os.open(self._manifest.path, os.O_RDONLY)
+        return self._manifest_fd
+
+    def _read_lines(self, start, stop, step=1):
+        """ Reads the item lines in the [start, stop) range at once """
+        fd = self._get_manifest_fd()
+        begin = self._index[start]
+        end = self._index[stop] if stop < len(self._index) else os.fstat(fd).st_size
+        data = os.pread(fd, end - begin, begin)
+        for number in range(start, stop, step):
+            line_end = self._index[number + 1] - begin if number + 1 < stop else len(data)
+            yield data[self._index[number] - begin:line_end]
+
+    def _parse_item(self, line):
+        parsed_properties = ImageProperties(json.loads(line))
+        self._json_item_is_valid(**parsed_properties)
+        return parsed_properties
+
     def _parse_line(self, line):
         """ Getting a random line from the manifest file """
-        with open(self._manifest.path, 'r') as manifest_file:
-            if isinstance(line, str):
-                assert line in self.BASE_INFORMATION.keys(), \
-                    'An attempt to get non-existent information from the manifest'
+        if isinstance(line, str):
+            assert line in self.BASE_INFORMATION.keys(), \
+                'An attempt to get non-existent information from the manifest'
+            with open(self._manifest.path, 'r') as manifest_file:
                 for _ in range(self.BASE_INFORMATION[line]):
                     fline = manifest_file.readline()
                 return json.loads(fline)[line]
-            else:
-                assert self._index, 'No prepared index'
-                offset = self._index[line]
-                manifest_file.seek(offset)
-                properties = manifest_file.readline()
-                parsed_properties = ImageProperties(json.loads(properties))
-                self._json_item_is_valid(**parsed_properties)
-                return parsed_properties
+        else:
+            assert self._index, 'No prepared index'
+            return self._parse_item(next(self._read_lines(line, line + 1)))
 
     def init_index(self):
-        if os.path.exists(self._index.path):
+        # the manifest file could have been replaced
+        self.close()
+
+        if self._index.exists:
             self._index.load()
-        else:
-            self._index.create(self._manifest.path, skip=self._manifest.get_header_lines_count())
-            if self._create_index:
+            if self._index.is_valid(self._manifest.path):
+                return
+
+        update_index_file = self._create_index or self._index.exists or self._index.legacy_exists
+        self._index.create(self._manifest.path, skip=self._manifest.get_header_lines_count())
+        if update_index_file:
+            try:
                 self._index.dump()
+            except OSError:
+                if self._create_index:
+                    raise
+                # an existing index in a read-only directory, keep it in memory
 
     def reset_index(self):
-        if self._create_index and os.path.exists(self._index.path):
+        self.close()
+        if self._create_index:
             self._index.remove()
 
     def set_index(self):
@@ -388,17 +476,19 @@ class _ManifestManager(ABC):
     def partial_update(self, number, properties):
         ...
 
+    def _validate_index(self):
+        # the index is only rebuilt if the manifest has changed,
+        # the reopened file descriptor points to the current manifest file
+        if not self._index.is_valid(self._manifest.path):
+            self.init_index()
+
     def __iter__(self):
-        self.set_index()
+        self._validate_index()
 
-        with open(self._manifest.path, 'r') as manifest_file:
-            manifest_file.seek(self._index[0])
-            for idx, line_start in enumerate(self._index):
-                manifest_file.seek(line_start)
-                line = manifest_file.readline()
-                item = ImageProperties(json.loads(line))
-                self._json_item_is_valid(**item)
-                yield (idx, item)
+        for start in range(0, len(self._index), self._ITER_BATCH_SIZE):
+            stop = min(start + self._ITER_BATCH_SIZE, len(self._index))
+            for idx, line in enumerate(self._read_lines(start, stop), start=start):
+                yield (idx, self._parse_item(line))
 
     @property
     def manifest(self):
@@ -411,8 +501,19 @@ class _ManifestManager(ABC):
             return None
 
     def __getitem__(self, item):
+        if isinstance(item, str):
+            return self._parse_line(item)
+
         if isinstance(item, slice):
-            return [self._parse_line(i) for i in range(item.start or 0, item.stop or len(self), item.step or 1)]
+            # the manifest is checked once per slice, as in __iter__,
+            # single items are read with the current index
+            self._validate_index()
+            start, stop, step = item.indices(len(self))
+            if step < 0:
+                return [self._parse_line(i) for i in range(start, stop, step)]
+            elif stop <= start:
+                return []
+            return [self._parse_item(line) for line in self._read_lines(start, stop, step)]
         return self._parse_line(item)
 
     @property